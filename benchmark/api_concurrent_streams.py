@@ -0,0 +1,85 @@
+"""
+Measure how the OpenAI API server scales with concurrent streams.
+
+Opens --num-streams streaming /v1/chat/completions requests at once and
+reports the wall time, the time to first chunk and the aggregate chunk
+rate. If the server serves streams concurrently, the wall time stays close
+to the duration of a single stream as --num-streams grows.
+
+To compare two versions of the server, run each against the same controller
+and worker on its own port. Put a delaying proxy in front of the controller
+to see how the server copes with slow worker lookups.
+
+Usage:
+python3 benchmark/api_concurrent_streams.py --api-address http://localhost:8000 --model yeongjopt-mistral-7b --num-streams 1,8,32
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+async def one_stream(client, args):
+    start = time.time()
+    first_chunk = None
+    num_chunks = 0
+    async with client.stream(
+        "POST",
+        args.api_address + "/v1/chat/completions",
+        json={
+            "model": args.model,
+            "messages": [{"role": "user", "content": args.prompt}],
+            "max_tokens": args.max_tokens,
+            "stream": True,
+        },
+    ) as response:
+        if response.status_code != 200:
+            return None, 0
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            if first_chunk is None:
+                first_chunk = time.time() - start
+            num_chunks += 1
+    return first_chunk, num_chunks
+
+
+async def run(args, num_streams):
+    limits = httpx.Limits(max_connections=num_streams)
+    async with httpx.AsyncClient(limits=limits, timeout=600) as client:
+        start = time.time()
+        results = await asyncio.gather(
+            *[one_stream(client, args) for _ in range(num_streams)]
+        )
+        wall_time = time.time() - start
+
+    ttfts = sorted(r[0] for r in results if r[0] is not None)
+    num_chunks = sum(r[1] for r in results)
+    if not ttfts:
+        print(f"streams: {num_streams:4d} | all failed")
+        return
+    print(
+        f"streams: {num_streams:4d} | wall time: {wall_time:7.2f} s | "
+        f"median first chunk: {ttfts[len(ttfts) // 2]:6.2f} s | "
+        f"max first chunk: {ttfts[-1]:6.2f} s | "
+        f"chunks/s: {num_chunks / wall_time:8.1f} | "
+        f"failed: {num_streams - len(ttfts)}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--api-address", type=str, default="http://localhost:8000")
+    parser.add_argument("--model", type=str, required=True)
+    parser.add_argument("--prompt", type=str, default="Tell me a story.")
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument(
+        "--num-streams",
+        type=lambda s: [int(x) for x in s.split(",")],
+        default=[1, 8, 32],
+    )
+    args = parser.parse_args()
+
+    for num_streams in args.num_streams:
+        asyncio.run(run(args, num_streams))
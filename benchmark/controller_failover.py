@@ -0,0 +1,226 @@
+"""
+Kill and restart a controller replica under routing load and count failed routes.
+
+Starts two controller replicas sharing one SQLite registry and two stub
+workers that register with the first replica:
+- a live worker that sends heartbeats, failing over across the replicas and
+  re-registering when a replica does not know it, like a model worker;
+- a hung worker that answers status requests but never sends a heartbeat,
+  so the controllers must expire it.
+
+A client round-robins /get_worker_address across the replicas the way a
+health-checked load balancer would (on connection error it moves to the
+next replica). A third of the way through, the first replica is killed.
+Two thirds of the way through, it is restarted on the same registry.
+
+A route fails if it returns no worker, or if it returns the hung worker
+after it should have expired (twice the expiration, plus a sync interval).
+The heartbeat expiration is shortened with
+FASTCHAT_CONTROLLER_HEART_BEAT_EXPIRATION so that the run covers it.
+
+Usage:
+python3 benchmark/controller_failover.py --duration 30 --expiration 3
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+
+MODEL_NAME = "failover-test-model"
+
+
+class StubWorkerHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.dumps(
+            {"model_names": [MODEL_NAME], "speed": 1, "queue_length": 0}
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_worker(port):
+    server = ThreadingHTTPServer(("localhost", port), StubWorkerHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://localhost:{port}"
+
+
+def start_controller(port, state_file, expiration):
+    env = dict(os.environ, FASTCHAT_CONTROLLER_HEART_BEAT_EXPIRATION=str(expiration))
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "fastchat.serve.controller",
+            "--port",
+            str(port),
+            "--state-backend",
+            "sqlite",
+            "--state-file",
+            state_file,
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=env,
+    )
+
+
+def wait_ready(address, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(address + "/test_connection", timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"Controller at {address} did not start.")
+
+
+def post_with_failover(replicas, start_index, path, payload):
+    """POST to the first replica that answers. Returns (replica, JSON) or (None, None)."""
+    for i in range(len(replicas)):
+        address = replicas[(start_index + i) % len(replicas)]
+        try:
+            ret = requests.post(address + path, json=payload, timeout=2)
+            return address, ret.json()
+        except requests.exceptions.RequestException:
+            continue
+    return None, None
+
+
+def register(replicas, worker_address):
+    return post_with_failover(
+        replicas,
+        0,
+        "/register_worker",
+        {
+            "worker_name": worker_address,
+            "check_heart_beat": True,
+            "worker_status": None,
+        },
+    )
+
+
+def send_heart_beats(replicas, worker_address, interval, stop):
+    """Heartbeat like a model worker: re-register if the replica does not know it."""
+    i = 0
+    while not stop.wait(interval):
+        _, ret = post_with_failover(
+            replicas,
+            i,
+            "/receive_heart_beat",
+            {"worker_name": worker_address, "queue_length": 0},
+        )
+        if ret is not None and not ret.get("exist"):
+            register(replicas, worker_address)
+        i += 1
+
+
+def main(args):
+    state_file = os.path.join(tempfile.mkdtemp(), "controller_state.db")
+    ports = [args.port, args.port + 1]
+    replicas = [f"http://localhost:{port}" for port in ports]
+    procs = [start_controller(port, state_file, args.expiration) for port in ports]
+
+    live_server, live_address = start_stub_worker(args.worker_port)
+    hung_server, hung_address = start_stub_worker(args.worker_port + 1)
+    stop = threading.Event()
+
+    try:
+        for address in replicas:
+            wait_ready(address)
+        register(replicas, live_address)
+        register(replicas, hung_address)
+        registered = time.time()
+        threading.Thread(
+            target=send_heart_beats,
+            args=(replicas, live_address, args.expiration / 3, stop),
+            daemon=True,
+        ).start()
+        # The sweep runs every expiration seconds and removes workers whose
+        # last heartbeat is older than that.
+        expiry_deadline = registered + 2 * args.expiration + 1
+
+        total, failed = 0, 0
+        hung_routes, last_hung_route = 0, None
+        restarted_routes = 0
+        killed = restarted = False
+        start = time.time()
+        while time.time() - start < args.duration:
+            elapsed = time.time() - start
+            if not killed and elapsed > args.duration / 3:
+                procs[0].kill()
+                procs[0].wait()
+                killed = True
+                print(f"Killed replica {replicas[0]} after {total} routes.")
+            if killed and not restarted and elapsed > 2 * args.duration / 3:
+                procs[0] = start_controller(ports[0], state_file, args.expiration)
+                wait_ready(replicas[0])
+                restarted = True
+                print(
+                    f"Restarted replica {replicas[0]} after {total} routes, "
+                    f"ready in {time.time() - start - elapsed:.2f} s."
+                )
+
+            replica, ret = post_with_failover(
+                replicas, total, "/get_worker_address", {"model": MODEL_NAME}
+            )
+            address = ret["address"] if ret is not None else ""
+            if address == hung_address:
+                hung_routes += 1
+                last_hung_route = time.time()
+                if last_hung_route > expiry_deadline:
+                    failed += 1
+            elif address != live_address:
+                failed += 1
+            if restarted and replica == replicas[0] and address == live_address:
+                restarted_routes += 1
+            total += 1
+
+        print(f"Routes: {total}, failed: {failed}")
+        if last_hung_route is None:
+            print("Hung worker: never routed")
+        else:
+            print(
+                f"Hung worker: {hung_routes} routes, the last "
+                f"{last_hung_route - registered:.1f} s after registration "
+                f"(expiration {args.expiration} s)"
+            )
+        print(f"Routes served by the restarted replica: {restarted_routes}")
+        return 1 if failed or not restarted_routes else 0
+    finally:
+        stop.set()
+        for proc in procs:
+            proc.kill()
+        live_server.shutdown()
+        hung_server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=21101)
+    parser.add_argument("--worker-port", type=int, default=21198)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument(
+        "--expiration",
+        type=int,
+        default=3,
+        help="Heartbeat expiration of the controllers in seconds. Keep it "
+        "below a sixth of the duration, so the hung worker expires before "
+        "the restart.",
+    )
+    args = parser.parse_args()
+    sys.exit(main(args))
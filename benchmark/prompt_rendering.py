@@ -0,0 +1,441 @@
+"""
+Compare the prompt renderers of fastchat.conversation with the former
+if/elif chain over SeparatorStyle.
+
+For every registered template, conversations of several shapes are rendered
+with the legacy chain, Conversation.render_prompt and Conversation.get_prompt.
+Any output that is not byte-identical to the legacy one is reported and
+makes the script exit with status 1. Then the throughput of each path is
+measured on a fresh conversation per sample, as the training scripts render
+them, and for get_prompt on a conversation that grows by one turn per call.
+
+Usage:
+python3 benchmark/prompt_rendering.py --num-turns 8 --repeat 200
+"""
+import argparse
+import sys
+import time
+
+from fastchat.conversation import (
+    IMAGE_PLACEHOLDER_STR,
+    SeparatorStyle,
+    conv_templates,
+    get_conv_template,
+)
+
+
+def legacy_get_prompt(conv) -> str:
+    """Conversation.get_prompt before the renderers, kept as the reference."""
+    system_prompt = conv.system_template.format(system_message=conv.system_message)
+    if conv.sep_style == SeparatorStyle.ADD_COLON_SINGLE:
+        ret = system_prompt + conv.sep
+        for role, message in conv.messages:
+            if message:
+                if type(message) is tuple:
+                    message, images = message
+                    message = IMAGE_PLACEHOLDER_STR * len(images) + message
+                ret += role + ": " + message + conv.sep
+            else:
+                ret += role + ":"
+        return ret
+    elif conv.sep_style == SeparatorStyle.ADD_COLON_TWO:
+        seps = [conv.sep, conv.sep2]
+        ret = system_prompt + seps[0]
+        for i, (role, message) in enumerate(conv.messages):
+            if message:
+                if type(message) is tuple:
+                    message, images = message
+                    message = IMAGE_PLACEHOLDER_STR * len(images) + message
+                ret += role + ": " + message + seps[i % 2]
+            else:
+                ret += role + ":"
+        return ret
+    elif conv.sep_style == SeparatorStyle.ADD_COLON_SPACE_SINGLE:
+        ret = system_prompt + conv.sep
+        for role, message in conv.messages:
+            if message:
+                ret += role + ": " + message + conv.sep
+            else:
+                ret += role + ": "  # must be end with a space
+        return ret
+    elif conv.sep_style == SeparatorStyle.ADD_NEW_LINE_SINGLE:
+        ret = "" if system_prompt == "" else system_prompt + conv.sep
+        for role, message in conv.messages:
+            if message:
+                ret += role + "\n" + message + conv.sep
+            else:
+                ret += role + "\n"
+        return ret
+    elif conv.sep_style == SeparatorStyle.NO_COLON_SINGLE:
+        ret = system_prompt
+        for role, message in conv.messages:
+            if message:
+                ret += role + message + conv.sep
+            else:
+                ret += role
+        return ret
+    elif conv.sep_style == SeparatorStyle.NO_COLON_TWO:
+        seps = [conv.sep, conv.sep2]
+        ret = system_prompt
+        for i, (role, message) in enumerate(conv.messages):
+            if message:
+                ret += role + message + seps[i % 2]
+            else:
+                ret += role
+        return ret
+    elif conv.sep_style == SeparatorStyle.RWKV:
+        ret = system_prompt
+        for i, (role, message) in enumerate(conv.messages):
+            if message:
+                ret += role + ": " + message.replace("\r\n", "\n").replace("\n\n", "\n")
+                ret += "\n\n"
+            else:
+                ret += role + ":"
+        return ret
+    elif conv.sep_style == SeparatorStyle.LLAMA2:
+        seps = [conv.sep, conv.sep2]
+        if conv.system_message:
+            ret = system_prompt
+        else:
+            ret = "[INST] "
+        for i, (role, message) in enumerate(conv.messages):
+            tag = conv.roles[i % 2]
+            if message:
+                if i == 0:
+                    ret += message + " "
+                else:
+                    ret += tag + " " + message + seps[i % 2]
+            else:
+                ret += tag
+        return ret
+    elif conv.sep_style == SeparatorStyle.LLAMA3:
+        ret = "<|begin_of_text|>"
+        if conv.system_message:
+            ret += system_prompt
+        else:
+            ret += ""
+        for i, (role, message) in enumerate(conv.messages):
+            if message:
+                ret += f"<|start_header_id|>{role}<|end_header_id|>\n\n"
+                ret += f"{message.strip()}<|eot_id|>"
+            else:
+                ret += f"<|start_header_id|>{role}<|end_header_id|>\n\n"
+        return ret
+    elif conv.sep_style == SeparatorStyle.CHATGLM:
+        # source: https://huggingface.co/THUDM/chatglm-6b/blob/1d240ba371910e9282298d4592532d7f0f3e9f3e/modeling_chatglm.py#L1302-L1308
+        # source2: https://huggingface.co/THUDM/chatglm2-6b/blob/e186c891cf64310ac66ef10a87e6635fa6c2a579/modeling_chatglm.py#L926
+        round_add_n = 1 if conv.name == "chatglm2" else 0
+        if system_prompt:
+            ret = system_prompt + conv.sep
+        else:
+            ret = ""
+
+        for i, (role, message) in enumerate(conv.messages):
+            if i % 2 == 0:
+                ret += f"[Round {i//2 + round_add_n}]{conv.sep}"
+
+            if message:
+                ret += f"{role}：{message}{conv.sep}"
+            else:
+                ret += f"{role}："
+        return ret
+    elif conv.sep_style == SeparatorStyle.CHATML:
+        ret = "" if system_prompt == "" else system_prompt + conv.sep + "\n"
+        for role, message in conv.messages:
+            if message:
+                if type(message) is tuple:
+                    message, images = message
+                    message = IMAGE_PLACEHOLDER_STR * len(images) + message
+                ret += role + "\n" + message + conv.sep + "\n"
+            else:
+                ret += role + "\n"
+        return ret
+    elif conv.sep_style == SeparatorStyle.CHATGLM3:
+        ret = ""
+        if conv.system_message:
+            ret += system_prompt
+        for role, message in conv.messages:
+            if message:
+                ret += role + "\n" + message
+            else:
+                ret += role
+        return ret
+    elif conv.sep_style == SeparatorStyle.CHATINTERN:
+        # source: https://huggingface.co/internlm/internlm-chat-7b-8k/blob/bd546fa984b4b0b86958f56bf37f94aa75ab8831/modeling_internlm.py#L771
+        seps = [conv.sep, conv.sep2]
+        ret = system_prompt
+        for i, (role, message) in enumerate(conv.messages):
+            if i % 2 == 0:
+                ret += "<s>"
+            if message:
+                ret += role + ":" + message + seps[i % 2] + "\n"
+            else:
+                ret += role + ":"
+        return ret
+    elif conv.sep_style == SeparatorStyle.DOLLY:
+        seps = [conv.sep, conv.sep2]
+        ret = system_prompt
+        for i, (role, message) in enumerate(conv.messages):
+            if message:
+                ret += role + ":\n" + message + seps[i % 2]
+                if i % 2 == 1:
+                    ret += "\n\n"
+            else:
+                ret += role + ":\n"
+        return ret
+    elif conv.sep_style == SeparatorStyle.PHOENIX:
+        ret = system_prompt
+        for role, message in conv.messages:
+            if message:
+                ret += role + ": " + "<s>" + message + "</s>"
+            else:
+                ret += role + ": " + "<s>"
+        return ret
+    elif conv.sep_style == SeparatorStyle.ROBIN:
+        ret = system_prompt + conv.sep
+        for role, message in conv.messages:
+            if message:
+                ret += role + ":\n" + message + conv.sep
+            else:
+                ret += role + ":\n"
+        return ret
+    elif conv.sep_style == SeparatorStyle.FALCON_CHAT:
+        ret = ""
+        if conv.system_message:
+            ret += system_prompt + conv.sep
+        for role, message in conv.messages:
+            if message:
+                ret += role + ": " + message + conv.sep
+            else:
+                ret += role + ":"
+        return ret
+    elif conv.sep_style == SeparatorStyle.METAMATH:
+        ret = "" if system_prompt == "" else system_prompt + conv.sep
+        for i, (role, message) in enumerate(conv.messages):
+            # For MetaMath, sep2 is used to prefix the message.
+            starting_sep = ":\n" if i % 2 == 0 else ": " + conv.sep2
+            ending_sep = conv.sep if i % 2 == 0 else ""
+            if message:
+                ret += role + starting_sep + message + ending_sep
+            else:
+                ret += role + starting_sep
+        return ret
+    elif conv.sep_style == SeparatorStyle.DEEPSEEK_CHAT:
+        seps = [conv.sep, conv.sep2]
+        ret = system_prompt
+        for i, (role, message) in enumerate(conv.messages):
+            if message:
+                ret += role + ": " + message + seps[i % 2]
+            else:
+                ret += role + ":"
+        return ret
+    elif conv.sep_style == SeparatorStyle.YUAN2:
+        seps = [conv.sep, conv.sep2]
+        ret = ""
+        if conv.system_message:
+            ret += system_prompt + seps[1]
+        for _, message in conv.messages:
+            if message:
+                ret += message + "<n>"
+            else:
+                ret += ""
+        ret = ret.rstrip("<n>") + seps[0]
+        return ret
+    elif conv.sep_style == SeparatorStyle.GEMMA:
+        ret = "<bos>"
+        for role, message in conv.messages:
+            if message:
+                ret += "<start_of_turn>" + role + "\n" + message + conv.sep
+            else:
+                ret += "<start_of_turn>" + role + "\n"
+        return ret
+    elif conv.sep_style == SeparatorStyle.CLLM:
+        seps = [conv.sep, conv.sep2]
+        ret = system_prompt + seps[0]
+        for i, (role, message) in enumerate(conv.messages[-2:]):
+            if message:
+                if type(message) is tuple:
+                    message, images = message
+                    message = IMAGE_PLACEHOLDER_STR * len(images) + message
+                ret += role + ": " + message + seps[i % 2]
+            else:
+                ret += role + ":"
+        return ret
+    elif conv.sep_style == SeparatorStyle.DEFAULT:
+        ret = system_prompt + "\n"
+        for role, message in conv.messages:
+            if message:
+                if type(message) is tuple:
+                    message, images = message
+                ret += role + ": " + message + "\n"
+            else:
+                ret += role + ":"
+        return ret
+    else:
+        raise ValueError(f"Invalid style: {conv.sep_style}")
+
+
+# Marks an exception raised while rendering, which must match as well
+ERROR_PREFIX = "\0error: "
+
+
+class FakeImage:
+    pass
+
+
+def make_conversations(name, num_turns):
+    """Conversations of different shapes for one template."""
+    texts = [
+        "Hello!",
+        "Line one\nline two\n\nand\r\nmore",
+        " padded ",
+        "<n>",
+        "x" * 200,
+    ]
+    convs = []
+    for system_message in (None, "", "You are a helpful assistant."):
+        for open_turn in (True, False):
+            conv = get_conv_template(name)
+            if system_message is not None:
+                conv.set_system_message(system_message)
+            for i in range(num_turns):
+                conv.append_message(conv.roles[0], texts[i % len(texts)])
+                conv.append_message(conv.roles[1], texts[(i + 2) % len(texts)])
+            conv.append_message(conv.roles[0], "Last question?")
+            if open_turn:
+                conv.append_message(conv.roles[1], None)
+            convs.append(conv)
+    if get_conv_template(name).sep_style in (
+        SeparatorStyle.ADD_COLON_SINGLE,
+        SeparatorStyle.ADD_COLON_TWO,
+        SeparatorStyle.CHATML,
+        SeparatorStyle.DEFAULT,
+    ):
+        # A vision message, (text, images)
+        conv = get_conv_template(name)
+        conv.append_message(
+            conv.roles[0], ("Describe this.", [FakeImage(), FakeImage()])
+        )
+        conv.append_message(conv.roles[1], None)
+        convs.append(conv)
+    return convs
+
+
+def render(fn, conv):
+    try:
+        return fn(conv)
+    except Exception as e:
+        return f"{ERROR_PREFIX}{type(e).__name__}: {e}"
+
+
+def check_outputs(num_turns):
+    """Return the number of outputs that differ from the legacy chain."""
+    num_checked = num_mismatches = 0
+    for name in conv_templates:
+        for conv in make_conversations(name, num_turns):
+            expected = render(legacy_get_prompt, conv)
+            for label, fn in (
+                ("render_prompt", lambda c: c.render_prompt()),
+                ("get_prompt", lambda c: c.get_prompt()),
+                # A second call builds the segment cache, a third is served from it.
+                ("get_prompt (cache built)", lambda c: c.get_prompt()),
+                ("get_prompt (cached)", lambda c: c.get_prompt()),
+            ):
+                num_checked += 1
+                output = render(fn, conv)
+                if output != expected:
+                    num_mismatches += 1
+                    print(f"MISMATCH {name} {label}:\n  {expected!r}\n  {output!r}")
+    print(
+        f"Checked {num_checked} outputs of {len(conv_templates)} templates, {num_mismatches} mismatches"
+    )
+    return num_mismatches
+
+
+def fill(name, num_turns):
+    conv = get_conv_template(name)
+    for i in range(num_turns):
+        conv.append_message(conv.roles[0], f"Question {i} about something.")
+        conv.append_message(conv.roles[1], f"Answer {i} with some details.")
+    conv.append_message(conv.roles[0], "Last question?")
+    conv.append_message(conv.roles[1], None)
+    return conv
+
+
+def measure(names, num_turns, repeat):
+    # Templates that render without errors, e.g. not the API-only ones
+    names = [
+        name
+        for name in names
+        if not render(legacy_get_prompt, fill(name, 1)).startswith(ERROR_PREFIX)
+    ]
+    convs = [fill(name, num_turns) for name in names]
+    # New message strings per sample, as the training scripts build them
+    samples = [
+        (
+            conv,
+            [
+                [role, message and message[:1] + message[1:]]
+                for role, message in conv.messages
+            ],
+        )
+        for _ in range(repeat)
+        for conv in convs
+    ]
+
+    def fresh(fn):
+        start = time.perf_counter()
+        for conv, messages in samples:
+            conv.messages = messages
+            fn(conv)
+        return len(samples) / (time.perf_counter() - start)
+
+    results = {
+        "legacy chain": fresh(legacy_get_prompt),
+        "render_prompt": fresh(lambda c: c.render_prompt()),
+        "get_prompt": fresh(lambda c: c.get_prompt()),
+    }
+
+    # One growing conversation per template, rendered after every message
+    start = time.perf_counter()
+    num_calls = 0
+    for name in names * max(1, repeat // 10):
+        conv = get_conv_template(name)
+        for i in range(num_turns):
+            conv.append_message(conv.roles[0], f"Question {i}")
+            conv.append_message(conv.roles[1], None)
+            conv.get_prompt()
+            conv.update_last_message(f"Answer {i}")
+            num_calls += 1
+    results["get_prompt, growing conversation"] = num_calls / (
+        time.perf_counter() - start
+    )
+
+    start = time.perf_counter()
+    num_calls = 0
+    for name in names * max(1, repeat // 10):
+        conv = get_conv_template(name)
+        for i in range(num_turns):
+            conv.append_message(conv.roles[0], f"Question {i}")
+            conv.append_message(conv.roles[1], None)
+            legacy_get_prompt(conv)
+            conv.update_last_message(f"Answer {i}")
+            num_calls += 1
+    results["legacy chain, growing conversation"] = num_calls / (
+        time.perf_counter() - start
+    )
+
+    print(f"\n{len(names)} templates, {num_turns} turns per conversation")
+    for label, rate in results.items():
+        print(f"{label:40s} {rate:12,.0f} prompts/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-turns", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    num_mismatches = check_outputs(args.num_turns)
+    measure(list(conv_templates), args.num_turns, args.repeat)
+    sys.exit(1 if num_mismatches else 0)
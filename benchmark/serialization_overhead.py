@@ -0,0 +1,95 @@
+"""
+Measure the per-chunk CPU cost of the streaming serialization path.
+
+Each streamed token is serialized by the worker, parsed by the API server
+and re-serialized as an SSE chunk. This compares the legacy path (stdlib
+json plus a pydantic chunk object per token) against fastchat.serve.serialization
+with each available JSON backend and pre-serialized chunk templates.
+
+Usage:
+python3 benchmark/serialization_overhead.py --num-chunks 100000
+"""
+import argparse
+import json
+import time
+
+from fastchat.protocol.api_protocol import (
+    ChatCompletionResponseStreamChoice,
+    ChatCompletionStreamResponse,
+    DeltaMessage,
+)
+from fastchat.serve import serialization
+
+
+def worker_chunks(num_chunks):
+    """Cumulative worker outputs as the model worker produces them."""
+    text = ""
+    for i in range(num_chunks):
+        text += " token"
+        yield {
+            "text": text[-64:],
+            "error_code": 0,
+            "usage": {
+                "prompt_tokens": 32,
+                "completion_tokens": i + 1,
+                "total_tokens": i + 33,
+            },
+            "finish_reason": None,
+        }
+
+
+def legacy_path(outputs, model):
+    for ret in outputs:
+        data = json.dumps(ret).encode() + b"\0"
+        content = json.loads(data[:-1].decode())["text"]
+        chunk = ChatCompletionStreamResponse(
+            id=f"chatcmpl-{int(time.time())}",
+            choices=[
+                ChatCompletionResponseStreamChoice(
+                    index=0, delta=DeltaMessage(content=content), finish_reason=None
+                )
+            ],
+            model=model,
+        )
+        f"data: {chunk.json()}\n\n".encode()
+
+
+def fast_path(outputs, model):
+    template = serialization.ChunkTemplate(
+        ChatCompletionStreamResponse(
+            id=f"chatcmpl-{int(time.time())}",
+            choices=[
+                ChatCompletionResponseStreamChoice(
+                    index=0,
+                    delta=DeltaMessage(content=serialization.ChunkTemplate.SLOT),
+                )
+            ],
+            model=model,
+        ).model_dump()
+    )
+    for ret in outputs:
+        data = serialization.dumps(ret) + b"\0"
+        content = serialization.loads(data[:-1])["text"]
+        template.render(content)
+
+
+def measure(name, func, outputs, model):
+    start = time.process_time()
+    func(outputs, model)
+    elapsed = time.process_time() - start
+    print(f"{name:24s} {elapsed / len(outputs) * 1e6:8.2f} us/chunk")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-chunks", type=int, default=100000)
+    parser.add_argument("--model", type=str, default="yeongjopt-mistral-7b")
+    args = parser.parse_args()
+
+    outputs = list(worker_chunks(args.num_chunks))
+    baseline = measure("legacy (json+pydantic)", legacy_path, outputs, args.model)
+    for backend in serialization.JSON_BACKENDS:
+        serialization.set_json_backend(backend)
+        elapsed = measure(f"template ({backend})", fast_path, outputs, args.model)
+        print(f"{'':24s} {baseline / elapsed:8.2f}x faster")
@@ -0,0 +1,100 @@
+"""
+Compare the bytes and CPU per token of the worker stream formats.
+
+Encodes and decodes --num-streams simulated worker streams of
+--num-tokens tokens each in three formats:
+  json:        NUL-delimited JSON with the whole output in every chunk (default)
+  json-delta:  NUL-delimited JSON with only the new text ("delta": true)
+  msgpack:     length-prefixed msgpack frames with only the new text and a
+               final usage frame ("stream_format": "msgpack")
+
+Usage:
+python3 benchmark/stream_framing.py --num-streams 256 --num-tokens 512
+"""
+import argparse
+import time
+
+from fastchat.serve import serialization
+
+
+def worker_outputs(num_tokens, prompt_tokens=128):
+    """The per-token outputs of generate_stream for one request."""
+    text = ""
+    for i in range(num_tokens):
+        text += " token"
+        yield {
+            "text": text,
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": i + 1,
+                "total_tokens": prompt_tokens + i + 1,
+            },
+            "finish_reason": "length" if i == num_tokens - 1 else None,
+        }
+
+
+def encode_stream(outputs, mode):
+    """Encode one stream the way ModelWorker.generate_stream_gate does."""
+    delta = mode != "json"
+    stream_format = "msgpack" if mode == "msgpack" else "json"
+    sent_len = 0
+    data = []
+    for output in outputs:
+        text = output["text"]
+        if delta:
+            text, sent_len = text[sent_len:], len(text)
+        ret = {"text": text, "error_code": 0}
+        if delta:
+            ret["delta"] = True
+        ret["usage"] = output["usage"]
+        ret["finish_reason"] = output["finish_reason"]
+        data.append(serialization.encode_stream_chunk(ret, stream_format))
+    return b"".join(data)
+
+
+def decode_stream(data, mode):
+    """Decode one stream the way iter_worker_chunks does."""
+    if mode == "msgpack":
+        chunks, rest = serialization.decode_frames(data)
+        assert not rest
+        return chunks
+    return [serialization.loads(chunk) for chunk in data.split(b"\0") if chunk]
+
+
+def run(mode, args):
+    outputs = list(worker_outputs(args.num_tokens))
+    total_bytes = 0
+    encode_time = decode_time = 0.0
+    for _ in range(args.num_streams):
+        start = time.process_time()
+        data = encode_stream(outputs, mode)
+        encode_time += time.process_time() - start
+        start = time.process_time()
+        chunks = decode_stream(data, mode)
+        decode_time += time.process_time() - start
+        assert len(chunks) == args.num_tokens
+        total_bytes += len(data)
+
+    num_tokens = args.num_streams * args.num_tokens
+    print(
+        f"{mode:12s} | bytes/token: {total_bytes / num_tokens:8.1f} | "
+        f"encode: {encode_time / num_tokens * 1e6:6.2f} us/token | "
+        f"decode: {decode_time / num_tokens * 1e6:6.2f} us/token | "
+        f"total: {total_bytes / 2**20:8.1f} MiB"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-streams", type=int, default=256)
+    parser.add_argument("--num-tokens", type=int, default=512)
+    args = parser.parse_args()
+
+    print(f"JSON backend: {serialization.json_backend}")
+    modes = ["json", "json-delta"]
+    if serialization.msgpack is not None:
+        modes.append("msgpack")
+    else:
+        print("msgpack is not installed, skipping the msgpack format.")
+    for mode in modes:
+        run(mode, args)
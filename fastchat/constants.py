@@ -48,6 +48,8 @@ BLIND_MODE_INPUT_CHAR_LEN_LIMIT = int(
 CONVERSATION_TURN_LIMIT = 50
 # Session expiration time
 SESSION_EXPIRATION_TIME = 3600
+# Seconds the web server reuses the worker addresses of a model
+WORKER_ADDRESS_CACHE_TTL = float(os.getenv("FASTCHAT_WORKER_ADDRESS_CACHE_TTL", 5))
 # The output dir of log files
 LOGDIR = os.getenv("LOGDIR", ".")
 # CPU Instruction Set Architecture
@@ -58,6 +60,15 @@ CPU_ISA = os.getenv("CPU_ISA")
 CONTROLLER_HEART_BEAT_EXPIRATION = int(
     os.getenv("FASTCHAT_CONTROLLER_HEART_BEAT_EXPIRATION", 90)
 )
+CONTROLLER_ADMISSION_RETRY_AFTER = int(
+    os.getenv("FASTCHAT_CONTROLLER_ADMISSION_RETRY_AFTER", 5)
+)
+CONTROLLER_STATE_REVALIDATE_TIMEOUT = float(
+    os.getenv("FASTCHAT_CONTROLLER_STATE_REVALIDATE_TIMEOUT", 2)
+)
+CONTROLLER_STATE_SYNC_INTERVAL = float(
+    os.getenv("FASTCHAT_CONTROLLER_STATE_SYNC_INTERVAL", 1)
+)
 WORKER_HEART_BEAT_INTERVAL = int(os.getenv("FASTCHAT_WORKER_HEART_BEAT_INTERVAL", 45))
 WORKER_API_TIMEOUT = int(os.getenv("FASTCHAT_WORKER_API_TIMEOUT", 100))
 WORKER_API_EMBEDDING_BATCH_SIZE = int(
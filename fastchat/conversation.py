@@ -10,7 +10,7 @@ import dataclasses
 from enum import auto, IntEnum
 from io import BytesIO
 import os
-from typing import List, Any, Dict, Union, Tuple
+from typing import Callable, List, Any, Dict, Optional, Union, Tuple
 
 
 class SeparatorStyle(IntEnum):
@@ -44,6 +44,214 @@ class SeparatorStyle(IntEnum):
 IMAGE_PLACEHOLDER_STR = "$$<image>$$"
 
 
+def _sep(conv: "Conversation", i: int) -> str:
+    """The separator after the i-th message of two-separator styles."""
+    return conv.sep if i % 2 == 0 else conv.sep2
+
+
+@dataclasses.dataclass(frozen=True)
+class PromptRenderer:
+    """The prompt format of a separator style.
+
+    A prompt is header(conv, system_prompt) followed by one segment per message:
+    message(conv, i, role, message) for a message with content and
+    open_turn(conv, i, role) for an empty one, usually the turn to generate.
+    Styles whose messages depend on each other set render(conv) instead.
+    """
+
+    header: Optional[Callable] = None
+    message: Optional[Callable] = None
+    open_turn: Optional[Callable] = None
+    # How image messages, (text, images) tuples, are rendered: "placeholder"
+    # prepends IMAGE_PLACEHOLDER_STR per image, "drop" keeps only the text.
+    images: Optional[str] = None
+    render: Optional[Callable] = None
+
+    def render_segment(self, conv: "Conversation", i: int, role: str, message) -> str:
+        if not message:
+            return self.open_turn(conv, i, role)
+        if type(message) is tuple and self.images is not None:
+            message, images = message
+            if self.images == "placeholder":
+                message = IMAGE_PLACEHOLDER_STR * len(images) + message
+        return self.message(conv, i, role, message)
+
+
+def _render_yuan2(conv: "Conversation") -> str:
+    system_prompt = conv.system_template.format(system_message=conv.system_message)
+    parts = [system_prompt + conv.sep2] if conv.system_message else []
+    for _, message in conv.messages:
+        if message:
+            parts.append(message + "<n>")
+    return "".join(parts).rstrip("<n>") + conv.sep
+
+
+def _render_cllm(conv: "Conversation") -> str:
+    # Only the last turn is rendered.
+    system_prompt = conv.system_template.format(system_message=conv.system_message)
+    renderer = PROMPT_RENDERERS[SeparatorStyle.ADD_COLON_TWO]
+    parts = [system_prompt + conv.sep]
+    for i, (role, message) in enumerate(conv.messages[-2:]):
+        parts.append(renderer.render_segment(conv, i, role, message))
+    return "".join(parts)
+
+
+def _render_chatglm_round(conv: "Conversation", i: int) -> str:
+    # source: https://huggingface.co/THUDM/chatglm-6b/blob/1d240ba371910e9282298d4592532d7f0f3e9f3e/modeling_chatglm.py#L1302-L1308
+    # source2: https://huggingface.co/THUDM/chatglm2-6b/blob/e186c891cf64310ac66ef10a87e6635fa6c2a579/modeling_chatglm.py#L926
+    if i % 2:
+        return ""
+    round_add_n = 1 if conv.name == "chatglm2" else 0
+    return f"[Round {i//2 + round_add_n}]{conv.sep}"
+
+
+def _metamath_prefix(conv: "Conversation", i: int) -> str:
+    # For MetaMath, sep2 is used to prefix the message.
+    return ":\n" if i % 2 == 0 else ": " + conv.sep2
+
+
+# Dict[SeparatorStyle -> PromptRenderer]
+PROMPT_RENDERERS = {
+    SeparatorStyle.ADD_COLON_SINGLE: PromptRenderer(
+        header=lambda conv, system: system + conv.sep,
+        message=lambda conv, i, role, message: role + ": " + message + conv.sep,
+        open_turn=lambda conv, i, role: role + ":",
+        images="placeholder",
+    ),
+    SeparatorStyle.ADD_COLON_TWO: PromptRenderer(
+        header=lambda conv, system: system + conv.sep,
+        message=lambda conv, i, role, message: role + ": " + message + _sep(conv, i),
+        open_turn=lambda conv, i, role: role + ":",
+        images="placeholder",
+    ),
+    SeparatorStyle.ADD_COLON_SPACE_SINGLE: PromptRenderer(
+        header=lambda conv, system: system + conv.sep,
+        message=lambda conv, i, role, message: role + ": " + message + conv.sep,
+        # must be end with a space
+        open_turn=lambda conv, i, role: role + ": ",
+    ),
+    SeparatorStyle.ADD_NEW_LINE_SINGLE: PromptRenderer(
+        header=lambda conv, system: "" if system == "" else system + conv.sep,
+        message=lambda conv, i, role, message: role + "\n" + message + conv.sep,
+        open_turn=lambda conv, i, role: role + "\n",
+    ),
+    SeparatorStyle.NO_COLON_SINGLE: PromptRenderer(
+        header=lambda conv, system: system,
+        message=lambda conv, i, role, message: role + message + conv.sep,
+        open_turn=lambda conv, i, role: role,
+    ),
+    SeparatorStyle.NO_COLON_TWO: PromptRenderer(
+        header=lambda conv, system: system,
+        message=lambda conv, i, role, message: role + message + _sep(conv, i),
+        open_turn=lambda conv, i, role: role,
+    ),
+    SeparatorStyle.RWKV: PromptRenderer(
+        header=lambda conv, system: system,
+        message=lambda conv, i, role, message: role
+        + ": "
+        + message.replace("\r\n", "\n").replace("\n\n", "\n")
+        + "\n\n",
+        open_turn=lambda conv, i, role: role + ":",
+    ),
+    SeparatorStyle.LLAMA2: PromptRenderer(
+        header=lambda conv, system: system if conv.system_message else "[INST] ",
+        message=lambda conv, i, role, message: message + " "
+        if i == 0
+        else conv.roles[i % 2] + " " + message + _sep(conv, i),
+        open_turn=lambda conv, i, role: conv.roles[i % 2],
+    ),
+    SeparatorStyle.LLAMA3: PromptRenderer(
+        header=lambda conv, system: "<|begin_of_text|>"
+        + (system if conv.system_message else ""),
+        message=lambda conv, i, role, message: f"<|start_header_id|>{role}<|end_header_id|>\n\n"
+        f"{message.strip()}<|eot_id|>",
+        open_turn=lambda conv, i, role: f"<|start_header_id|>{role}<|end_header_id|>\n\n",
+    ),
+    SeparatorStyle.CHATGLM: PromptRenderer(
+        header=lambda conv, system: system + conv.sep if system else "",
+        message=lambda conv, i, role, message: _render_chatglm_round(conv, i)
+        + f"{role}：{message}{conv.sep}",
+        open_turn=lambda conv, i, role: _render_chatglm_round(conv, i) + f"{role}：",
+    ),
+    SeparatorStyle.CHATML: PromptRenderer(
+        header=lambda conv, system: "" if system == "" else system + conv.sep + "\n",
+        message=lambda conv, i, role, message: role + "\n" + message + conv.sep + "\n",
+        open_turn=lambda conv, i, role: role + "\n",
+        images="placeholder",
+    ),
+    SeparatorStyle.CHATGLM3: PromptRenderer(
+        header=lambda conv, system: system if conv.system_message else "",
+        message=lambda conv, i, role, message: role + "\n" + message,
+        open_turn=lambda conv, i, role: role,
+    ),
+    SeparatorStyle.CHATINTERN: PromptRenderer(
+        # source: https://huggingface.co/internlm/internlm-chat-7b-8k/blob/bd546fa984b4b0b86958f56bf37f94aa75ab8831/modeling_internlm.py#L771
+        header=lambda conv, system: system,
+        message=lambda conv, i, role, message: ("<s>" if i % 2 == 0 else "")
+        + role
+        + ":"
+        + message
+        + _sep(conv, i)
+        + "\n",
+        open_turn=lambda conv, i, role: ("<s>" if i % 2 == 0 else "") + role + ":",
+    ),
+    SeparatorStyle.DOLLY: PromptRenderer(
+        header=lambda conv, system: system,
+        message=lambda conv, i, role, message: role
+        + ":\n"
+        + message
+        + _sep(conv, i)
+        + ("\n\n" if i % 2 == 1 else ""),
+        open_turn=lambda conv, i, role: role + ":\n",
+    ),
+    SeparatorStyle.PHOENIX: PromptRenderer(
+        header=lambda conv, system: system,
+        message=lambda conv, i, role, message: role + ": " + "<s>" + message + "</s>",
+        open_turn=lambda conv, i, role: role + ": " + "<s>",
+    ),
+    SeparatorStyle.ROBIN: PromptRenderer(
+        header=lambda conv, system: system + conv.sep,
+        message=lambda conv, i, role, message: role + ":\n" + message + conv.sep,
+        open_turn=lambda conv, i, role: role + ":\n",
+    ),
+    SeparatorStyle.FALCON_CHAT: PromptRenderer(
+        header=lambda conv, system: system + conv.sep if conv.system_message else "",
+        message=lambda conv, i, role, message: role + ": " + message + conv.sep,
+        open_turn=lambda conv, i, role: role + ":",
+    ),
+    SeparatorStyle.METAMATH: PromptRenderer(
+        header=lambda conv, system: "" if system == "" else system + conv.sep,
+        message=lambda conv, i, role, message: role
+        + _metamath_prefix(conv, i)
+        + message
+        + (conv.sep if i % 2 == 0 else ""),
+        open_turn=lambda conv, i, role: role + _metamath_prefix(conv, i),
+    ),
+    SeparatorStyle.DEEPSEEK_CHAT: PromptRenderer(
+        header=lambda conv, system: system,
+        message=lambda conv, i, role, message: role + ": " + message + _sep(conv, i),
+        open_turn=lambda conv, i, role: role + ":",
+    ),
+    SeparatorStyle.YUAN2: PromptRenderer(render=_render_yuan2),
+    SeparatorStyle.GEMMA: PromptRenderer(
+        header=lambda conv, system: "<bos>",
+        message=lambda conv, i, role, message: "<start_of_turn>"
+        + role
+        + "\n"
+        + message
+        + conv.sep,
+        open_turn=lambda conv, i, role: "<start_of_turn>" + role + "\n",
+    ),
+    SeparatorStyle.CLLM: PromptRenderer(render=_render_cllm),
+    SeparatorStyle.DEFAULT: PromptRenderer(
+        header=lambda conv, system: system + "\n",
+        message=lambda conv, i, role, message: role + ": " + message + "\n",
+        open_turn=lambda conv, i, role: role + ":",
+        images="drop",
+    ),
+}
+
+
 @dataclasses.dataclass
 class Conversation:
     """A class that manages prompt templates and keeps all conversation history."""
@@ -72,260 +280,109 @@ class Conversation:
     stop_token_ids: List[int] = None
     # The maximum image size in megabytes that this model takes in. None means we do not resize the image.
     max_image_size_mb: int = None
+    # Token counts of message texts, filled by fit_to_token_budget
+    token_counts: Dict[str, int] = dataclasses.field(default_factory=dict)
+
+    def __post_init__(self):
+        # The PromptRenderer of sep_style, selected by get_renderer
+        self._renderer = None
+        self._renderer_style = None
+        # The prompt is cached as a header and one rendered segment per message.
+        # A segment is reused while its message is the same object with the same
+        # role, so set_system_message, update_last_message, pops and any other
+        # change of self.messages invalidate exactly the changed part. Changing
+        # the name, roles or separators of the template invalidates everything.
+        self._style_key = None
+        self._header_key = None
+        self._header = ""
+        self._segment_sources = []
+        self._segments = []
+        # The (role, message) rendered first by the last uncached get_prompt.
+        # The cache is only built once the same conversation is rendered again.
+        self._first_source = None
+
+    def get_renderer(self) -> PromptRenderer:
+        """Get the renderer of this template's separator style, selected once per style."""
+        if self._renderer is None or self._renderer_style != self.sep_style:
+            renderer = PROMPT_RENDERERS.get(self.sep_style)
+            if renderer is None:
+                raise ValueError(f"Invalid style: {self.sep_style}")
+            self._renderer = renderer
+            self._renderer_style = self.sep_style
+            # The cached prompt was rendered in another style.
+            self._header_key = None
+            self._segment_sources = []
+            self._segments = []
+        return self._renderer
 
     def get_prompt(self) -> str:
-        """Get the prompt for generation."""
-        system_prompt = self.system_template.format(system_message=self.system_message)
-        if self.sep_style == SeparatorStyle.ADD_COLON_SINGLE:
-            ret = system_prompt + self.sep
-            for role, message in self.messages:
-                if message:
-                    if type(message) is tuple:
-                        message, images = message
-                        message = IMAGE_PLACEHOLDER_STR * len(images) + message
-                    ret += role + ": " + message + self.sep
-                else:
-                    ret += role + ":"
-            return ret
-        elif self.sep_style == SeparatorStyle.ADD_COLON_TWO:
-            seps = [self.sep, self.sep2]
-            ret = system_prompt + seps[0]
-            for i, (role, message) in enumerate(self.messages):
-                if message:
-                    if type(message) is tuple:
-                        message, images = message
-                        message = IMAGE_PLACEHOLDER_STR * len(images) + message
-                    ret += role + ": " + message + seps[i % 2]
-                else:
-                    ret += role + ":"
-            return ret
-        elif self.sep_style == SeparatorStyle.ADD_COLON_SPACE_SINGLE:
-            ret = system_prompt + self.sep
-            for role, message in self.messages:
-                if message:
-                    ret += role + ": " + message + self.sep
-                else:
-                    ret += role + ": "  # must be end with a space
-            return ret
-        elif self.sep_style == SeparatorStyle.ADD_NEW_LINE_SINGLE:
-            ret = "" if system_prompt == "" else system_prompt + self.sep
-            for role, message in self.messages:
-                if message:
-                    ret += role + "\n" + message + self.sep
-                else:
-                    ret += role + "\n"
-            return ret
-        elif self.sep_style == SeparatorStyle.NO_COLON_SINGLE:
-            ret = system_prompt
-            for role, message in self.messages:
-                if message:
-                    ret += role + message + self.sep
-                else:
-                    ret += role
-            return ret
-        elif self.sep_style == SeparatorStyle.NO_COLON_TWO:
-            seps = [self.sep, self.sep2]
-            ret = system_prompt
-            for i, (role, message) in enumerate(self.messages):
-                if message:
-                    ret += role + message + seps[i % 2]
-                else:
-                    ret += role
-            return ret
-        elif self.sep_style == SeparatorStyle.RWKV:
-            ret = system_prompt
-            for i, (role, message) in enumerate(self.messages):
-                if message:
-                    ret += (
-                        role
-                        + ": "
-                        + message.replace("\r\n", "\n").replace("\n\n", "\n")
-                    )
-                    ret += "\n\n"
-                else:
-                    ret += role + ":"
-            return ret
-        elif self.sep_style == SeparatorStyle.LLAMA2:
-            seps = [self.sep, self.sep2]
-            if self.system_message:
-                ret = system_prompt
-            else:
-                ret = "[INST] "
-            for i, (role, message) in enumerate(self.messages):
-                tag = self.roles[i % 2]
-                if message:
-                    if i == 0:
-                        ret += message + " "
-                    else:
-                        ret += tag + " " + message + seps[i % 2]
-                else:
-                    ret += tag
-            return ret
-        elif self.sep_style == SeparatorStyle.LLAMA3:
-            ret = "<|begin_of_text|>"
-            if self.system_message:
-                ret += system_prompt
-            else:
-                ret += ""
-            for i, (role, message) in enumerate(self.messages):
-                if message:
-                    ret += f"<|start_header_id|>{role}<|end_header_id|>\n\n"
-                    ret += f"{message.strip()}<|eot_id|>"
-                else:
-                    ret += f"<|start_header_id|>{role}<|end_header_id|>\n\n"
-            return ret
-        elif self.sep_style == SeparatorStyle.CHATGLM:
-            # source: https://huggingface.co/THUDM/chatglm-6b/blob/1d240ba371910e9282298d4592532d7f0f3e9f3e/modeling_chatglm.py#L1302-L1308
-            # source2: https://huggingface.co/THUDM/chatglm2-6b/blob/e186c891cf64310ac66ef10a87e6635fa6c2a579/modeling_chatglm.py#L926
-            round_add_n = 1 if self.name == "chatglm2" else 0
-            if system_prompt:
-                ret = system_prompt + self.sep
-            else:
-                ret = ""
-
-            for i, (role, message) in enumerate(self.messages):
-                if i % 2 == 0:
-                    ret += f"[Round {i//2 + round_add_n}]{self.sep}"
-
-                if message:
-                    ret += f"{role}：{message}{self.sep}"
-                else:
-                    ret += f"{role}："
-            return ret
-        elif self.sep_style == SeparatorStyle.CHATML:
-            ret = "" if system_prompt == "" else system_prompt + self.sep + "\n"
-            for role, message in self.messages:
-                if message:
-                    if type(message) is tuple:
-                        message, images = message
-                        message = IMAGE_PLACEHOLDER_STR * len(images) + message
-                    ret += role + "\n" + message + self.sep + "\n"
-                else:
-                    ret += role + "\n"
-            return ret
-        elif self.sep_style == SeparatorStyle.CHATGLM3:
-            ret = ""
-            if self.system_message:
-                ret += system_prompt
-            for role, message in self.messages:
-                if message:
-                    ret += role + "\n" + message
-                else:
-                    ret += role
-            return ret
-        elif self.sep_style == SeparatorStyle.CHATINTERN:
-            # source: https://huggingface.co/internlm/internlm-chat-7b-8k/blob/bd546fa984b4b0b86958f56bf37f94aa75ab8831/modeling_internlm.py#L771
-            seps = [self.sep, self.sep2]
-            ret = system_prompt
-            for i, (role, message) in enumerate(self.messages):
-                if i % 2 == 0:
-                    ret += "<s>"
-                if message:
-                    ret += role + ":" + message + seps[i % 2] + "\n"
-                else:
-                    ret += role + ":"
-            return ret
-        elif self.sep_style == SeparatorStyle.DOLLY:
-            seps = [self.sep, self.sep2]
-            ret = system_prompt
-            for i, (role, message) in enumerate(self.messages):
-                if message:
-                    ret += role + ":\n" + message + seps[i % 2]
-                    if i % 2 == 1:
-                        ret += "\n\n"
-                else:
-                    ret += role + ":\n"
-            return ret
-        elif self.sep_style == SeparatorStyle.PHOENIX:
-            ret = system_prompt
-            for role, message in self.messages:
-                if message:
-                    ret += role + ": " + "<s>" + message + "</s>"
-                else:
-                    ret += role + ": " + "<s>"
-            return ret
-        elif self.sep_style == SeparatorStyle.ROBIN:
-            ret = system_prompt + self.sep
-            for role, message in self.messages:
-                if message:
-                    ret += role + ":\n" + message + self.sep
-                else:
-                    ret += role + ":\n"
-            return ret
-        elif self.sep_style == SeparatorStyle.FALCON_CHAT:
-            ret = ""
-            if self.system_message:
-                ret += system_prompt + self.sep
-            for role, message in self.messages:
-                if message:
-                    ret += role + ": " + message + self.sep
-                else:
-                    ret += role + ":"
-            return ret
-        elif self.sep_style == SeparatorStyle.METAMATH:
-            ret = "" if system_prompt == "" else system_prompt + self.sep
-            for i, (role, message) in enumerate(self.messages):
-                # For MetaMath, sep2 is used to prefix the message.
-                starting_sep = ":\n" if i % 2 == 0 else ": " + self.sep2
-                ending_sep = self.sep if i % 2 == 0 else ""
-                if message:
-                    ret += role + starting_sep + message + ending_sep
-                else:
-                    ret += role + starting_sep
-            return ret
-        elif self.sep_style == SeparatorStyle.DEEPSEEK_CHAT:
-            seps = [self.sep, self.sep2]
-            ret = system_prompt
-            for i, (role, message) in enumerate(self.messages):
-                if message:
-                    ret += role + ": " + message + seps[i % 2]
-                else:
-                    ret += role + ":"
-            return ret
-        elif self.sep_style == SeparatorStyle.YUAN2:
-            seps = [self.sep, self.sep2]
-            ret = ""
-            if self.system_message:
-                ret += system_prompt + seps[1]
-            for _, message in self.messages:
-                if message:
-                    ret += message + "<n>"
-                else:
-                    ret += ""
-            ret = ret.rstrip("<n>") + seps[0]
-            return ret
-        elif self.sep_style == SeparatorStyle.GEMMA:
-            ret = "<bos>"
-            for role, message in self.messages:
-                if message:
-                    ret += "<start_of_turn>" + role + "\n" + message + self.sep
-                else:
-                    ret += "<start_of_turn>" + role + "\n"
-            return ret
-        elif self.sep_style == SeparatorStyle.CLLM:
-            seps = [self.sep, self.sep2]
-            ret = system_prompt + seps[0]
-            for i, (role, message) in enumerate(self.messages[-2:]):
-                if message:
-                    if type(message) is tuple:
-                        message, images = message
-                        message = IMAGE_PLACEHOLDER_STR * len(images) + message
-                    ret += role + ": " + message + seps[i % 2]
-                else:
-                    ret += role + ":"
-            return ret
-        elif self.sep_style == SeparatorStyle.DEFAULT:
-            ret = system_prompt + "\n"
-            for role, message in self.messages:
-                if message:
-                    if type(message) is tuple:
-                        message, images = message
-                    ret += role + ": " + message + "\n"
-                else:
-                    ret += role + ":"
-            return ret
+        """Get the prompt for generation. Only messages changed since the last call are rendered."""
+        renderer = self.get_renderer()
+        if renderer.render is not None:
+            return renderer.render(self)
+        if self.messages:
+            role, message = self.messages[0]
+            cached = (
+                self._segment_sources[0]
+                if self._segment_sources
+                else self._first_source
+            )
+            if cached is not None and cached[0] == role and cached[1] is message:
+                self._update_segments(renderer)
+                return self._header + "".join(self._segments)
+            self._first_source = (role, message)
         else:
-            raise ValueError(f"Invalid style: {self.sep_style}")
+            self._first_source = None
+        # No cached prefix to reuse, e.g. a fresh conversation per sample
+        self._segment_sources = []
+        self._segments = []
+        return self._render(renderer)
+
+    def render_prompt(self) -> str:
+        """Render the whole prompt without the cache of get_prompt."""
+        renderer = self.get_renderer()
+        if renderer.render is not None:
+            return renderer.render(self)
+        return self._render(renderer)
+
+    def _render(self, renderer: PromptRenderer) -> str:
+        system_prompt = self.system_template.format(system_message=self.system_message)
+        parts = [renderer.header(self, system_prompt)]
+        for i, (role, message) in enumerate(self.messages):
+            parts.append(renderer.render_segment(self, i, role, message))
+        return "".join(parts)
+
+    def _update_segments(self, renderer: PromptRenderer):
+        style_key = (self.name, tuple(self.roles), self.sep, self.sep2)
+        if style_key != self._style_key:
+            self._style_key = style_key
+            self._header_key = None
+            self._segment_sources = []
+            self._segments = []
+
+        header_key = (self.system_template, self.system_message)
+        if header_key != self._header_key:
+            self._header = renderer.header(
+                self, self.system_template.format(system_message=self.system_message)
+            )
+            self._header_key = header_key
+
+        sources = self._segment_sources
+        start = 0
+        for role, message in self.messages:
+            if (
+                start == len(sources)
+                or sources[start][0] != role
+                or sources[start][1] is not message
+            ):
+                break
+            start += 1
+        del sources[start:]
+        del self._segments[start:]
+        for i in range(start, len(self.messages)):
+            role, message = self.messages[i]
+            sources.append((role, message))
+            self._segments.append(renderer.render_segment(self, i, role, message))
 
     def get_images(self):
         images = []
@@ -359,23 +416,99 @@ class Conversation:
         """
         self.messages[-1][1] = message
 
+    def get_budget_texts(self) -> List[str]:
+        """Return the rendered system prompt and the texts of all messages."""
+        texts = [self.system_template.format(system_message=self.system_message)]
+        for _, msg in self.messages:
+            if type(msg) is tuple:
+                msg = msg[0]
+            texts.append(msg or "")
+        return texts
+
+    def get_token_upper_bound(self, message_overhead: int = 8) -> int:
+        """
+        Bound the prompt length in tokens without a tokenizer. A token of a
+        byte-level tokenizer covers at least one byte, so the UTF-8 size is an
+        upper bound.
+        """
+        texts = self.get_budget_texts()
+        return sum(len(text.encode()) for text in texts) + message_overhead * len(texts)
+
+    def get_uncounted_texts(self) -> List[str]:
+        """Return the texts without a cached token count."""
+        return [
+            text for text in self.get_budget_texts() if text not in self.token_counts
+        ]
+
+    def fit_to_token_budget(
+        self,
+        max_tokens: int,
+        count_tokens: Optional[Callable[[str], int]] = None,
+        message_overhead: int = 8,
+    ) -> int:
+        """Drop the oldest turns until the prompt fits in max_tokens.
+
+        The system message, the few shot examples and the latest user turn are
+        always kept. A message is estimated at its text's token count, cached in
+        token_counts, plus message_overhead tokens for its role and separators.
+        Texts missing from the cache are counted with count_tokens.
+        Returns the number of dropped messages.
+        """
+        if self.get_token_upper_bound(message_overhead) <= max_tokens:
+            return 0
+
+        texts = self.get_budget_texts()
+        for text in texts:
+            if text not in self.token_counts:
+                self.token_counts[text] = count_tokens(text)
+        # Keep only the counts of current texts, so the cache does not grow.
+        self.token_counts = {text: self.token_counts[text] for text in texts}
+        sizes = [self.token_counts[text] + message_overhead for text in texts]
+        total = sum(sizes)
+
+        # sizes[0] is the system prompt, sizes[i + 1] is self.messages[i].
+        last_user = max(
+            (
+                i
+                for i in range(self.offset, len(self.messages))
+                if self.messages[i][0] == self.roles[0]
+            ),
+            default=len(self.messages),
+        )
+        start = self.offset
+        while total > max_tokens and start < last_user:
+            total -= sizes[start + 1]
+            start += 1
+            # Do not start the kept history with an assistant message.
+            while start < last_user and self.messages[start][0] != self.roles[0]:
+                total -= sizes[start + 1]
+                start += 1
+
+        num_dropped = start - self.offset
+        del self.messages[self.offset : start]
+        return num_dropped
+
+    @staticmethod
+    def to_gradio_user_message(msg):
+        """Convert a user message to gradio chatbot format, inlining its image if any."""
+        if type(msg) is tuple:
+            from fastchat.serve.vision.image import ImageFormat
+
+            msg, images = msg
+            image = images[0]  # Only one image on gradio at one time
+            if image.image_format == ImageFormat.URL:
+                img_str = f'<img src="{image.url}" alt="user upload image" />'
+            elif image.image_format == ImageFormat.BYTES:
+                img_str = f'<img src="data:image/{image.filetype};base64,{image.base64_str}" alt="user upload image" />'
+            msg = img_str + msg.replace("<image>\n", "").strip()
+        return msg
+
     def to_gradio_chatbot(self):
         """Convert the conversation to gradio chatbot format."""
-        from fastchat.serve.vision.image import ImageFormat
-
         ret = []
         for i, (role, msg) in enumerate(self.messages[self.offset :]):
             if i % 2 == 0:
-                if type(msg) is tuple:
-                    msg, images = msg
-                    image = images[0]  # Only one image on gradio at one time
-                    if image.image_format == ImageFormat.URL:
-                        img_str = f'<img src="{image.url}" alt="user upload image" />'
-                    elif image.image_format == ImageFormat.BYTES:
-                        img_str = f'<img src="data:image/{image.filetype};base64,{image.base64_str}" alt="user upload image" />'
-                    msg = img_str + msg.replace("<image>\n", "").strip()
-
-                ret.append([msg, None])
+                ret.append([self.to_gradio_user_message(msg), None])
             else:
                 ret[-1][-1] = msg
         return ret
@@ -665,7 +798,7 @@ class Conversation:
         return messages
 
     def copy(self):
-        return Conversation(
+        conv = Conversation(
             name=self.name,
             system_template=self.system_template,
             system_message=self.system_message,
@@ -679,7 +812,11 @@ class Conversation:
             stop_str=self.stop_str,
             stop_token_ids=self.stop_token_ids,
             max_image_size_mb=self.max_image_size_mb,
+            token_counts=dict(self.token_counts),
         )
+        conv._renderer = self._renderer
+        conv._renderer_style = self._renderer_style
+        return conv
 
     def dict(self):
         return {
@@ -702,6 +839,9 @@ def register_conv_template(template: Conversation, override: bool = False):
             template.name not in conv_templates
         ), f"{template.name} has been registered."
 
+    if template.sep_style in PROMPT_RENDERERS:
+        # Select the renderer once; copies of the template inherit it.
+        template.get_renderer()
     conv_templates[template.name] = template
 
 
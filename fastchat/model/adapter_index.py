@@ -0,0 +1,76 @@
+"""
+An index over the match() rules of the model adapters.
+
+get_model_adapter returns the first registered adapter whose match() accepts
+a model path. Most match() methods only test whether the lowercased path
+contains one of a few strings, and those adapters declare the strings as
+their keywords. The keywords are indexed by their first characters. A lookup
+then calls match() only on the adapters that have a keyword in the path,
+plus the ones without keywords, in registration order. This gives the same
+result as trying every adapter in turn.
+"""
+from typing import Dict, List, Optional, Set, Tuple
+
+# Keywords are indexed by this many leading characters
+PREFIX_LEN = 3
+
+
+def get_keywords(cls: type) -> Optional[Set[str]]:
+    """
+    The keywords declared by the class that defines the match() of cls. None
+    if it declares none, so a subclass that overrides match() without
+    declaring keywords does not inherit the keywords of its parent.
+    """
+    for klass in cls.__mro__:
+        if "match" in vars(klass):
+            keywords = vars(klass).get("keywords")
+            break
+    else:
+        return None
+    if keywords is None:
+        return None
+    keywords = {keyword.lower() for keyword in keywords}
+    return None if "" in keywords else keywords
+
+
+class AdapterIndex:
+    def __init__(self, adapters: List):
+        self.adapters = list(adapters)
+        # Keywords of each adapter, None if it must always be tried
+        self.keywords: List[Optional[Set[str]]] = []
+        # Dict[leading characters -> List[(keyword, adapter position)]]
+        self.by_prefix: Dict[str, List[Tuple[str, int]]] = {}
+        # Positions of the adapters without keywords
+        self.always: List[int] = []
+
+        for pos, adapter in enumerate(self.adapters):
+            keywords = get_keywords(type(adapter))
+            self.keywords.append(keywords)
+            if keywords is None or any(len(k) < PREFIX_LEN for k in keywords):
+                self.always.append(pos)
+                continue
+            for keyword in keywords:
+                self.by_prefix.setdefault(keyword[:PREFIX_LEN], []).append(
+                    (keyword, pos)
+                )
+
+    def candidates(self, model_path: str) -> List[int]:
+        """Positions of the adapters that may match model_path, in order."""
+        lowered = model_path.lower()
+        prefixes = {
+            lowered[i : i + PREFIX_LEN] for i in range(len(lowered) - PREFIX_LEN + 1)
+        }
+        found = set(self.always)
+        for prefix in self.by_prefix.keys() & prefixes:
+            for keyword, pos in self.by_prefix[prefix]:
+                if pos not in found and keyword in lowered:
+                    found.add(pos)
+        return sorted(found)
+
+    def find(self, model_path: str, exclude: Optional[type] = None):
+        """The first adapter that matches model_path, skipping instances of exclude."""
+        for pos in self.candidates(model_path):
+            adapter = self.adapters[pos]
+            if type(adapter) is not exclude and adapter.match(model_path):
+                return adapter
+        return None
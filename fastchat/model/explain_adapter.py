@@ -0,0 +1,122 @@
+"""
+Show which model adapter and conversation template a model path resolves to.
+
+Usage:
+python3 -m fastchat.model.explain_adapter lmsys/vicuna-7b-v1.5 meta-llama/Llama-3.1-8B-Instruct
+"""
+import argparse
+import os
+import time
+
+from fastchat.model import model_adapter
+from fastchat.model.model_adapter import (
+    BaseModelAdapter,
+    PeftModelAdapter,
+    get_model_adapter,
+    get_model_adapter_index,
+    get_peft_base_model_path,
+)
+
+
+def linear_scan(model_path: str) -> BaseModelAdapter:
+    """The lookup that the index replaces: try every adapter in turn."""
+    model_path_basename = os.path.basename(os.path.normpath(model_path))
+    for adapter in model_adapter.model_adapters:
+        if adapter.match(model_path_basename) and type(adapter) != BaseModelAdapter:
+            return adapter
+    for adapter in model_adapter.model_adapters:
+        if adapter.match(model_path):
+            return adapter
+
+
+def explain_model_adapter(model_path: str, repeat: int = 1000):
+    """Print which adapter matches model_path, why, and how long the lookup takes."""
+    built = model_adapter.model_adapter_index is None
+    tic = time.perf_counter()
+    index = get_model_adapter_index()
+    build_time = time.perf_counter() - tic
+
+    model_path_basename = os.path.basename(os.path.normpath(model_path))
+    resolve = get_model_adapter.__wrapped__
+    try:
+        adapter = resolve(model_path)
+    except ValueError as e:
+        print(f"{model_path}: {e}")
+        return
+    pos = index.adapters.index(adapter)
+    keywords = index.keywords[pos]
+
+    # Count the match() calls of both lookups. Both try the basename first, so
+    # a match on the full path also pays for the whole basename pass.
+    basename_tried = [
+        i
+        for i in index.candidates(model_path_basename)
+        if type(index.adapters[i]) is not BaseModelAdapter
+    ]
+    if adapter.match(model_path_basename) and type(adapter) != BaseModelAdapter:
+        matched = model_path_basename
+        num_indexed = basename_tried.index(pos) + 1
+        num_linear = pos + 1
+    else:
+        matched = model_path
+        num_indexed = len(basename_tried) + index.candidates(model_path).index(pos) + 1
+        num_linear = len(index.adapters) + pos + 1
+
+    timings = {}
+    for name, func in (("indexed", resolve), ("linear", linear_scan)):
+        tic = time.perf_counter()
+        for _ in range(repeat):
+            func(model_path)
+        timings[name] = (time.perf_counter() - tic) / repeat
+    get_model_adapter(model_path)
+    tic = time.perf_counter()
+    for _ in range(repeat):
+        get_model_adapter(model_path)
+    timings["cached"] = (time.perf_counter() - tic) / repeat
+
+    try:
+        template = adapter.get_default_conv_template(model_path).name
+    except Exception as e:
+        template = f"unavailable ({e})"
+
+    print(f"model path:     {model_path}")
+    print(f"adapter:        {type(adapter).__name__} (#{pos} of {len(index.adapters)})")
+    print(f"matched on:     {matched!r}")
+    if keywords is None:
+        print("keywords:       none, always tried")
+    else:
+        found = sorted(k for k in keywords if k in matched.lower())
+        print(f"keywords:       {', '.join(found)} ({len(keywords)} in total)")
+    print(
+        f"adapters tried: {num_indexed} with the index, "
+        f"{num_linear} with a linear scan"
+    )
+    if isinstance(adapter, PeftModelAdapter):
+        try:
+            print(f"peft base:      {get_peft_base_model_path(model_path)}")
+        except Exception as e:
+            print(f"peft base:      unavailable ({e})")
+    print(f"conv template:  {template}")
+    if built:
+        print(f"index build:    {build_time * 1e3:.2f} ms (once per process)")
+    for name, seconds in timings.items():
+        print(f"{name + ' lookup:':<16}{seconds * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Show which model adapter and conversation template a model path resolves to."
+    )
+    parser.add_argument("model_paths", type=str, nargs="+", metavar="MODEL_PATH")
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1000,
+        help="Number of lookups to average the timings over.",
+    )
+    args = parser.parse_args()
+
+    for i, model_path in enumerate(args.model_paths):
+        if i:
+            print()
+        explain_model_adapter(model_path, args.repeat)
@@ -4,7 +4,7 @@ import math
 import os
 import re
 import sys
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 import warnings
 
 if sys.version_info >= (3, 9):
@@ -12,39 +12,22 @@ if sys.version_info >= (3, 9):
 else:
     from functools import lru_cache as cache
 
-import psutil
-import torch
-from transformers import (
-    AutoConfig,
-    AutoModel,
-    AutoModelForCausalLM,
-    AutoModelForSeq2SeqLM,
-    AutoTokenizer,
-    LlamaTokenizer,
-    LlamaForCausalLM,
-    T5Tokenizer,
-)
-
 from fastchat.constants import CPU_ISA
 from fastchat.conversation import Conversation, get_conv_template
-from fastchat.model.compression import load_compress_model
-from fastchat.model.llama_condense_monkey_patch import replace_llama_with_condense
-from fastchat.model.model_chatglm import generate_stream_chatglm
-from fastchat.model.model_codet5p import generate_stream_codet5p
-from fastchat.model.model_falcon import generate_stream_falcon
-from fastchat.model.model_yuan2 import generate_stream_yuan2
-from fastchat.model.model_exllama import generate_stream_exllama
-from fastchat.model.model_xfastertransformer import generate_stream_xft
-from fastchat.model.model_cllm import generate_stream_cllm
-
-from fastchat.model.monkey_patch_non_inplace import (
-    replace_llama_attn_with_non_inplace_operations,
-)
-from fastchat.modules.awq import AWQConfig, load_awq_quantized
-from fastchat.modules.exllama import ExllamaConfig, load_exllama_model
-from fastchat.modules.xfastertransformer import load_xft_model, XftConfig
-from fastchat.modules.gptq import GptqConfig, load_gptq_quantized
-from fastchat.utils import get_gpu_memory
+from fastchat.model.adapter_index import AdapterIndex
+from fastchat.utils import LazyModule, get_gpu_memory
+
+# The web and API servers import this module for the conversation templates
+# only, so the model libraries and loaders are imported when first used.
+psutil = LazyModule("psutil")
+torch = LazyModule("torch")
+transformers = LazyModule("transformers")
+
+if TYPE_CHECKING:
+    from fastchat.modules.awq import AWQConfig
+    from fastchat.modules.exllama import ExllamaConfig
+    from fastchat.modules.gptq import GptqConfig
+    from fastchat.modules.xfastertransformer import XftConfig
 
 # Check an environment variable to check if we should be sharing Peft model
 # weights.  When false we treat all Peft models as separate.
@@ -98,6 +81,11 @@ class BaseModelAdapter:
     """The base and the default model adapter."""
 
     use_fast_tokenizer = True
+    # Lowercase strings such that match() only accepts a path whose lowercase
+    # form contains one of them. The adapter index only tries an adapter on the
+    # paths that contain one of its keywords. None means it is always tried, so
+    # an adapter that overrides match() must declare keywords next to it.
+    keywords: Optional[Tuple[str, ...]] = None
 
     def match(self, model_path: str):
         return True
@@ -105,25 +93,25 @@ class BaseModelAdapter:
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
         try:
-            tokenizer = AutoTokenizer.from_pretrained(
+            tokenizer = transformers.AutoTokenizer.from_pretrained(
                 model_path,
                 use_fast=self.use_fast_tokenizer,
                 revision=revision,
                 trust_remote_code=True,
             )
         except TypeError:
-            tokenizer = AutoTokenizer.from_pretrained(
+            tokenizer = transformers.AutoTokenizer.from_pretrained(
                 model_path, use_fast=False, revision=revision, trust_remote_code=True
             )
         try:
-            model = AutoModelForCausalLM.from_pretrained(
+            model = transformers.AutoModelForCausalLM.from_pretrained(
                 model_path,
                 low_cpu_mem_usage=True,
                 trust_remote_code=True,
                 **from_pretrained_kwargs,
             )
         except NameError:
-            model = AutoModel.from_pretrained(
+            model = transformers.AutoModel.from_pretrained(
                 model_path,
                 low_cpu_mem_usage=True,
                 trust_remote_code=True,
@@ -132,6 +120,8 @@ class BaseModelAdapter:
         return model, tokenizer
 
     def load_compress_model(self, model_path, device, torch_dtype, revision="main"):
+        from fastchat.model.compression import load_compress_model
+
         return load_compress_model(
             model_path,
             device,
@@ -147,27 +137,42 @@ class BaseModelAdapter:
 # A global registry for all model adapters
 # TODO (lmzheng): make it a priority queue.
 model_adapters: List[BaseModelAdapter] = []
+# Keyword index over model_adapters, built on the first lookup
+model_adapter_index: Optional[AdapterIndex] = None
 
 
 def register_model_adapter(cls):
     """Register a model adapter."""
+    global model_adapter_index
+
     model_adapters.append(cls())
+    model_adapter_index = None
+    get_model_adapter.cache_clear()
+
+
+def get_model_adapter_index() -> AdapterIndex:
+    global model_adapter_index
+
+    if model_adapter_index is None:
+        model_adapter_index = AdapterIndex(model_adapters)
+    return model_adapter_index
 
 
 @cache
 def get_model_adapter(model_path: str) -> BaseModelAdapter:
     """Get a model adapter for a model_path."""
+    index = get_model_adapter_index()
     model_path_basename = os.path.basename(os.path.normpath(model_path))
 
     # Try the basename of model_path at first
-    for adapter in model_adapters:
-        if adapter.match(model_path_basename) and type(adapter) != BaseModelAdapter:
-            return adapter
+    adapter = index.find(model_path_basename, exclude=BaseModelAdapter)
+    if adapter is not None:
+        return adapter
 
     # Then try the full path
-    for adapter in model_adapters:
-        if adapter.match(model_path):
-            return adapter
+    adapter = index.find(model_path)
+    if adapter is not None:
+        return adapter
 
     raise ValueError(f"No valid model adapter for {model_path}")
 
@@ -203,13 +208,13 @@ def load_model(
     device: str = "cuda",
     num_gpus: int = 1,
     max_gpu_memory: Optional[str] = None,
-    dtype: Optional[torch.dtype] = None,
+    dtype: Optional["torch.dtype"] = None,
     load_8bit: bool = False,
     cpu_offloading: bool = False,
-    gptq_config: Optional[GptqConfig] = None,
-    awq_config: Optional[AWQConfig] = None,
-    exllama_config: Optional[ExllamaConfig] = None,
-    xft_config: Optional[XftConfig] = None,
+    gptq_config: Optional["GptqConfig"] = None,
+    awq_config: Optional["AWQConfig"] = None,
+    exllama_config: Optional["ExllamaConfig"] = None,
+    xft_config: Optional["XftConfig"] = None,
     revision: str = "main",
     debug: bool = False,
 ):
@@ -251,8 +256,6 @@ def load_model(
                 kwargs["max_memory"] = {i: max_gpu_memory for i in range(num_gpus)}
     elif device == "mps":
         kwargs = {"torch_dtype": torch.float16}
-        import transformers
-
         version = tuple(int(v) for v in transformers.__version__.split("."))
         if version < (4, 35, 0):
             # NOTE: Recent transformers library seems to fix the mps issue, also
@@ -260,6 +263,10 @@ def load_model(
             # original patch. So we only apply the patch for older versions.
 
             # Avoid bugs in mps backend by not using in-place operations.
+            from fastchat.model.monkey_patch_non_inplace import (
+                replace_llama_attn_with_non_inplace_operations,
+            )
+
             replace_llama_attn_with_non_inplace_operations()
     elif device == "xpu":
         kwargs = {"torch_dtype": torch.bfloat16}
@@ -311,6 +318,8 @@ def load_model(
         assert (
             awq_config.wbits == 4
         ), "Currently we only support 4-bit inference for AWQ."
+        from fastchat.modules.awq import load_awq_quantized
+
         model, tokenizer = load_awq_quantized(model_path, awq_config, device)
         if num_gpus != 1:
             device_map = accelerate.infer_auto_device_map(
@@ -331,6 +340,8 @@ def load_model(
             model.to(device)
         return model, tokenizer
     elif gptq_config and gptq_config.wbits < 16:
+        from fastchat.modules.gptq import load_gptq_quantized
+
         model, tokenizer = load_gptq_quantized(model_path, gptq_config)
         if num_gpus != 1:
             device_map = accelerate.infer_auto_device_map(
@@ -345,9 +356,13 @@ def load_model(
             model.to(device)
         return model, tokenizer
     elif exllama_config:
+        from fastchat.modules.exllama import load_exllama_model
+
         model, tokenizer = load_exllama_model(model_path, exllama_config)
         return model, tokenizer
     elif xft_config:
+        from fastchat.modules.xfastertransformer import load_xft_model
+
         model, tokenizer = load_xft_model(model_path, xft_config)
         return model, tokenizer
     kwargs["revision"] = revision
@@ -401,9 +416,16 @@ def get_conversation_template(model_path: str) -> Conversation:
     return adapter.get_default_conv_template(model_path)
 
 
-def get_generate_stream_function(model: torch.nn.Module, model_path: str):
+def get_generate_stream_function(model: "torch.nn.Module", model_path: str):
     """Get the generate_stream function for inference."""
     from fastchat.serve.inference import generate_stream
+    from fastchat.model.model_chatglm import generate_stream_chatglm
+    from fastchat.model.model_codet5p import generate_stream_codet5p
+    from fastchat.model.model_falcon import generate_stream_falcon
+    from fastchat.model.model_yuan2 import generate_stream_yuan2
+    from fastchat.model.model_exllama import generate_stream_exllama
+    from fastchat.model.model_xfastertransformer import generate_stream_xft
+    from fastchat.model.model_cllm import generate_stream_cllm
 
     model_type = str(type(model)).lower()
     is_peft = "peft" in model_type
@@ -627,6 +649,20 @@ def remove_parent_directory_name(model_path):
 peft_model_cache = {}
 
 
+@cache
+def get_peft_base_model_path(model_path: str) -> str:
+    """Read the base model of a peft adapter from its config."""
+    from peft import PeftConfig
+
+    config = PeftConfig.from_pretrained(model_path)
+    base_model_path = config.base_model_name_or_path
+    if "peft" in base_model_path:
+        raise ValueError(
+            f"PeftModelAdapter cannot load a base model with 'peft' in the name: {base_model_path}"
+        )
+    return base_model_path
+
+
 class PeftModelAdapter:
     """Loads any "peft" model and it's base model."""
 
@@ -638,14 +674,9 @@ class PeftModelAdapter:
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         """Loads the base model then the (peft) adapter weights"""
-        from peft import PeftConfig, PeftModel
+        from peft import PeftModel
 
-        config = PeftConfig.from_pretrained(model_path)
-        base_model_path = config.base_model_name_or_path
-        if "peft" in base_model_path:
-            raise ValueError(
-                f"PeftModelAdapter cannot load a base model with 'peft' in the name: {config.base_model_name_or_path}"
-            )
+        base_model_path = get_peft_base_model_path(model_path)
 
         # Basic proof of concept for loading peft adapters that share the base
         # weights.  This is pretty messy because Peft re-writes the underlying
@@ -687,32 +718,26 @@ class PeftModelAdapter:
 
     def get_default_conv_template(self, model_path: str) -> Conversation:
         """Uses the conv template of the base model"""
-        from peft import PeftConfig, PeftModel
-
-        config = PeftConfig.from_pretrained(model_path)
-        if "peft" in config.base_model_name_or_path:
-            raise ValueError(
-                f"PeftModelAdapter cannot load a base model with 'peft' in the name: {config.base_model_name_or_path}"
-            )
-        base_model_path = config.base_model_name_or_path
+        base_model_path = get_peft_base_model_path(model_path)
         base_adapter = get_model_adapter(base_model_path)
-        return base_adapter.get_default_conv_template(config.base_model_name_or_path)
+        return base_adapter.get_default_conv_template(base_model_path)
 
 
 class VicunaAdapter(BaseModelAdapter):
     "Model adapter for Vicuna models (e.g., lmsys/vicuna-7b-v1.5)" ""
 
     use_fast_tokenizer = False
+    keywords = ("vicuna",)
 
     def match(self, model_path: str):
         return "vicuna" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path, use_fast=self.use_fast_tokenizer, revision=revision
         )
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             low_cpu_mem_usage=True,
             **from_pretrained_kwargs,
@@ -726,7 +751,10 @@ class VicunaAdapter(BaseModelAdapter):
         return get_conv_template("vicuna_v1.1")
 
     def raise_warning_for_old_weights(self, model):
-        if isinstance(model, LlamaForCausalLM) and model.model.vocab_size > 32000:
+        if (
+            isinstance(model, transformers.LlamaForCausalLM)
+            and model.model.vocab_size > 32000
+        ):
             warnings.warn(
                 "\nYou are probably using the old Vicuna-v0 model, "
                 "which will generate unexpected results with the "
@@ -740,6 +768,8 @@ class VicunaAdapter(BaseModelAdapter):
 class AiroborosAdapter(BaseModelAdapter):
     """The model adapter for jondurbin/airoboros-*"""
 
+    keywords = ("airoboros", "spicyboros")
+
     def match(self, model_path: str):
         if re.search(r"airoboros|spicyboros", model_path, re.I):
             return True
@@ -755,14 +785,14 @@ class AiroborosAdapter(BaseModelAdapter):
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         if "mpt" not in model_path.lower():
             return super().load_model(model_path, from_pretrained_kwargs)
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             low_cpu_mem_usage=True,
             trust_remote_code=True,
             max_seq_len=8192,
             **from_pretrained_kwargs,
         )
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path, trust_remote_code=True, use_fast=True
         )
         return model, tokenizer
@@ -772,6 +802,7 @@ class LongChatAdapter(BaseModelAdapter):
     "Model adapter for LongChat models (e.g., lmsys/longchat-7b-16k)."
 
     use_fast_tokenizer = False
+    keywords = ("longchat",)
 
     def match(self, model_path: str):
         return "longchat" in model_path.lower()
@@ -780,13 +811,17 @@ class LongChatAdapter(BaseModelAdapter):
         revision = from_pretrained_kwargs.get("revision", "main")
 
         # Apply monkey patch, TODO(Dacheng): Add flash attention support
-        config = AutoConfig.from_pretrained(model_path, revision=revision)
+        from fastchat.model.llama_condense_monkey_patch import (
+            replace_llama_with_condense,
+        )
+
+        config = transformers.AutoConfig.from_pretrained(model_path, revision=revision)
         replace_llama_with_condense(config.rope_scaling["factor"])
 
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path, use_fast=self.use_fast_tokenizer, revision=revision
         )
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             low_cpu_mem_usage=True,
             **from_pretrained_kwargs,
@@ -800,6 +835,8 @@ class LongChatAdapter(BaseModelAdapter):
 class GoogleT5Adapter(BaseModelAdapter):
     """The model adapter for google/Flan based models, such as Salesforce/codet5p-6b, lmsys/fastchat-t5-3b-v1.0, flan-t5-*, flan-ul2"""
 
+    keywords = ("codet5p", "fastchat-t5", "flan-")
+
     def match(self, model_path: str):
         return any(
             model_str in model_path.lower()
@@ -808,8 +845,10 @@ class GoogleT5Adapter(BaseModelAdapter):
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        tokenizer = T5Tokenizer.from_pretrained(model_path, revision=revision)
-        model = AutoModelForSeq2SeqLM.from_pretrained(
+        tokenizer = transformers.T5Tokenizer.from_pretrained(
+            model_path, revision=revision
+        )
+        model = transformers.AutoModelForSeq2SeqLM.from_pretrained(
             model_path,
             low_cpu_mem_usage=True,
             trust_remote_code=True,
@@ -822,6 +861,7 @@ class KoalaAdapter(BaseModelAdapter):
     """The model adapter for Koala"""
 
     use_fast_tokenizer = False
+    keywords = ("koala",)
 
     def match(self, model_path: str):
         return "koala" in model_path.lower()
@@ -834,6 +874,7 @@ class AlpacaAdapter(BaseModelAdapter):
     """The model adapter for Alpaca"""
 
     use_fast_tokenizer = False
+    keywords = ("alpaca",)
 
     def match(self, model_path: str):
         return "alpaca" in model_path.lower()
@@ -845,23 +886,25 @@ class AlpacaAdapter(BaseModelAdapter):
 class ChatGLMAdapter(BaseModelAdapter):
     """The model adapter for THUDM/chatglm-6b, THUDM/chatglm2-6b"""
 
+    keywords = ("chatglm",)
+
     def match(self, model_path: str):
         return "chatglm" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
         if "chatglm3" in model_path.lower():
-            tokenizer = AutoTokenizer.from_pretrained(
+            tokenizer = transformers.AutoTokenizer.from_pretrained(
                 model_path,
                 encode_special_tokens=True,
                 trust_remote_code=True,
                 revision=revision,
             )
         else:
-            tokenizer = AutoTokenizer.from_pretrained(
+            tokenizer = transformers.AutoTokenizer.from_pretrained(
                 model_path, trust_remote_code=True, revision=revision
             )
-        model = AutoModel.from_pretrained(
+        model = transformers.AutoModel.from_pretrained(
             model_path, trust_remote_code=True, **from_pretrained_kwargs
         )
         return model, tokenizer
@@ -878,15 +921,17 @@ class ChatGLMAdapter(BaseModelAdapter):
 class CodeGeexAdapter(BaseModelAdapter):
     """The model adapter for THUDM/codegeex-6b, THUDM/codegeex2-6b"""
 
+    keywords = ("codegeex",)
+
     def match(self, model_path: str):
         return "codegeex" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path, trust_remote_code=True, revision=revision
         )
-        model = AutoModel.from_pretrained(
+        model = transformers.AutoModel.from_pretrained(
             model_path, trust_remote_code=True, **from_pretrained_kwargs
         )
         return model, tokenizer
@@ -898,13 +943,17 @@ class CodeGeexAdapter(BaseModelAdapter):
 class DollyV2Adapter(BaseModelAdapter):
     """The model adapter for databricks/dolly-v2-12b"""
 
+    keywords = ("dolly-v2",)
+
     def match(self, model_path: str):
         return "dolly-v2" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        tokenizer = AutoTokenizer.from_pretrained(model_path, revision=revision)
-        model = AutoModelForCausalLM.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
+            model_path, revision=revision
+        )
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             low_cpu_mem_usage=True,
             **from_pretrained_kwargs,
@@ -922,6 +971,8 @@ class DollyV2Adapter(BaseModelAdapter):
 class OasstPythiaAdapter(BaseModelAdapter):
     """The model adapter for OpenAssistant/oasst-sft-4-pythia-12b-epoch-3.5"""
 
+    keywords = ("oasst",)
+
     def match(self, model_path: str):
         model_path = model_path.lower()
         return "oasst" in model_path and "pythia" in model_path
@@ -940,6 +991,7 @@ class OasstLLaMAAdapter(BaseModelAdapter):
     """The model adapter for OpenAssistant/oasst-sft-7-llama-30b"""
 
     use_fast_tokenizer = False
+    keywords = ("oasst", "openassistant-sft-7-llama-30b-hf")
 
     def match(self, model_path: str):
         model_path = model_path.lower()
@@ -954,6 +1006,8 @@ class OasstLLaMAAdapter(BaseModelAdapter):
 class OpenChat35Adapter(BaseModelAdapter):
     """The model adapter for OpenChat 3.5 (e.g. openchat/openchat_3.5)"""
 
+    keywords = ("openchat", "starling-lm")
+
     def match(self, model_path: str):
         if "openchat" in model_path.lower() and "3.5" in model_path.lower():
             return True
@@ -968,6 +1022,8 @@ class OpenChat35Adapter(BaseModelAdapter):
 class TenyxChatAdapter(BaseModelAdapter):
     """The model adapter for TenyxChat (e.g. tenyx/TenyxChat-7B-v1)"""
 
+    keywords = ("tenyxchat",)
+
     def match(self, model_path: str):
         return "tenyxchat" in model_path.lower()
 
@@ -978,6 +1034,8 @@ class TenyxChatAdapter(BaseModelAdapter):
 class PythiaAdapter(BaseModelAdapter):
     """The model adapter for any EleutherAI/pythia model"""
 
+    keywords = ("pythia",)
+
     def match(self, model_path: str):
         return "pythia" in model_path.lower()
 
@@ -991,6 +1049,8 @@ class PythiaAdapter(BaseModelAdapter):
 class StableLMAdapter(BaseModelAdapter):
     """The model adapter for StabilityAI/stablelm-tuned-alpha-7b"""
 
+    keywords = ("stablelm",)
+
     def match(self, model_path: str):
         return "stablelm" in model_path.lower()
 
@@ -1001,20 +1061,22 @@ class StableLMAdapter(BaseModelAdapter):
 class MPTAdapter(BaseModelAdapter):
     """The model adapter for MPT series (mosaicml/mpt-7b-chat, mosaicml/mpt-30b-chat)"""
 
+    keywords = ("mpt",)
+
     def match(self, model_path: str):
         model_path = model_path.lower()
         return "mpt" in model_path and not "airoboros" in model_path
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             low_cpu_mem_usage=True,
             trust_remote_code=True,
             max_seq_len=8192,
             **from_pretrained_kwargs,
         )
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path, trust_remote_code=True, revision=revision
         )
         model.config.eos_token_id = tokenizer.eos_token_id
@@ -1041,6 +1103,7 @@ class BaizeAdapter(BaseModelAdapter):
     """The model adapter for project-baize/baize-v2-7b"""
 
     use_fast_tokenizer = False
+    keywords = ("baize",)
 
     def match(self, model_path: str):
         return "baize" in model_path.lower()
@@ -1052,6 +1115,8 @@ class BaizeAdapter(BaseModelAdapter):
 class RwkvAdapter(BaseModelAdapter):
     """The model adapter for BlinkDL/RWKV-4-Raven"""
 
+    keywords = ("rwkv-4",)
+
     def match(self, model_path: str):
         return "rwkv-4" in model_path.lower()
 
@@ -1060,7 +1125,7 @@ class RwkvAdapter(BaseModelAdapter):
 
         model = RwkvModel(model_path)
         revision = from_pretrained_kwargs.get("revision", "main")
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             "EleutherAI/pythia-160m", revision=revision
         )
         return model, tokenizer
@@ -1073,6 +1138,7 @@ class OpenBuddyAdapter(BaseModelAdapter):
     """The model adapter for OpenBuddy/openbuddy-7b-v1.1-bf16-enc"""
 
     use_fast_tokenizer = False
+    keywords = ("openbuddy",)
 
     def match(self, model_path: str):
         return "openbuddy" in model_path.lower()
@@ -1084,6 +1150,8 @@ class OpenBuddyAdapter(BaseModelAdapter):
 class PhoenixAdapter(BaseModelAdapter):
     """The model adapter for FreedomIntelligence/phoenix-inst-chat-7b"""
 
+    keywords = ("phoenix",)
+
     def match(self, model_path: str):
         return "phoenix" in model_path.lower()
 
@@ -1094,12 +1162,16 @@ class PhoenixAdapter(BaseModelAdapter):
 class ReaLMAdapter(BaseModelAdapter):
     """The model adapter for FreedomIntelligence/ReaLM-7b"""
 
+    keywords = ("realm",)
+
     def match(self, model_path: str):
         return "ReaLM" in model_path
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
-        tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=True)
-        model = AutoModelForCausalLM.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
+            model_path, use_fast=True
+        )
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path, low_cpu_mem_usage=True, **from_pretrained_kwargs
         )
         return model, tokenizer
@@ -1111,6 +1183,8 @@ class ReaLMAdapter(BaseModelAdapter):
 class ChatGPTAdapter(BaseModelAdapter):
     """The model adapter for ChatGPT"""
 
+    keywords = OPENAI_MODEL_LIST
+
     def match(self, model_path: str):
         return model_path in OPENAI_MODEL_LIST
 
@@ -1144,6 +1218,8 @@ class ChatGPTAdapter(BaseModelAdapter):
 class AzureOpenAIAdapter(BaseModelAdapter):
     """The model adapter for Azure OpenAI"""
 
+    keywords = ("azure-gpt-35-turbo", "azure-gpt-4")
+
     def match(self, model_path: str):
         return model_path in ("azure-gpt-35-turbo", "azure-gpt-4")
 
@@ -1157,6 +1233,8 @@ class AzureOpenAIAdapter(BaseModelAdapter):
 class PplxAIAdapter(BaseModelAdapter):
     """The model adapter for Perplexity AI"""
 
+    keywords = ("pplx-70b-online", "pplx-7b-online")
+
     def match(self, model_path: str):
         return model_path in (
             "pplx-7b-online",
@@ -1173,6 +1251,8 @@ class PplxAIAdapter(BaseModelAdapter):
 class ClaudeAdapter(BaseModelAdapter):
     """The model adapter for Claude"""
 
+    keywords = ANTHROPIC_MODEL_LIST
+
     def match(self, model_path: str):
         return model_path in ANTHROPIC_MODEL_LIST
 
@@ -1194,6 +1274,8 @@ class ClaudeAdapter(BaseModelAdapter):
 class BardAdapter(BaseModelAdapter):
     """The model adapter for Bard"""
 
+    keywords = ("bard",)
+
     def match(self, model_path: str):
         return model_path == "bard"
 
@@ -1207,6 +1289,8 @@ class BardAdapter(BaseModelAdapter):
 class PaLM2Adapter(BaseModelAdapter):
     """The model adapter for PaLM2"""
 
+    keywords = ("palm-2",)
+
     def match(self, model_path: str):
         return model_path == "palm-2"
 
@@ -1220,6 +1304,8 @@ class PaLM2Adapter(BaseModelAdapter):
 class GeminiAdapter(BaseModelAdapter):
     """The model adapter for Gemini"""
 
+    keywords = ("bard", "gemini")
+
     def match(self, model_path: str):
         return "gemini" in model_path.lower() or "bard" in model_path.lower()
 
@@ -1233,6 +1319,8 @@ class GeminiAdapter(BaseModelAdapter):
 class BiLLaAdapter(BaseModelAdapter):
     """The model adapter for Neutralzz/BiLLa-7B-SFT"""
 
+    keywords = ("billa",)
+
     def match(self, model_path: str):
         return "billa" in model_path.lower()
 
@@ -1243,13 +1331,17 @@ class BiLLaAdapter(BaseModelAdapter):
 class RedPajamaINCITEAdapter(BaseModelAdapter):
     """The model adapter for togethercomputer/RedPajama-INCITE-7B-Chat"""
 
+    keywords = ("redpajama-incite",)
+
     def match(self, model_path: str):
         return "redpajama-incite" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        tokenizer = AutoTokenizer.from_pretrained(model_path, revision=revision)
-        model = AutoModelForCausalLM.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
+            model_path, revision=revision
+        )
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             low_cpu_mem_usage=True,
             **from_pretrained_kwargs,
@@ -1264,6 +1356,7 @@ class H2OGPTAdapter(BaseModelAdapter):
     """The model adapter for h2oai/h2ogpt-gm-oasst1-en-2048-open-llama-7b"""
 
     use_fast_tokenizer = False
+    keywords = ("h2ogpt",)
 
     def match(self, model_path: str):
         return "h2ogpt" in model_path.lower()
@@ -1276,6 +1369,7 @@ class RobinAdapter(BaseModelAdapter):
     """The model adapter for LMFlow/Full-Robin-7b-v2"""
 
     use_fast_tokenizer = False
+    keywords = ("robin",)
 
     def match(self, model_path: str):
         return "robin" in model_path.lower()
@@ -1288,6 +1382,7 @@ class SnoozyAdapter(BaseModelAdapter):
     """The model adapter for nomic-ai/gpt4all-13b-snoozy"""
 
     use_fast_tokenizer = False
+    keywords = ("gpt4all",)
 
     def match(self, model_path: str):
         model_path = model_path.lower()
@@ -1301,6 +1396,7 @@ class WizardLMAdapter(BaseModelAdapter):
     """The model adapter for WizardLM/WizardLM-13B-V1.0"""
 
     use_fast_tokenizer = False
+    keywords = ("wizardlm",)
 
     def match(self, model_path: str):
         return "wizardlm" in model_path.lower()
@@ -1319,6 +1415,7 @@ class ManticoreAdapter(BaseModelAdapter):
     """The model adapter for openaccess-ai-collective/manticore-13b-chat-pyg"""
 
     use_fast_tokenizer = False
+    keywords = ("manticore",)
 
     def match(self, model_path: str):
         return "manticore" in model_path.lower()
@@ -1331,16 +1428,17 @@ class GuanacoAdapter(BaseModelAdapter):
     """The model adapter for timdettmers/guanaco-33b-merged"""
 
     use_fast_tokenizer = False
+    keywords = ("guanaco",)
 
     def match(self, model_path: str):
         return "guanaco" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path, use_fast=self.use_fast_tokenizer, revision=revision
         )
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path, low_cpu_mem_usage=True, **from_pretrained_kwargs
         )
         # Fix a bug in tokenizer config
@@ -1354,6 +1452,8 @@ class GuanacoAdapter(BaseModelAdapter):
 class ChangGPTAdapter(BaseModelAdapter):
     """The model adapter for lcw99/polyglot-ko-12.8b-chang-instruct-chat"""
 
+    keywords = ("polyglot",)
+
     def match(self, model_path: str):
         model_path = model_path.lower()
         return "polyglot" in model_path and "chang" in model_path
@@ -1366,6 +1466,7 @@ class CamelAdapter(BaseModelAdapter):
     """The model adapter for camel-ai/CAMEL-13B-Combined-Data"""
 
     use_fast_tokenizer = False
+    keywords = ("camel",)
 
     def match(self, model_path: str):
         return "camel" in model_path.lower()
@@ -1378,6 +1479,7 @@ class TuluAdapter(BaseModelAdapter):
     """The model adapter for allenai/tulu-30b"""
 
     use_fast_tokenizer = False
+    keywords = ("tulu",)
 
     def match(self, model_path: str):
         return "tulu" in model_path.lower()
@@ -1389,14 +1491,18 @@ class TuluAdapter(BaseModelAdapter):
 class FalconAdapter(BaseModelAdapter):
     """The model adapter for tiiuae/falcon-40b"""
 
+    keywords = ("falcon",)
+
     def match(self, model_path: str):
         return "falcon" in model_path.lower() and "chat" not in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
         # Strongly suggest using bf16, which is recommended by the author of Falcon
-        tokenizer = AutoTokenizer.from_pretrained(model_path, revision=revision)
-        model = AutoModelForCausalLM.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
+            model_path, revision=revision
+        )
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             low_cpu_mem_usage=True,
             trust_remote_code=True,
@@ -1412,6 +1518,8 @@ class FalconAdapter(BaseModelAdapter):
 
 
 class FalconChatAdapter(BaseModelAdapter):
+    keywords = ("falcon",)
+
     def match(self, model_path: str):
         return "falcon" in model_path.lower() and "chat" in model_path.lower()
 
@@ -1422,17 +1530,19 @@ class FalconChatAdapter(BaseModelAdapter):
 class TigerBotAdapter(BaseModelAdapter):
     """The model adapter for TigerResearch/tigerbot-7b-sft"""
 
+    keywords = ("tigerbot",)
+
     def match(self, model_path: str):
         return "tigerbot" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path,
             trust_remote_code=True,
             revision=revision,
         )
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             trust_remote_code=True,
             low_cpu_mem_usage=True,
@@ -1447,15 +1557,17 @@ class TigerBotAdapter(BaseModelAdapter):
 class BaichuanAdapter(BaseModelAdapter):
     """The model adapter for Baichuan models (e.g., baichuan-inc/Baichuan-7B)"""
 
+    keywords = ("baichuan",)
+
     def match(self, model_path: str):
         return "baichuan" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path, trust_remote_code=True, revision=revision
         )
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             trust_remote_code=True,
             low_cpu_mem_usage=True,
@@ -1475,18 +1587,20 @@ class BaichuanAdapter(BaseModelAdapter):
 class XGenAdapter(BaseModelAdapter):
     """The model adapter for Salesforce/xgen-7b"""
 
+    keywords = ("xgen",)
+
     def match(self, model_path: str):
         return "xgen" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             low_cpu_mem_usage=True,
             trust_remote_code=True,
             **from_pretrained_kwargs,
         )
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path, trust_remote_code=True, revision=revision
         )
         model.config.eos_token_id = 50256
@@ -1500,6 +1614,7 @@ class NousHermesAdapter(BaseModelAdapter):
     """The model adapter for NousResearch/Nous-Hermes-13b"""
 
     use_fast_tokenizer = False
+    keywords = ("nous-hermes",)
 
     def match(self, model_path: str):
         return "nous-hermes" in model_path.lower()
@@ -1511,12 +1626,14 @@ class NousHermesAdapter(BaseModelAdapter):
 class InternLMChatAdapter(BaseModelAdapter):
     """The model adapter for internlm/internlm-chat-7b"""
 
+    keywords = ("internlm",)
+
     def match(self, model_path: str):
         return "internlm" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             low_cpu_mem_usage=True,
             trust_remote_code=True,
@@ -1525,7 +1642,7 @@ class InternLMChatAdapter(BaseModelAdapter):
         model = model.eval()
         if "8k" in model_path.lower():
             model.config.max_sequence_length = 8192
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path, trust_remote_code=True, revision=revision
         )
         return model, tokenizer
@@ -1537,6 +1654,8 @@ class InternLMChatAdapter(BaseModelAdapter):
 class StarChatAdapter(BaseModelAdapter):
     """The model adapter for HuggingFaceH4/starchat-beta"""
 
+    keywords = ("starchat",)
+
     def match(self, model_path: str):
         return "starchat" in model_path.lower()
 
@@ -1547,6 +1666,8 @@ class StarChatAdapter(BaseModelAdapter):
 class MistralAdapter(BaseModelAdapter):
     """The model adapter for Mistral AI models"""
 
+    keywords = ("mistral", "mixtral")
+
     def match(self, model_path: str):
         return "mistral" in model_path.lower() or "mixtral" in model_path.lower()
 
@@ -1563,6 +1684,8 @@ class MistralAdapter(BaseModelAdapter):
 class Llama2Adapter(BaseModelAdapter):
     """The model adapter for Llama-2 (e.g., meta-llama/Llama-2-7b-hf)"""
 
+    keywords = ("llama-2",)
+
     def match(self, model_path: str):
         return "llama-2" in model_path.lower()
 
@@ -1579,6 +1702,8 @@ class Llama2Adapter(BaseModelAdapter):
 class Llama3Adapter(BaseModelAdapter):
     """The model adapter for Llama-3 (e.g., meta-llama/Meta-Llama-3-8B-Instruct)"""
 
+    keywords = ("llama-3-",)
+
     def match(self, model_path: str):
         return "llama-3-" in model_path.lower()
 
@@ -1595,6 +1720,8 @@ class Llama3Adapter(BaseModelAdapter):
 class Llama31Adapter(BaseModelAdapter):
     """The model adapter for Llama-3 (e.g., meta-llama/Meta-Llama-3-8B-Instruct)"""
 
+    keywords = ("llama-3.1",)
+
     def match(self, model_path: str):
         keywords = [
             "llama-3.1",
@@ -1620,6 +1747,8 @@ class Llama31Adapter(BaseModelAdapter):
 
 
 class GrokAdapter(BaseModelAdapter):
+    keywords = ("grok",)
+
     def match(self, model_path: str):
         return "grok" in model_path.lower()
 
@@ -1632,12 +1761,14 @@ class GrokAdapter(BaseModelAdapter):
 class CuteGPTAdapter(BaseModelAdapter):
     """The model adapter for CuteGPT"""
 
+    keywords = ("cutegpt",)
+
     def match(self, model_path: str):
         return "cutegpt" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
-        tokenizer = LlamaTokenizer.from_pretrained(model_path)
-        model = AutoModelForCausalLM.from_pretrained(
+        tokenizer = transformers.LlamaTokenizer.from_pretrained(model_path)
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path, low_cpu_mem_usage=True, **from_pretrained_kwargs
         )
         tokenizer.eos_token_id = tokenizer.convert_tokens_to_ids("<end>")
@@ -1660,6 +1791,7 @@ class OpenOrcaAdapter(BaseModelAdapter):
     """
 
     use_fast_tokenizer = False
+    keywords = ("mistral-7b-openorca", "openorca")
 
     def match(self, model_path: str):
         return (
@@ -1669,10 +1801,10 @@ class OpenOrcaAdapter(BaseModelAdapter):
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path, use_fast=self.use_fast_tokenizer, revision=revision
         )
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             low_cpu_mem_usage=True,
             **from_pretrained_kwargs,
@@ -1688,6 +1820,8 @@ class OpenOrcaAdapter(BaseModelAdapter):
 class DolphinAdapter(OpenOrcaAdapter):
     """Model adapter for ehartford/dolphin-2.2.1-mistral-7b"""
 
+    keywords = ("dolphin",)
+
     def match(self, model_path: str):
         return "dolphin" in model_path.lower() and "mistral" in model_path.lower()
 
@@ -1699,6 +1833,7 @@ class Hermes2Adapter(BaseModelAdapter):
     """Model adapter for teknium/OpenHermes-2.5-Mistral-7B and teknium/OpenHermes-2-Mistral-7B models"""
 
     use_fast_tokenizer = False
+    keywords = ("openhermes-2-mistral-7b", "openhermes-2.5-mistral-7b")
 
     def match(self, model_path: str):
         return any(
@@ -1708,10 +1843,10 @@ class Hermes2Adapter(BaseModelAdapter):
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path, use_fast=self.use_fast_tokenizer, revision=revision
         )
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             low_cpu_mem_usage=True,
             **from_pretrained_kwargs,
@@ -1725,6 +1860,8 @@ class Hermes2Adapter(BaseModelAdapter):
 class NousHermes2MixtralAdapter(BaseModelAdapter):
     """Model adapter for NousResearch/Nous-Hermes-2-Mixtral-8x7B-DPO model"""
 
+    keywords = ("nous-hermes-2-mixtral-8x7b-dpo", "nous-hermes-2-mixtral-8x7b-sft")
+
     def match(self, model_path: str):
         return any(
             model_str in model_path.lower()
@@ -1742,6 +1879,7 @@ class WizardCoderAdapter(BaseModelAdapter):
     """The model adapter for WizardCoder (e.g., WizardLM/WizardCoder-Python-34B-V1.0)"""
 
     use_fast_tokenizer = False
+    keywords = ("wizardcoder",)
 
     def match(self, model_path: str):
         return "wizardcoder" in model_path.lower()
@@ -1770,6 +1908,8 @@ class QwenChatAdapter(BaseModelAdapter):
     to from flash_attn.flash_attn_interface import flash_attn_varlen_func as flash_attn_unpadded_func
     """
 
+    keywords = ("qwen",)
+
     def match(self, model_path: str):
         return "qwen" in model_path.lower()
 
@@ -1791,7 +1931,7 @@ class QwenChatAdapter(BaseModelAdapter):
         from transformers.generation import GenerationConfig
 
         revision = from_pretrained_kwargs.get("revision", "main")
-        config = AutoConfig.from_pretrained(
+        config = transformers.AutoConfig.from_pretrained(
             model_path,
             trust_remote_code=True,
         )
@@ -1801,7 +1941,7 @@ class QwenChatAdapter(BaseModelAdapter):
         generation_config = GenerationConfig.from_pretrained(
             model_path, trust_remote_code=True
         )
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             config=config,
             low_cpu_mem_usage=True,
@@ -1810,7 +1950,7 @@ class QwenChatAdapter(BaseModelAdapter):
         ).eval()
         if hasattr(model.config, "use_dynamic_ntk") and model.config.use_dynamic_ntk:
             model.config.max_sequence_length = 16384
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path, trust_remote_code=True, revision=revision
         )
         tokenizer.eos_token_id = config.eos_token_id
@@ -1829,6 +1969,8 @@ class QwenChatAdapter(BaseModelAdapter):
 class SmaugChatAdapter(BaseModelAdapter):
     """The model adapter for abacusai/Smaug-2-72B."""
 
+    keywords = ("smaug",)
+
     def match(self, model_path: str):
         return "smaug" in model_path.lower()
 
@@ -1840,17 +1982,18 @@ class BGEAdapter(BaseModelAdapter):
     """The model adapter for BGE (e.g., BAAI/bge-large-en-v1.5)"""
 
     use_fast_tokenizer = False
+    keywords = ("bge",)
 
     def match(self, model_path: str):
         return "bge" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        model = AutoModel.from_pretrained(
+        model = transformers.AutoModel.from_pretrained(
             model_path,
             **from_pretrained_kwargs,
         )
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path, trust_remote_code=True, revision=revision
         )
         if hasattr(model.config, "max_position_embeddings") and hasattr(
@@ -1871,17 +2014,18 @@ class E5Adapter(BaseModelAdapter):
     """The model adapter for E5 (e.g., intfloat/e5-large-v2)"""
 
     use_fast_tokenizer = False
+    keywords = ("e5-",)
 
     def match(self, model_path: str):
         return "e5-" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        model = AutoModel.from_pretrained(
+        model = transformers.AutoModel.from_pretrained(
             model_path,
             **from_pretrained_kwargs,
         )
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path, trust_remote_code=True, revision=revision
         )
         if hasattr(model.config, "max_position_embeddings") and hasattr(
@@ -1905,19 +2049,21 @@ class AquilaChatAdapter(BaseModelAdapter):
     - BAAI/AquilaChat2-34B
     """
 
+    keywords = ("aquila",)
+
     def match(self, model_path: str):
         return "aquila" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             low_cpu_mem_usage=True,
             trust_remote_code=True,
             **from_pretrained_kwargs,
         )
         model = model.eval()
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path, trust_remote_code=True, revision=revision
         )
         return model, tokenizer
@@ -1939,17 +2085,19 @@ class AquilaChatAdapter(BaseModelAdapter):
 class Lamma2ChineseAdapter(BaseModelAdapter):
     """The model adapter for FlagAlpha/LLama2-Chinese sft"""
 
+    keywords = ("llama2-chinese",)
+
     def match(self, model_path: str):
         return "llama2-chinese" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path,
             trust_remote_code=True,
             revision=revision,
         )
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             trust_remote_code=True,
             low_cpu_mem_usage=True,
@@ -1964,17 +2112,19 @@ class Lamma2ChineseAdapter(BaseModelAdapter):
 class Lamma2ChineseAlpacaAdapter(BaseModelAdapter):
     """The model adapter for ymcui/Chinese-LLaMA-Alpaca sft"""
 
+    keywords = ("chinese-alpaca",)
+
     def match(self, model_path: str):
         return "chinese-alpaca" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path,
             trust_remote_code=True,
             revision=revision,
         )
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             trust_remote_code=True,
             low_cpu_mem_usage=True,
@@ -1990,19 +2140,20 @@ class VigogneAdapter(BaseModelAdapter):
     """The model adapter for vigogne (e.g., bofenghuang/vigogne-2-7b-chat)"""
 
     use_fast_tokenizer = False
+    keywords = ("vigogne", "vigostral")
 
     def match(self, model_path: str):
         return bool(re.search(r"vigogne|vigostral", model_path, re.I))
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path,
             use_fast=self.use_fast_tokenizer,
             trust_remote_code=True,
             revision=revision,
         )
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             trust_remote_code=True,
             low_cpu_mem_usage=True,
@@ -2022,6 +2173,7 @@ class OpenLLaMaOpenInstructAdapter(BaseModelAdapter):
     """The model adapter for OpenLLaMa-Open-Instruct (e.g., VMware/open-llama-7b-open-instruct)"""
 
     use_fast_tokenizer = False
+    keywords = ("open-llama",)
 
     def match(self, model_path: str):
         return (
@@ -2030,13 +2182,13 @@ class OpenLLaMaOpenInstructAdapter(BaseModelAdapter):
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path,
             use_fast=self.use_fast_tokenizer,
             trust_remote_code=True,
             revision=revision,
         )
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             trust_remote_code=True,
             low_cpu_mem_usage=True,
@@ -2051,6 +2203,8 @@ class OpenLLaMaOpenInstructAdapter(BaseModelAdapter):
 class CodeLlamaAdapter(BaseModelAdapter):
     """The model adapter for CodeLlama (e.g., codellama/CodeLlama-34b-hf)"""
 
+    keywords = ("codellama",)
+
     def match(self, model_path: str):
         return "codellama" in model_path.lower()
 
@@ -2067,6 +2221,8 @@ class CodeLlamaAdapter(BaseModelAdapter):
 class StableVicunaAdapter(BaseModelAdapter):
     """The model adapter for StableVicuna"""
 
+    keywords = ("stable-vicuna",)
+
     def match(self, model_path: str):
         return "stable-vicuna" in model_path.lower()
 
@@ -2083,6 +2239,8 @@ class StableVicunaAdapter(BaseModelAdapter):
 class PhindCodeLlamaAdapter(CodeLlamaAdapter):
     """The model adapter for Phind-CodeLlama (e.g., Phind/Phind-CodeLlama-34B-v2)"""
 
+    keywords = ("phind-codellama-",)
+
     def match(self, model_path: str):
         return "phind-codellama-" in model_path.lower()
 
@@ -2093,6 +2251,8 @@ class PhindCodeLlamaAdapter(CodeLlamaAdapter):
 class Llama2ChangAdapter(Llama2Adapter):
     """The model adapter for Llama2-ko-chang (e.g., lcw99/llama2-ko-chang-instruct-chat)"""
 
+    keywords = ("llama2-ko-chang",)
+
     def match(self, model_path: str):
         return "llama2-ko-chang" in model_path.lower()
 
@@ -2103,6 +2263,8 @@ class Llama2ChangAdapter(Llama2Adapter):
 class ZephyrAdapter(BaseModelAdapter):
     """The model adapter for Zephyr (e.g. HuggingFaceH4/zephyr-7b-alpha)"""
 
+    keywords = ("zephyr",)
+
     def match(self, model_path: str):
         return "zephyr" in model_path.lower()
 
@@ -2113,6 +2275,8 @@ class ZephyrAdapter(BaseModelAdapter):
 class NotusAdapter(BaseModelAdapter):
     """The model adapter for Notus (e.g. argilla/notus-7b-v1)"""
 
+    keywords = ("notus",)
+
     def match(self, model_path: str):
         return "notus" in model_path.lower()
 
@@ -2123,6 +2287,8 @@ class NotusAdapter(BaseModelAdapter):
 class CatPPTAdapter(BaseModelAdapter):
     """The model adapter for CatPPT (e.g. rishiraj/CatPPT)"""
 
+    keywords = ("catppt",)
+
     def match(self, model_path: str):
         return "catppt" in model_path.lower()
 
@@ -2133,6 +2299,8 @@ class CatPPTAdapter(BaseModelAdapter):
 class TinyLlamaAdapter(BaseModelAdapter):
     """The model adapter for TinyLlama (e.g. TinyLlama/TinyLlama-1.1B-Chat-v1.0)"""
 
+    keywords = ("tinyllama",)
+
     def match(self, model_path: str):
         return "tinyllama" in model_path.lower()
 
@@ -2145,6 +2313,8 @@ class XwinLMAdapter(BaseModelAdapter):
 
     # use_fast_tokenizer = False
 
+    keywords = ("xwin-lm",)
+
     def match(self, model_path: str):
         return "xwin-lm" in model_path.lower()
 
@@ -2156,6 +2326,7 @@ class LemurAdapter(BaseModelAdapter):
     """The model adapter for OpenLemur/lemur-70b-chat-v1"""
 
     use_fast_tokenizer = False
+    keywords = ("lemur-70b-chat",)
 
     def match(self, model_path: str):
         return "lemur-70b-chat" in model_path.lower()
@@ -2169,6 +2340,8 @@ class PygmalionAdapter(BaseModelAdapter):
 
     # use_fast_tokenizer = False
 
+    keywords = ("metharme", "mythalion", "pygmalion")
+
     def match(self, model_path: str):
         return bool(
             re.search(r"pygmalion|mythalion|metharme", model_path.lower(), re.I)
@@ -2181,6 +2354,8 @@ class PygmalionAdapter(BaseModelAdapter):
 class XdanAdapter(BaseModelAdapter):
     """The model adapter for xDAN-AI (e.g. xDAN-AI/xDAN-L1-Chat-RL-v1)"""
 
+    keywords = ("xdan",)
+
     def match(self, model_path: str):
         return "xdan" in model_path.lower() and "v1" in model_path.lower()
 
@@ -2193,6 +2368,8 @@ class MicrosoftOrcaAdapter(BaseModelAdapter):
 
     use_fast_tokenizer = False  # Flag neeeded since tokenizers>=0.13.3 is required for a normal functioning of this module
 
+    keywords = ("orca-2",)
+
     def match(self, model_path: str):
         return "orca-2" in model_path.lower()
 
@@ -2203,6 +2380,8 @@ class MicrosoftOrcaAdapter(BaseModelAdapter):
 class YiAdapter(BaseModelAdapter):
     """The model adapter for Yi models"""
 
+    keywords = ("yi-",)
+
     def match(self, model_path: str):
         return "yi-" in model_path.lower() and "chat" in model_path.lower()
 
@@ -2213,6 +2392,8 @@ class YiAdapter(BaseModelAdapter):
 class DeepseekCoderAdapter(BaseModelAdapter):
     """The model adapter for deepseek-ai's coder models"""
 
+    keywords = ("deepseek-coder",)
+
     def match(self, model_path: str):
         return "deepseek-coder" in model_path.lower()
 
@@ -2225,6 +2406,8 @@ class DeepseekChatAdapter(BaseModelAdapter):
 
     # Note: that this model will require tokenizer version >= 0.13.3 because the tokenizer class is LlamaTokenizerFast
 
+    keywords = ("deepseek-llm",)
+
     def match(self, model_path: str):
         return "deepseek-llm" in model_path.lower() and "chat" in model_path.lower()
 
@@ -2235,6 +2418,8 @@ class DeepseekChatAdapter(BaseModelAdapter):
 class GeminiAdapter(BaseModelAdapter):
     """The model adapter for Gemini"""
 
+    keywords = ("bard", "gemini")
+
     def match(self, model_path: str):
         return "gemini" in model_path.lower() or "bard" in model_path.lower()
 
@@ -2250,13 +2435,15 @@ class GeminiAdapter(BaseModelAdapter):
 class Yuan2Adapter(BaseModelAdapter):
     """The model adapter for Yuan2.0"""
 
+    keywords = ("yuan2",)
+
     def match(self, model_path: str):
         return "yuan2" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
         revision = from_pretrained_kwargs.get("revision", "main")
         # from_pretrained_kwargs["torch_dtype"] = torch.bfloat16
-        tokenizer = LlamaTokenizer.from_pretrained(
+        tokenizer = transformers.LlamaTokenizer.from_pretrained(
             model_path,
             add_eos_token=False,
             add_bos_token=False,
@@ -2286,7 +2473,7 @@ class Yuan2Adapter(BaseModelAdapter):
             special_tokens=True,
         )
 
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             # device_map='auto',
             trust_remote_code=True,
@@ -2301,6 +2488,8 @@ class Yuan2Adapter(BaseModelAdapter):
 class MetaMathAdapter(BaseModelAdapter):
     """The model adapter for MetaMath models"""
 
+    keywords = ("metamath",)
+
     def match(self, model_path: str):
         return "metamath" in model_path.lower()
 
@@ -2311,6 +2500,8 @@ class MetaMathAdapter(BaseModelAdapter):
 class BagelAdapter(BaseModelAdapter):
     """Model adapter for jondurbin/bagel-* models"""
 
+    keywords = ("bagel",)
+
     def match(self, model_path: str):
         return "bagel" in model_path.lower()
 
@@ -2321,6 +2512,8 @@ class BagelAdapter(BaseModelAdapter):
 class SolarAdapter(BaseModelAdapter):
     """The model adapter for upstage/SOLAR-10.7B-Instruct-v1.0"""
 
+    keywords = ("solar-",)
+
     def match(self, model_path: str):
         return "solar-" in model_path.lower() and "instruct" in model_path.lower()
 
@@ -2331,6 +2524,8 @@ class SolarAdapter(BaseModelAdapter):
 class SteerLMAdapter(BaseModelAdapter):
     """The model adapter for nvidia/Llama2-70B-SteerLM-Chat"""
 
+    keywords = ("steerlm-chat",)
+
     def match(self, model_path: str):
         return "steerlm-chat" in model_path.lower()
 
@@ -2341,6 +2536,8 @@ class SteerLMAdapter(BaseModelAdapter):
 class GemmaAdapter(BaseModelAdapter):
     """The model adapter for google/gemma"""
 
+    keywords = ("gemma",)
+
     def match(self, model_path: str):
         return "gemma" in model_path.lower()
 
@@ -2355,6 +2552,8 @@ class LlavaAdapter(BaseModelAdapter):
         # TODO(chris): Implement huggingface-compatible load_model
         pass
 
+    keywords = ("llava",)
+
     def match(self, model_path: str):
         return "llava" in model_path.lower()
 
@@ -2369,6 +2568,8 @@ class LlavaAdapter(BaseModelAdapter):
 class YuanAdapter(BaseModelAdapter):
     """The model adapter for Yuan"""
 
+    keywords = ("yuan",)
+
     def match(self, model_path: str):
         return "yuan" in model_path.lower()
 
@@ -2403,6 +2604,8 @@ class YuanAdapter(BaseModelAdapter):
 class OlmoAdapter(BaseModelAdapter):
     """The model adapter for allenai/OLMo-7B-Instruct"""
 
+    keywords = ("olmo",)
+
     def match(self, model_path: str):
         return "olmo" in model_path.lower()
 
@@ -2413,6 +2616,8 @@ class OlmoAdapter(BaseModelAdapter):
 class YandexGPTAdapter(BaseModelAdapter):
     """The model adapter for YandexGPT"""
 
+    keywords = ("yandexgpt",)
+
     def match(self, model_path: str):
         return "yandexgpt" in model_path.lower()
 
@@ -2423,21 +2628,23 @@ class YandexGPTAdapter(BaseModelAdapter):
 class CllmAdapter(BaseModelAdapter):
     """The model adapter for CLLM"""
 
+    keywords = ("consistency-llm",)
+
     def match(self, model_path: str):
         return "consistency-llm" in model_path.lower()
 
     def load_model(self, model_path: str, from_pretrained_kwargs: dict):
-        config = AutoConfig.from_pretrained(
+        config = transformers.AutoConfig.from_pretrained(
             model_path,
         )
 
-        tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer = transformers.AutoTokenizer.from_pretrained(
             model_path,
             model_max_length=2048,
             padding_side="right",
         )
 
-        model = AutoModelForCausalLM.from_pretrained(
+        model = transformers.AutoModelForCausalLM.from_pretrained(
             model_path,
             config=config,
             torch_dtype=torch.bfloat16,
@@ -2454,6 +2661,8 @@ class CllmAdapter(BaseModelAdapter):
 class CohereAdapter(BaseModelAdapter):
     """The model adapter for Cohere"""
 
+    keywords = ("command-r",)
+
     def match(self, model_path: str):
         return model_path in ["command-r"]
 
@@ -2467,6 +2676,8 @@ class CohereAdapter(BaseModelAdapter):
 class DBRXAdapter(BaseModelAdapter):
     """The model adapter for Databricks"""
 
+    keywords = ("dbrx-instruct",)
+
     def match(self, model_path: str):
         return model_path in ["dbrx-instruct"]
 
@@ -2480,6 +2691,8 @@ class DBRXAdapter(BaseModelAdapter):
 class RekaAdapter(BaseModelAdapter):
     """The model adapter for Reka"""
 
+    keywords = ("reka",)
+
     def match(self, model_path: str):
         return "reka" in model_path.lower()
 
@@ -2488,6 +2701,8 @@ class RekaAdapter(BaseModelAdapter):
 
 
 class NoSystemAdapter(BaseModelAdapter):
+    keywords = ("athene-70b", "p2l")
+
     def match(self, model_path: str):
         keyword_list = ["athene-70b", "p2l"]
 
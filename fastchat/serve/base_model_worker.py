@@ -4,11 +4,14 @@ import time
 from typing import List
 
 from fastapi import FastAPI, Request, BackgroundTasks
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import requests
 
 from fastchat.constants import WORKER_HEART_BEAT_INTERVAL
 from fastchat.conversation import Conversation
+from fastchat.serve import serialization
+from fastchat.serve.token_count_cache import TokenCountCache, text_key
+from fastchat.serve.tokenizer_pool import TokenizerPool
 from fastchat.utils import pretty_print_semaphore, build_logger
 
 
@@ -49,9 +52,14 @@ class BaseModelWorker:
         self.conv.sep_style = int(self.conv.sep_style)
         self.multimodal = multimodal
         self.tokenizer = None
+        self.tokenizer_pool = None
+        self.token_count_cache = None
+        # Whether generation accepts params["prompt_token_ids"]
+        self.pretokenize = False
         self.context_len = None
         self.call_ct = 0
         self.semaphore = None
+        self.queued_tokens = 0
 
         self.heart_beat_thread = None
 
@@ -116,6 +124,7 @@ class BaseModelWorker:
                     json={
                         "worker_name": self.worker_addr,
                         "queue_length": self.get_queue_length(),
+                        "queued_tokens": self.queued_tokens,
                     },
                     timeout=5,
                 )
@@ -147,16 +156,63 @@ class BaseModelWorker:
             "model_names": self.model_names,
             "speed": 1,
             "queue_length": self.get_queue_length(),
+            "capacity": self.limit_worker_concurrency,
+            "queued_tokens": self.queued_tokens,
         }
 
-    def count_token(self, params):
-        prompt = params["prompt"]
+    def init_tokenizer_pool(self, num_threads: int = 1, max_batch_size: int = 32):
+        """Tokenize requests on a pool of threads instead of the model threads."""
+        if num_threads > 0:
+            self.tokenizer_pool = TokenizerPool(
+                self.tokenizer, num_threads, max_batch_size
+            )
 
+    def encode(self, texts: List[str]) -> List[List[int]]:
+        """Token ids of each text, computed by the tokenizer pool if there is one."""
+        if self.tokenizer_pool is not None:
+            return self.tokenizer_pool.encode(texts)
+        return [self.tokenizer(text).input_ids for text in texts]
+
+    def init_token_count_cache(self, max_bytes: int = 16 * 2**20):
+        if max_bytes > 0:
+            self.token_count_cache = TokenCountCache(max_bytes)
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        cache = self.token_count_cache
+        if cache is None:
+            return self.count_tokens_uncached(texts)
+
+        keys = [text_key(text) for text in texts]
+        counts = cache.get_many(keys)
+        # Dict[key -> text] of the distinct texts that were not cached
+        missing = {
+            key: text for key, text, count in zip(keys, texts, counts) if count is None
+        }
+        if missing:
+            new_counts = self.count_tokens_uncached(list(missing.values()))
+            cache.put_many(list(missing), new_counts)
+            found = dict(zip(missing, new_counts))
+            counts = [
+                found[key] if count is None else count
+                for key, count in zip(keys, counts)
+            ]
+        return counts
+
+    def count_tokens_uncached(self, texts: List[str]) -> List[int]:
         try:
-            input_ids = self.tokenizer(prompt).input_ids
-            input_echo_len = len(input_ids)
+            return [len(input_ids) for input_ids in self.encode(texts)]
         except TypeError:
-            input_echo_len = self.tokenizer.num_tokens(prompt)
+            return [self.tokenizer.num_tokens(text) for text in texts]
+
+    def count_token(self, params):
+        # Batched form: {"prompts": [...]} -> {"counts": [...]}
+        if "prompts" in params:
+            return {"counts": self.count_tokens(params["prompts"]), "error_code": 0}
+
+        if params.get("prompt_token_ids") is not None:
+            input_echo_len = len(params["prompt_token_ids"])
+        else:
+            input_echo_len = self.count_tokens([params["prompt"]])[0]
 
         ret = {
             "count": input_echo_len,
@@ -164,6 +220,11 @@ class BaseModelWorker:
         }
         return ret
 
+    def tokenize(self, params):
+        if "prompts" in params:
+            return {"token_ids": self.encode(params["prompts"]), "error_code": 0}
+        return {"token_ids": self.encode([params["prompt"]])[0], "error_code": 0}
+
     def get_conv_template(self):
         return {"conv": self.conv}
 
@@ -177,38 +238,77 @@ class BaseModelWorker:
         raise NotImplementedError
 
 
-def release_worker_semaphore():
+def request_tokens(params):
+    """The generation budget of a request, reported to the controller as load."""
+    try:
+        return max(int(params.get("max_new_tokens")), 0)
+    except (TypeError, ValueError):
+        return 256
+
+
+def release_worker_semaphore(tokens: int = 0):
+    worker.queued_tokens -= tokens
     worker.semaphore.release()
 
 
-def acquire_worker_semaphore():
+def acquire_worker_semaphore(tokens: int = 0):
     if worker.semaphore is None:
         worker.semaphore = asyncio.Semaphore(worker.limit_worker_concurrency)
+    worker.queued_tokens += tokens
     return worker.semaphore.acquire()
 
 
-def create_background_tasks():
+async def add_prompt_token_ids(params):
+    """Tokenize the prompt on the pool before the request waits for the model."""
+    if (
+        worker.tokenizer_pool is None
+        or not worker.pretokenize
+        or params.get("prompt_token_ids") is not None
+        or not isinstance(params.get("prompt"), str)
+        or params.get("images")
+    ):
+        return
+    try:
+        input_ids = await worker.tokenizer_pool.encode_async([params["prompt"]])
+    except Exception as e:
+        # Leave it to the model thread, which reports the error to the client.
+        logger.warning(f"Could not pre-tokenize the prompt: {e}")
+        return
+    params["prompt_token_ids"] = input_ids[0]
+
+
+def create_background_tasks(tokens: int = 0):
     background_tasks = BackgroundTasks()
-    background_tasks.add_task(release_worker_semaphore)
+    background_tasks.add_task(release_worker_semaphore, tokens)
     return background_tasks
 
 
 @app.post("/worker_generate_stream")
 async def api_generate_stream(request: Request):
-    params = await request.json()
-    await acquire_worker_semaphore()
+    params = serialization.loads(await request.body())
+    params["stream_format"] = serialization.negotiate_stream_format(params)
+    await add_prompt_token_ids(params)
+    tokens = request_tokens(params)
+    await acquire_worker_semaphore(tokens)
     generator = worker.generate_stream_gate(params)
-    background_tasks = create_background_tasks()
-    return StreamingResponse(generator, background=background_tasks)
+    background_tasks = create_background_tasks(tokens)
+    media_type = None
+    if params["stream_format"] == "msgpack":
+        media_type = serialization.MSGPACK_MEDIA_TYPE
+    return StreamingResponse(
+        generator, media_type=media_type, background=background_tasks
+    )
 
 
 @app.post("/worker_generate")
 async def api_generate(request: Request):
-    params = await request.json()
-    await acquire_worker_semaphore()
+    params = serialization.loads(await request.body())
+    await add_prompt_token_ids(params)
+    tokens = request_tokens(params)
+    await acquire_worker_semaphore(tokens)
     output = await asyncio.to_thread(worker.generate_gate, params)
-    release_worker_semaphore()
-    return JSONResponse(output)
+    release_worker_semaphore(tokens)
+    return Response(serialization.dumps(output), media_type="application/json")
 
 
 @app.post("/worker_get_embeddings")
@@ -228,7 +328,13 @@ async def api_get_status(request: Request):
 @app.post("/count_token")
 async def api_count_token(request: Request):
     params = await request.json()
-    return worker.count_token(params)
+    return await asyncio.to_thread(worker.count_token, params)
+
+
+@app.post("/tokenize")
+async def api_tokenize(request: Request):
+    params = await request.json()
+    return await asyncio.to_thread(worker.tokenize, params)
 
 
 @app.post("/worker_get_conv_template")
@@ -239,3 +345,19 @@ async def api_get_conv(request: Request):
 @app.post("/model_details")
 async def api_model_details(request: Request):
     return {"context_length": worker.context_len}
+
+
+@app.get("/metrics/tokenizer")
+async def api_tokenizer_metrics():
+    """Requests, texts and batches encoded by the tokenizer pool"""
+    if worker.tokenizer_pool is None:
+        return {"enabled": False}
+    return {"enabled": True, **worker.tokenizer_pool.get_metrics()}
+
+
+@app.get("/metrics/token_counts")
+async def api_token_count_metrics():
+    """Hit rate and size of the token count cache"""
+    if worker.token_count_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **worker.token_count_cache.get_metrics()}
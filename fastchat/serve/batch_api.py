@@ -0,0 +1,638 @@
+"""
+An OpenAI-style Batch API backed by local JSONL files.
+
+Uploaded files live under <batch_dir>/files and batch objects under
+<batch_dir>/batches. A batch runs its input lines at low priority: before
+each request it waits until the load the controller reports for the model
+drops below a threshold, so interactive traffic keeps the workers first.
+Results are appended to the batch's output and error files as they finish.
+This makes batches resumable: after a restart, lines whose custom_id
+already has a result are skipped.
+
+The same pipeline can run directly against a local model without HTTP:
+python3 -m fastchat.serve.batch_api --model-path lmsys/vicuna-7b-v1.5 --input-file requests.jsonl --output-file results.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import shortuuid
+
+from fastchat.utils import build_logger
+
+logger = build_logger("batch_api", "batch_api.log")
+
+BATCH_ENDPOINTS = ("/v1/chat/completions", "/v1/completions", "/v1/embeddings")
+# Batch states that still have work to do after a restart
+ACTIVE_STATES = ("validating", "in_progress", "finalizing", "cancelling")
+
+# handler(url, body) -> (status_code, response body)
+Handler = Callable[[str, dict], Awaitable[Tuple[int, dict]]]
+
+
+def write_json_atomic(path: str, obj: dict):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fout:
+        json.dump(obj, fout)
+        fout.flush()
+        os.fsync(fout.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_done_ids(path: str) -> set:
+    """Return the custom_ids that have a result, dropping a partially written last line."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        try:
+            done.add(json.loads(line)["custom_id"])
+        except (ValueError, KeyError, TypeError):
+            continue
+    return done
+
+
+def validate_input(input_path: str, endpoint: Optional[str] = None) -> int:
+    """Check every line of a batch input file and return the number of requests."""
+    custom_ids = set()
+    with open(input_path, "r", encoding="utf-8") as fin:
+        for line_no, line in enumerate(fin, 1):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError:
+                raise ValueError(f"Line {line_no}: invalid JSON.")
+            custom_id = request.get("custom_id")
+            if not custom_id:
+                raise ValueError(f"Line {line_no}: missing custom_id.")
+            if custom_id in custom_ids:
+                raise ValueError(f"Line {line_no}: duplicate custom_id {custom_id}.")
+            custom_ids.add(custom_id)
+            url = request.get("url", endpoint)
+            if endpoint is not None and url != endpoint:
+                raise ValueError(
+                    f"Line {line_no}: url {url} does not match the batch endpoint {endpoint}."
+                )
+            if url not in BATCH_ENDPOINTS:
+                raise ValueError(f"Line {line_no}: unsupported url {url}.")
+            if not isinstance(request.get("body"), dict):
+                raise ValueError(f"Line {line_no}: missing body.")
+    return len(custom_ids)
+
+
+async def run_batch_file(
+    input_path: str,
+    output_path: str,
+    error_path: str,
+    handler: Handler,
+    endpoint: Optional[str] = None,
+    concurrency: int = 4,
+    wait_for_capacity: Optional[Callable[[str], Awaitable[None]]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    on_result: Optional[Callable[[bool], None]] = None,
+) -> Dict[str, int]:
+    """
+    Run the requests of a batch input file that have no result yet.
+
+    Successful responses are appended to output_path and failed ones to
+    error_path, one JSON line per request, flushed as soon as it finishes.
+    Returns {"completed", "failed", "skipped"} counts of this run.
+    """
+    done = read_done_ids(output_path) | read_done_ids(error_path)
+    counts = {"completed": 0, "failed": 0, "skipped": 0}
+
+    def pending():
+        with open(input_path, "r", encoding="utf-8") as fin:
+            for line in fin:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                if request["custom_id"] in done:
+                    counts["skipped"] += 1
+                    continue
+                yield request
+
+    requests_iter = pending()
+
+    with open(output_path, "a", encoding="utf-8") as fout, open(
+        error_path, "a", encoding="utf-8"
+    ) as ferr:
+
+        async def work():
+            # The coroutines share one iterator, so each line is taken once.
+            for request in requests_iter:
+                body = dict(request["body"], stream=False)
+                if wait_for_capacity is not None:
+                    await wait_for_capacity(body.get("model"))
+                if should_stop is not None and should_stop():
+                    return
+
+                try:
+                    status_code, response_body = await handler(
+                        request.get("url", endpoint), body
+                    )
+                except Exception as e:
+                    logger.error(f"Batch request {request['custom_id']} failed: {e}")
+                    status_code, response_body = 500, {"error": {"message": str(e)}}
+
+                ok = status_code == 200
+                result = {
+                    "id": f"batch_req_{shortuuid.random()}",
+                    "custom_id": request["custom_id"],
+                    "response": {"status_code": status_code, "body": response_body},
+                    "error": None,
+                }
+                if not ok:
+                    message = response_body.get("error", {}).get("message", "")
+                    result["error"] = {"code": str(status_code), "message": message}
+                out = fout if ok else ferr
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                counts["completed" if ok else "failed"] += 1
+                if on_result is not None:
+                    on_result(ok)
+
+        await asyncio.gather(*[work() for _ in range(concurrency)])
+    return counts
+
+
+class BatchManager:
+    """Stores files and batch objects on disk and runs batches in the background."""
+
+    def __init__(
+        self,
+        batch_dir: str,
+        handler: Handler,
+        load_fn: Optional[Callable[[str], Awaitable[Optional[float]]]] = None,
+        max_load: float = 0.5,
+        concurrency: int = 4,
+        poll_interval: float = 1.0,
+        save_interval: float = 1.0,
+    ):
+        self.files_dir = os.path.join(batch_dir, "files")
+        self.batches_dir = os.path.join(batch_dir, "batches")
+        os.makedirs(self.files_dir, exist_ok=True)
+        os.makedirs(self.batches_dir, exist_ok=True)
+        self.handler = handler
+        self.load_fn = load_fn
+        self.max_load = max_load
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.save_interval = save_interval
+        # Dict[model -> (time, load)]
+        self.load_cache = {}
+        # Dict[batch_id -> time of the last save]
+        self.last_saved = {}
+        # Dict[batch_id -> asyncio.Task]
+        self.tasks = {}
+        # Dict[batch_id -> batch object]
+        self.batches = {}
+        for name in os.listdir(self.batches_dir):
+            if name.endswith(".json"):
+                with open(
+                    os.path.join(self.batches_dir, name), encoding="utf-8"
+                ) as fin:
+                    batch = json.load(fin)
+                self.batches[batch["id"]] = batch
+
+    # Files
+
+    def file_path(self, file_id: str) -> str:
+        return os.path.join(self.files_dir, os.path.basename(file_id))
+
+    def _create_file(self, filename: str, purpose: str, content: bytes = b""):
+        file_id = f"file-{shortuuid.random()}"
+        with open(self.file_path(file_id), "wb") as fout:
+            fout.write(content)
+        write_json_atomic(
+            self.file_path(file_id) + ".json",
+            {
+                "id": file_id,
+                "object": "file",
+                "created_at": int(time.time()),
+                "filename": filename,
+                "purpose": purpose,
+            },
+        )
+        return self.get_file(file_id)
+
+    def create_file(self, filename: str, content: bytes, purpose: str) -> dict:
+        return self._create_file(filename, purpose, content)
+
+    def get_file(self, file_id: str) -> Optional[dict]:
+        meta_path = self.file_path(file_id) + ".json"
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, encoding="utf-8") as fin:
+            meta = json.load(fin)
+        # Output files grow while their batch runs.
+        meta["bytes"] = os.path.getsize(self.file_path(file_id))
+        return meta
+
+    def list_files(self):
+        return [
+            self.get_file(name[: -len(".json")])
+            for name in sorted(os.listdir(self.files_dir))
+            if name.endswith(".json")
+        ]
+
+    def delete_file(self, file_id: str) -> bool:
+        if self.get_file(file_id) is None:
+            return False
+        os.remove(self.file_path(file_id) + ".json")
+        os.remove(self.file_path(file_id))
+        return True
+
+    # Batches
+
+    def _save(self, batch: dict, force: bool = True):
+        now = time.time()
+        if not force and now - self.last_saved.get(batch["id"], 0) < self.save_interval:
+            return
+        self.last_saved[batch["id"]] = now
+        write_json_atomic(os.path.join(self.batches_dir, batch["id"] + ".json"), batch)
+
+    def create_batch(
+        self,
+        input_file_id: str,
+        endpoint: str,
+        completion_window: str = "24h",
+        metadata: Optional[dict] = None,
+    ) -> dict:
+        if endpoint not in BATCH_ENDPOINTS:
+            raise ValueError(f"Unsupported endpoint {endpoint}.")
+        if self.get_file(input_file_id) is None:
+            raise ValueError(f"No such file: {input_file_id}.")
+        batch = {
+            "id": f"batch_{shortuuid.random()}",
+            "object": "batch",
+            "endpoint": endpoint,
+            "errors": None,
+            "input_file_id": input_file_id,
+            "completion_window": completion_window,
+            "status": "validating",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "in_progress_at": None,
+            "finalizing_at": None,
+            "completed_at": None,
+            "failed_at": None,
+            "cancelling_at": None,
+            "cancelled_at": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": metadata,
+        }
+        self.batches[batch["id"]] = batch
+        self._save(batch)
+        self._start(batch["id"])
+        return batch
+
+    def get_batch(self, batch_id: str) -> Optional[dict]:
+        return self.batches.get(batch_id)
+
+    def list_batches(self):
+        return sorted(
+            self.batches.values(), key=lambda x: x["created_at"], reverse=True
+        )
+
+    def cancel_batch(self, batch_id: str) -> Optional[dict]:
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return None
+        if batch["status"] in ("validating", "in_progress", "finalizing"):
+            batch.update(status="cancelling", cancelling_at=int(time.time()))
+            self._save(batch)
+            self._start(batch_id)
+        return batch
+
+    def resume(self):
+        """Restart the batches that were active when the server stopped."""
+        for batch_id, batch in self.batches.items():
+            if batch["status"] in ACTIVE_STATES:
+                logger.info(f"Resuming batch {batch_id} ({batch['status']})")
+                self._start(batch_id)
+
+    async def shutdown(self):
+        """Stop the running batches without recording their in-flight requests."""
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _start(self, batch_id: str):
+        if batch_id not in self.tasks:
+            self.tasks[batch_id] = asyncio.create_task(self._run(batch_id))
+
+    async def get_load(self, model: str) -> Optional[float]:
+        cached = self.load_cache.get(model)
+        if cached is not None and time.time() - cached[0] < self.poll_interval / 2:
+            return cached[1]
+        load = await self.load_fn(model)
+        self.load_cache[model] = (time.time(), load)
+        return load
+
+    async def wait_for_capacity(self, model: str, batch: dict):
+        """Wait until the model is below max_load so interactive requests go first."""
+        if self.load_fn is None:
+            return
+        while batch["status"] != "cancelling":
+            load = await self.get_load(model)
+            if load is None or load < self.max_load:
+                return
+            await asyncio.sleep(self.poll_interval)
+
+    async def _run(self, batch_id: str):
+        batch = self.batches[batch_id]
+        try:
+            if batch["status"] == "validating":
+                try:
+                    total = await asyncio.to_thread(
+                        validate_input,
+                        self.file_path(batch["input_file_id"]),
+                        batch["endpoint"],
+                    )
+                except (ValueError, OSError) as e:
+                    batch.update(
+                        status="failed",
+                        failed_at=int(time.time()),
+                        errors={
+                            "object": "list",
+                            "data": [{"code": "invalid_input", "message": str(e)}],
+                        },
+                    )
+                    return
+                if batch["status"] == "cancelling":
+                    # Cancelled while the input was validated
+                    batch.update(status="cancelled", cancelled_at=int(time.time()))
+                    return
+                output_file = self._create_file(
+                    f"{batch_id}_output.jsonl", "batch_output"
+                )
+                error_file = self._create_file(
+                    f"{batch_id}_error.jsonl", "batch_output"
+                )
+                batch.update(
+                    status="in_progress",
+                    in_progress_at=int(time.time()),
+                    output_file_id=output_file["id"],
+                    error_file_id=error_file["id"],
+                    request_counts={"total": total, "completed": 0, "failed": 0},
+                )
+                self._save(batch)
+
+            if batch["status"] in ("in_progress", "finalizing"):
+                output_path = self.file_path(batch["output_file_id"])
+                error_path = self.file_path(batch["error_file_id"])
+                counts = batch["request_counts"]
+                counts["completed"] = len(read_done_ids(output_path))
+                counts["failed"] = len(read_done_ids(error_path))
+
+                def on_result(ok):
+                    counts["completed" if ok else "failed"] += 1
+                    self._save(batch, force=False)
+
+                await run_batch_file(
+                    self.file_path(batch["input_file_id"]),
+                    output_path,
+                    error_path,
+                    self.handler,
+                    endpoint=batch["endpoint"],
+                    concurrency=self.concurrency,
+                    wait_for_capacity=lambda model: self.wait_for_capacity(
+                        model, batch
+                    ),
+                    should_stop=lambda: batch["status"] == "cancelling",
+                    on_result=on_result,
+                )
+                if batch["status"] != "cancelling":
+                    batch.update(status="finalizing", finalizing_at=int(time.time()))
+                    self._save(batch)
+                    batch.update(status="completed", completed_at=int(time.time()))
+
+            if batch["status"] == "cancelling":
+                batch.update(status="cancelled", cancelled_at=int(time.time()))
+        except asyncio.CancelledError:
+            # The server is shutting down; the batch resumes on the next start.
+            raise
+        except Exception as e:
+            logger.error(f"Batch {batch_id} failed: {e}")
+            batch.update(
+                status="failed",
+                failed_at=int(time.time()),
+                errors={
+                    "object": "list",
+                    "data": [{"code": "internal_error", "message": str(e)}],
+                },
+            )
+        finally:
+            self._save(batch)
+            self.tasks.pop(batch_id, None)
+
+
+def create_local_handler(worker) -> Handler:
+    """A handler that runs chat and completion requests on an in-process model worker."""
+    from fastchat.protocol.api_protocol import (
+        APIChatCompletionRequest,
+        ChatCompletionResponse,
+        ChatCompletionResponseChoice,
+        ChatMessage,
+        CompletionRequest,
+        CompletionResponse,
+        CompletionResponseChoice,
+        UsageInfo,
+    )
+    from fastchat.serve.openai_api_server import add_chat_messages, merge_stop
+
+    async def handler(url: str, body: dict):
+        if url == "/v1/chat/completions":
+            request = APIChatCompletionRequest(**body)
+            conv = worker.conv.copy()
+            max_new_tokens = request.max_tokens or 512
+            if isinstance(request.messages, str):
+                prompt = request.messages
+            else:
+                add_chat_messages(conv, request.messages)
+                conv.fit_to_token_budget(
+                    worker.context_len - max_new_tokens - 8,
+                    lambda text: worker.count_token({"prompt": text})["count"],
+                )
+                prompt = conv.get_prompt()
+            echo = False
+            logprobs = None
+        elif url == "/v1/completions":
+            request = CompletionRequest(**body)
+            if not isinstance(request.prompt, str):
+                return 400, {"error": {"message": "prompt must be a string"}}
+            conv = worker.conv
+            prompt = request.prompt
+            max_new_tokens = (
+                request.max_tokens if request.max_tokens is not None else 16
+            )
+            echo = request.echo
+            logprobs = request.logprobs
+        else:
+            return 400, {"error": {"message": f"Unsupported url {url}"}}
+
+        params = {
+            "model": request.model,
+            "prompt": prompt,
+            "temperature": request.temperature,
+            "top_p": request.top_p,
+            "max_new_tokens": max_new_tokens,
+            "stop": merge_stop(conv.stop_str, request.stop),
+            "stop_token_ids": conv.stop_token_ids,
+            "echo": echo,
+            "logprobs": logprobs,
+        }
+        output = await asyncio.to_thread(worker.generate_gate, params)
+        if output.get("error_code"):
+            return 500, {"error": {"message": output.get("text", "")}}
+
+        usage = UsageInfo(**output.get("usage", {}))
+        finish_reason = output.get("finish_reason", "stop")
+        if url == "/v1/chat/completions":
+            response = ChatCompletionResponse(
+                model=request.model,
+                choices=[
+                    ChatCompletionResponseChoice(
+                        index=0,
+                        message=ChatMessage(role="assistant", content=output["text"]),
+                        finish_reason=finish_reason,
+                    )
+                ],
+                usage=usage,
+            )
+        else:
+            response = CompletionResponse(
+                model=request.model,
+                choices=[
+                    CompletionResponseChoice(
+                        index=0,
+                        text=output["text"],
+                        logprobs=output.get("logprobs"),
+                        finish_reason=finish_reason,
+                    )
+                ],
+                usage=usage,
+            )
+        return 200, response.model_dump()
+
+    return handler
+
+
+def main():
+    from fastchat.model.model_adapter import add_model_args
+    from fastchat.modules.awq import AWQConfig
+    from fastchat.modules.exllama import ExllamaConfig
+    from fastchat.modules.gptq import GptqConfig
+    from fastchat.modules.xfastertransformer import XftConfig
+    from fastchat.serve.model_worker import ModelWorker
+    from fastchat.utils import str_to_torch_dtype
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input-file", type=str, required=True)
+    parser.add_argument("--output-file", type=str, required=True)
+    parser.add_argument(
+        "--error-file",
+        type=str,
+        default=None,
+        help="Where failed requests go. Defaults to <output-file>.errors.jsonl",
+    )
+    parser.add_argument(
+        "--endpoint",
+        type=str,
+        default="/v1/chat/completions",
+        choices=["/v1/chat/completions", "/v1/completions"],
+        help="The url of input lines that do not set one",
+    )
+    parser.add_argument("--concurrency", type=int, default=1)
+    add_model_args(parser)
+    parser.add_argument(
+        "--model-names",
+        type=lambda s: s.split(","),
+        help="Optional display comma separated names",
+    )
+    parser.add_argument(
+        "--conv-template", type=str, default=None, help="Conversation prompt template."
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    total = validate_input(args.input_file)
+    worker = ModelWorker(
+        None,
+        None,
+        "batch",
+        args.model_path,
+        args.model_names,
+        args.concurrency,
+        True,
+        args.device,
+        args.num_gpus,
+        args.max_gpu_memory,
+        revision=args.revision,
+        dtype=str_to_torch_dtype(args.dtype),
+        load_8bit=args.load_8bit,
+        cpu_offloading=args.cpu_offloading,
+        gptq_config=GptqConfig(
+            ckpt=args.gptq_ckpt or args.model_path,
+            wbits=args.gptq_wbits,
+            groupsize=args.gptq_groupsize,
+            act_order=args.gptq_act_order,
+        ),
+        awq_config=AWQConfig(
+            ckpt=args.awq_ckpt or args.model_path,
+            wbits=args.awq_wbits,
+            groupsize=args.awq_groupsize,
+        ),
+        exllama_config=ExllamaConfig(
+            max_seq_len=args.exllama_max_seq_len,
+            gpu_split=args.exllama_gpu_split,
+            cache_8bit=args.exllama_cache_8bit,
+        ),
+        xft_config=XftConfig(
+            max_seq_len=args.xft_max_seq_len,
+            data_type=args.xft_dtype,
+        ),
+        conv_template=args.conv_template,
+        seed=args.seed,
+    )
+
+    start = time.time()
+    progress = {"done": 0}
+
+    def on_result(ok):
+        progress["done"] += 1
+        if progress["done"] % 10 == 0:
+            elapsed = time.time() - start
+            print(f"{progress['done']} requests in {elapsed:.1f} s")
+
+    counts = asyncio.run(
+        run_batch_file(
+            args.input_file,
+            args.output_file,
+            args.error_file or args.output_file + ".errors.jsonl",
+            create_local_handler(worker),
+            endpoint=args.endpoint,
+            concurrency=args.concurrency,
+            on_result=on_result,
+        )
+    )
+    print(
+        f"Total: {total}, completed: {counts['completed']}, failed: {counts['failed']}, "
+        f"skipped (already done): {counts['skipped']}, time: {time.time() - start:.1f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Single-flight coalescing of identical concurrent generations.
+
+When identical greedy requests arrive while one of them is still being
+generated, only the first one reaches a worker. Its output stream is read by
+a background task into a shared buffer, and every request for the same key,
+including the first, follows that buffer. Requests that join late replay the
+buffer from the start and then follow it live.
+
+The generation does not belong to any single client. If the first client
+disconnects, the others keep receiving tokens. The upstream stream is only
+cancelled, and the worker freed, once every subscriber has gone.
+"""
+import asyncio
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from fastchat.utils import build_logger
+
+logger = build_logger("coalescing", "coalescing.log")
+
+# (new text, finish_reason) pairs as produced by stream_text_deltas
+Deltas = AsyncIterator[Tuple[str, Optional[str]]]
+
+
+class Flight:
+    """One in-flight generation and the clients following it."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.deltas: List[Tuple[str, Optional[str]]] = []
+        # Filled by the upstream stream, e.g. with the final usage
+        self.final: Dict = {}
+        self.done = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        # Replaced after every change, so a waiter wakes up exactly once
+        self.changed = asyncio.Event()
+
+    def notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class SingleFlight:
+    def __init__(self):
+        # Dict[key -> Flight]. A flight is removed as soon as it finishes.
+        self.flights: Dict[str, Flight] = {}
+        self.metrics = {"leaders": 0, "followers": 0, "abandoned": 0}
+
+    def subscribe(
+        self, key: str, start: Callable[[Dict], Deltas]
+    ) -> Tuple[Deltas, Dict]:
+        """
+        Follow the generation for key, starting it with start(final) if none is running.
+        Returns the deltas and the dict the upstream stream fills in when it finishes.
+        """
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = Flight(key)
+            self.flights[key] = flight
+            flight.task = asyncio.create_task(
+                self._produce(flight, start(flight.final))
+            )
+            self.metrics["leaders"] += 1
+        else:
+            self.metrics["followers"] += 1
+        flight.subscribers += 1
+        return self._follow(flight), flight.final
+
+    async def _produce(self, flight: Flight, deltas: Deltas):
+        try:
+            async for item in deltas:
+                flight.deltas.append(item)
+                flight.notify()
+        except Exception as e:
+            logger.error(f"Coalesced generation failed: {e}")
+        finally:
+            await deltas.aclose()
+            flight.done = True
+            self._remove(flight)
+            flight.notify()
+
+    async def _follow(self, flight: Flight):
+        pos = 0
+        try:
+            while True:
+                while pos < len(flight.deltas):
+                    yield flight.deltas[pos]
+                    pos += 1
+                if flight.done:
+                    return
+                await flight.changed.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # Nobody is listening anymore, so stop the worker.
+                self.metrics["abandoned"] += 1
+                self._remove(flight)
+                flight.task.cancel()
+
+    def _remove(self, flight: Flight):
+        if self.flights.get(flight.key) is flight:
+            del self.flights[flight.key]
+
+    def get_metrics(self) -> dict:
+        return {**self.metrics, "in_flight": len(self.flights)}
@@ -3,27 +3,35 @@ A controller manages distributed workers.
 It sends worker addresses to clients.
 """
 import argparse
-import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import dataclasses
 from enum import Enum, auto
-import json
 import logging
+import math
 import os
+import sqlite3
 import time
-from typing import List, Union
+from typing import Dict, List, Optional
 import threading
 
 from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse
 import numpy as np
 import requests
 import uvicorn
 
 from fastchat.constants import (
+    CONTROLLER_ADMISSION_RETRY_AFTER,
     CONTROLLER_HEART_BEAT_EXPIRATION,
+    CONTROLLER_STATE_REVALIDATE_TIMEOUT,
+    CONTROLLER_STATE_SYNC_INTERVAL,
     WORKER_API_TIMEOUT,
     ErrorCode,
-    SERVER_ERROR_MSG,
+)
+from fastchat.serve.controller_state import (
+    STATE_BACKENDS,
+    StateBackend,
+    create_state_backend,
 )
 from fastchat.utils import build_logger
 
@@ -33,14 +41,37 @@ app = FastAPI() # Define the FastAPI app instance globally
 controller_instance: 'Controller' = None # Global controller instance
 
 
+class DispatchMethod(Enum):
+    LOTTERY = auto()
+    SHORTEST_QUEUE = auto()
+
+    @classmethod
+    def from_str(cls, name):
+        if name == "lottery":
+            return cls.LOTTERY
+        elif name == "shortest_queue":
+            return cls.SHORTEST_QUEUE
+        else:
+            raise ValueError(f"Invalid dispatch method: {name}")
+
+
 @dataclasses.dataclass
 class WorkerInfo:
-    model_names: List[str]  # Will be a list with one model name
+    model_names: List[str]
     speed: int
     queue_length: int
     check_heart_beat: bool
     last_heart_beat: str
     multimodal: bool # Keep for now, can be removed if vision is not planned for yeongjopt
+    capacity: int = 0 # Concurrent generation slots; 0 means unknown
+    queued_tokens: int = 0 # Generation budget of admitted requests
+    dispatched: int = 0 # Requests routed here since the last heartbeat
+    registered_at: float = 0.0 # Time of the last registration; clients use it to invalidate caches
+
+
+def get_queue_delay(w_info: WorkerInfo) -> float:
+    """Queued and freshly routed requests per unit of speed. Speed must be positive."""
+    return (w_info.queue_length + w_info.dispatched) / w_info.speed
 
 
 def heart_beat_controller(controller_obj: 'Controller'): # Use a more descriptive name for 'controller' argument
@@ -51,8 +82,26 @@ def heart_beat_controller(controller_obj: 'Controller'): # Use a more descriptiv
 
 
 class Controller:
-    def __init__(self, dispatch_method: str = "shortest_queue"): # dispatch_method is vestigial
-        self.worker_info = {} # Stores info for the single worker
+    def __init__(
+        self,
+        dispatch_method: str = "shortest_queue",
+        state_backend: Optional[StateBackend] = None,
+        max_model_load: Optional[float] = None,
+        model_dispatch_methods: Optional[Dict[str, str]] = None,
+    ):
+        # Dict[str -> WorkerInfo]. The workers serving a model form its pool.
+        self.worker_info = {}
+        self.dispatch_method = DispatchMethod.from_str(dispatch_method)
+        self.model_dispatch_methods = {
+            model_name: DispatchMethod.from_str(method)
+            for model_name, method in (model_dispatch_methods or {}).items()
+        }
+        self.max_model_load = max_model_load
+        self.state_backend = state_backend
+        self.last_state_sync = 0.0
+        if self.state_backend is not None:
+            self.load_state()
+
         self.heart_beat_thread = threading.Thread(
             target=heart_beat_controller, args=(self,)
         )
@@ -66,53 +115,39 @@ class Controller:
         worker_status: dict,
         multimodal: bool,
     ):
-        if not self.worker_info: # Only allow one worker
-            logger.info(f"Registering worker: {worker_name}")
-            if not worker_status: # Attempt to get status if not provided
-                worker_status = self.get_worker_status_direct(worker_name) # Renamed to avoid conflict
-            if not worker_status:
-                logger.error(f"Failed to get status for worker {worker_name} during registration.")
-                return False
-
-            self.worker_info[worker_name] = WorkerInfo(
-                worker_status["model_names"],
-                worker_status["speed"],
-                worker_status["queue_length"],
-                check_heart_beat,
-                time.time(),
-                multimodal,
-            )
-            logger.info(f"Register done: {worker_name}, {worker_status}")
-            return True
+        self.sync_state(force=True)
+        if worker_name not in self.worker_info:
+            logger.info(f"Register a new worker: {worker_name}")
         else:
-            # Prevent re-registering if a worker already exists.
-            if worker_name not in self.worker_info:
-                 logger.warning(f"A worker is already registered. Ignoring new registration: {worker_name}")
-                 return False # Do not allow a new worker if one is already registered
-            else: # Allow re-registration of the same worker (e.g. on restart)
-                 logger.info(f"Re-registering existing worker: {worker_name}")
-                 # Update status
-                 if not worker_status:
-                    worker_status = self.get_worker_status_direct(worker_name)
-                 if not worker_status:
-                    logger.error(f"Failed to get status for worker {worker_name} during re-registration.")
-                    return False
-                 self.worker_info[worker_name] = WorkerInfo(
-                    worker_status["model_names"],
-                    worker_status["speed"],
-                    worker_status["queue_length"],
-                    check_heart_beat,
-                    time.time(),
-                    multimodal,
-                )
-                 logger.info(f"Re-register done: {worker_name}, {worker_status}")
-                 return True
-
-
-    def get_worker_status_direct(self, worker_name: str): # Renamed for clarity
+            logger.info(f"Register an existing worker: {worker_name}")
+
+        if not worker_status:
+            worker_status = self.get_worker_status_direct(worker_name)
+        if not worker_status:
+            logger.error(f"Failed to get status for worker {worker_name} during registration.")
+            return False
+
+        self.worker_info[worker_name] = WorkerInfo(
+            worker_status["model_names"],
+            worker_status["speed"],
+            worker_status["queue_length"],
+            check_heart_beat,
+            time.time(),
+            multimodal,
+            worker_status.get("capacity", 0),
+            worker_status.get("queued_tokens", 0),
+            registered_at=time.time(),
+        )
+        logger.info(f"Register done: {worker_name}, {worker_status}")
+        self.persist_worker(worker_name)
+        return True
+
+    def get_worker_status_direct(
+        self, worker_name: str, timeout: float = WORKER_API_TIMEOUT
+    ): # Renamed for clarity
         # This method directly fetches status, used internally
         try:
-            r = requests.post(worker_name + "/worker_get_status", timeout=WORKER_API_TIMEOUT)
+            r = requests.post(worker_name + "/worker_get_status", timeout=timeout)
             r.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
             return r.json()
         except requests.exceptions.RequestException as e:
@@ -123,59 +158,241 @@ class Controller:
         if worker_name in self.worker_info:
             del self.worker_info[worker_name]
             logger.info(f"Removed worker: {worker_name}")
+            self.persist_worker(worker_name)
 
-    def refresh_all_workers(self):
-        if self.worker_info:
-            worker_name = list(self.worker_info.keys())[0]
-            # w_info = self.worker_info[worker_name] # Not used
-            if not self.get_worker_status_direct(worker_name):
-                 logger.warning(f"Stale worker detected during refresh: {worker_name}. Removing.")
-                 self.remove_worker(worker_name)
+    def persist_worker(self, worker_name: str):
+        """Write one registry entry through to the state backend, if enabled."""
+        if self.state_backend is None:
+            return
+        w_info = self.worker_info.get(worker_name)
+        try:
+            if w_info is None:
+                self.state_backend.delete(worker_name)
             else:
-                 logger.info(f"Refreshed worker: {worker_name}")
-        else:
-            logger.info("No worker to refresh.")
+                self.state_backend.put(worker_name, dataclasses.asdict(w_info))
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"Failed to persist worker {worker_name}: {e}")
 
-    def list_models(self):
-        if self.worker_info:
-            worker = list(self.worker_info.values())[0]
-            return worker.model_names
-        return []
+    def load_state(self):
+        """
+        Restore the worker registry from the state backend.
 
-    def list_multimodal_models(self): # Retained for compatibility, behavior simplified
-        if self.worker_info:
-            worker = list(self.worker_info.values())[0]
-            if worker.multimodal:
-                return worker.model_names
-        return []
+        Restored workers are routable immediately; a background thread
+        re-validates all of them in parallel and drops the ones that are gone.
+        """
+        try:
+            stored = self.state_backend.load()
+        except (OSError, ValueError, sqlite3.Error) as e:
+            logger.error(f"Failed to load controller state: {e}")
+            return
+
+        now = time.time()
+        for worker_name, w_info in stored.items():
+            w_info["last_heart_beat"] = now
+            self.worker_info[worker_name] = WorkerInfo(**w_info)
+        self.last_state_sync = now
+        logger.info(f"Restored {len(stored)} worker(s) from controller state.")
 
-    def list_language_models(self): # Retained for compatibility, behavior simplified
         if self.worker_info:
-            worker = list(self.worker_info.values())[0]
-            if not worker.multimodal:
-                return worker.model_names
-        return []
+            threading.Thread(
+                target=self.revalidate_workers, daemon=True
+            ).start()
+
+    def sync_state(self, force: bool = False):
+        """Reload the registry written by other replicas (shared backends only)."""
+        if self.state_backend is None or not self.state_backend.shared:
+            return
+        now = time.time()
+        if not force and now - self.last_state_sync < CONTROLLER_STATE_SYNC_INTERVAL:
+            return
+        self.last_state_sync = now
+        try:
+            stored = self.state_backend.load()
+        except (ValueError, sqlite3.Error) as e:
+            logger.error(f"Failed to sync controller state: {e}")
+            return
+        self.worker_info = {
+            worker_name: WorkerInfo(**w_info) for worker_name, w_info in stored.items()
+        }
+
+    def revalidate_workers(self):
+        """Query every known worker in parallel and drop those that fail."""
+        worker_names = list(self.worker_info.keys())
+        with ThreadPoolExecutor(max_workers=min(len(worker_names), 32)) as pool:
+            statuses = pool.map(
+                lambda name: self.get_worker_status_direct(
+                    name, timeout=CONTROLLER_STATE_REVALIDATE_TIMEOUT
+                ),
+                worker_names,
+            )
+            for worker_name, worker_status in zip(worker_names, statuses):
+                w_info = self.worker_info.get(worker_name)
+                if w_info is None:
+                    continue
+                if worker_status is None:
+                    logger.warning(f"Restored worker {worker_name} is gone. Removing.")
+                    self.remove_worker(worker_name)
+                    continue
+                w_info.model_names = worker_status["model_names"]
+                w_info.speed = worker_status["speed"]
+                w_info.queue_length = worker_status["queue_length"]
+                w_info.capacity = worker_status.get("capacity", 0)
+                w_info.queued_tokens = worker_status.get("queued_tokens", 0)
+                w_info.last_heart_beat = time.time()
+                self.persist_worker(worker_name)
+                logger.info(f"Re-validated restored worker: {worker_name}")
+
+    def refresh_all_workers(self):
+        self.sync_state(force=True)
+        if not self.worker_info:
+            logger.info("No worker to refresh.")
+        for worker_name in list(self.worker_info.keys()):
+            if not self.get_worker_status_direct(worker_name):
+                logger.warning(f"Stale worker detected during refresh: {worker_name}. Removing.")
+                self.remove_worker(worker_name)
+            else:
+                logger.info(f"Refreshed worker: {worker_name}")
+
+    def list_models(self, multimodal: Optional[bool] = None):
+        """List the models of all workers, optionally filtered by modality."""
+        self.sync_state()
+        model_names = set()
+        for w_info in list(self.worker_info.values()):
+            if multimodal is None or w_info.multimodal == multimodal:
+                model_names.update(w_info.model_names)
+        return sorted(model_names)
+
+    def list_multimodal_models(self):
+        return self.list_models(multimodal=True)
+
+    def list_language_models(self):
+        return self.list_models(multimodal=False)
+
+    def get_model_pool(self, model_name: str):
+        """Return [(worker_name, WorkerInfo)] of the workers serving a model."""
+        return [
+            (worker_name, w_info)
+            for worker_name, w_info in list(self.worker_info.items())
+            if model_name in w_info.model_names
+        ]
+
+    def get_dispatch_pool(self, model_name: str):
+        """The model pool without the workers that report a speed of 0."""
+        return [x for x in self.get_model_pool(model_name) if x[1].speed > 0]
 
     def get_worker_address(self, model_name: str):
-        if self.worker_info:
-            worker_name = list(self.worker_info.keys())[0] # Get the first (and only) worker
-            worker_data = self.worker_info[worker_name]
-            if model_name in worker_data.model_names:
-                # logger.info(f"Get worker address for {model_name}: {worker_name}") # Too verbose
-                return worker_name
-        logger.warning(f"No worker available for model: {model_name}")
-        return ""
-
-    def receive_heart_beat(self, worker_name: str, queue_length: int):
+        """Dispatch a request to a worker of a model. "" if none can take it."""
+        self.sync_state()
+        pool = self.get_dispatch_pool(model_name)
+        if not pool:
+            # The worker may have just registered through another replica.
+            self.sync_state(force=True)
+            pool = self.get_dispatch_pool(model_name)
+        if not pool:
+            logger.warning(f"No worker available for model: {model_name}")
+            return ""
+
+        dispatch_method = self.model_dispatch_methods.get(
+            model_name, self.dispatch_method
+        )
+        if dispatch_method == DispatchMethod.LOTTERY:
+            worker_speeds = np.array([w_info.speed for _, w_info in pool], dtype=np.float32)
+            norm = np.sum(worker_speeds)
+            pt = np.random.choice(np.arange(len(pool)), p=worker_speeds / norm)
+            worker_name, w_info = pool[pt]
+        elif dispatch_method == DispatchMethod.SHORTEST_QUEUE:
+            worker_name, w_info = min(pool, key=lambda x: get_queue_delay(x[1]))
+        else:
+            raise ValueError(f"Invalid dispatch method: {dispatch_method}")
+        # Requests routed since the last heartbeat are not in queue_length yet.
+        w_info.dispatched += 1
+        return worker_name
+
+    def get_worker_addresses(self, model_name: str, num_workers: int):
+        """
+        Return up to num_workers distinct workers of a model: the dispatched
+        one first, then fallbacks for retries and hedging, least loaded first.
+        Only the dispatched one is counted in WorkerInfo.dispatched.
+        """
+        first = self.get_worker_address(model_name)
+        if not first:
+            return []
+        fallbacks = sorted(
+            (x for x in self.get_dispatch_pool(model_name) if x[0] != first),
+            key=lambda x: get_queue_delay(x[1]),
+        )
+        return [first] + [worker_name for worker_name, _ in fallbacks[: num_workers - 1]]
+
+    def get_model_registered_at(self, model_name: str):
+        """The latest registration time among the workers serving a model."""
+        return max(
+            (w_info.registered_at for _, w_info in self.get_model_pool(model_name)),
+            default=0.0,
+        )
+
+    def get_model_load(self, model_name: str):
+        """Aggregate the load reported by all workers serving a model."""
+        self.sync_state()
+        ret = {
+            "model": model_name,
+            "num_workers": 0,
+            "queue_length": 0,
+            "dispatched": 0,
+            "capacity": 0,
+            "queued_tokens": 0,
+            "load": 0.0,
+        }
+        for w_info in list(self.worker_info.values()):
+            if model_name not in w_info.model_names:
+                continue
+            ret["num_workers"] += 1
+            ret["queue_length"] += w_info.queue_length
+            ret["dispatched"] += w_info.dispatched
+            ret["capacity"] += w_info.capacity
+            ret["queued_tokens"] += w_info.queued_tokens
+        if ret["capacity"] > 0:
+            ret["load"] = (ret["queue_length"] + ret["dispatched"]) / ret["capacity"]
+        return ret
+
+    def list_model_loads(self):
+        return [self.get_model_load(model_name) for model_name in self.list_models()]
+
+    def check_admission(self, model_name: str):
+        """
+        Return None if a request for the model can be admitted. Otherwise,
+        return the suggested number of seconds before the client retries.
+        """
+        if self.max_model_load is None:
+            return None
+        model_load = self.get_model_load(model_name)
+        if model_load["capacity"] == 0 or model_load["load"] < self.max_model_load:
+            return None
+        return math.ceil(
+            CONTROLLER_ADMISSION_RETRY_AFTER * model_load["load"] / self.max_model_load
+        )
+
+    def receive_heart_beat(
+        self, worker_name: str, queue_length: int, queued_tokens: Optional[int] = None
+    ):
+        if worker_name not in self.worker_info:
+            # The worker may have registered through another replica.
+            self.sync_state(force=True)
         if worker_name in self.worker_info:
             self.worker_info[worker_name].queue_length = queue_length
+            self.worker_info[worker_name].dispatched = 0
+            if queued_tokens is not None:
+                self.worker_info[worker_name].queued_tokens = queued_tokens
             self.worker_info[worker_name].last_heart_beat = time.time()
+            if self.state_backend is not None and self.state_backend.shared:
+                # Other replicas judge liveness from the shared heartbeat.
+                self.persist_worker(worker_name)
             return True
         # else: # Do not log for unknown heartbeats if they are frequent
             # logger.info(f"Receive unknown heart beat from {worker_name}")
         return False
 
     def remove_stale_workers_by_expiration(self):
+        self.sync_state(force=True)
         expire = time.time() - CONTROLLER_HEART_BEAT_EXPIRATION
         to_delete = []
         # Iterate over a copy for safe deletion
@@ -187,8 +404,6 @@ class Controller:
             logger.warning(f"Worker {worker_name} timed out. Removing.")
             self.remove_worker(worker_name)
 
-    # Removed worker_api_get_status and worker_api_generate_stream from Controller class
-    # as controller no longer acts as a worker.
 
 # FastAPI Endpoints
 @app.post("/register_worker")
@@ -229,20 +444,65 @@ async def app_list_language_models():
     models = controller_instance.list_language_models()
     return {"models": models}
 
+def overloaded_response(model_name: str, retry_after: int):
+    logger.warning(f"Model {model_name} is overloaded. Rejecting request.")
+    return JSONResponse(
+        status_code=429,
+        content={
+            "address": "",
+            "addresses": [],
+            "error_code": ErrorCode.ENGINE_OVERLOADED,
+            "retry_after": retry_after,
+        },
+        headers={"Retry-After": str(retry_after)},
+    )
+
 @app.post("/get_worker_address")
 async def app_get_worker_address(request: Request):
     global controller_instance
     data = await request.json()
+    retry_after = controller_instance.check_admission(data["model"])
+    if retry_after is not None:
+        return overloaded_response(data["model"], retry_after)
     addr = controller_instance.get_worker_address(data["model"])
+    if not addr:
+        return {"address": "", "error_code": ErrorCode.CONTROLLER_NO_WORKER}
     return {"address": addr}
 
+@app.post("/get_worker_addresses")
+async def app_get_worker_addresses(request: Request):
+    global controller_instance
+    data = await request.json()
+    retry_after = controller_instance.check_admission(data["model"])
+    if retry_after is not None:
+        return overloaded_response(data["model"], retry_after)
+    addrs = controller_instance.get_worker_addresses(
+        data["model"], data.get("num_workers", 1)
+    )
+    if not addrs:
+        return {"addresses": [], "error_code": ErrorCode.CONTROLLER_NO_WORKER}
+    return {
+        "addresses": addrs,
+        "registered_at": controller_instance.get_model_registered_at(data["model"]),
+    }
+
 @app.post("/receive_heart_beat")
 async def app_receive_heart_beat(request: Request):
     global controller_instance
     data = await request.json()
-    exist = controller_instance.receive_heart_beat(data["worker_name"], data["queue_length"])
+    exist = controller_instance.receive_heart_beat(
+        data["worker_name"], data["queue_length"], data.get("queued_tokens")
+    )
     return {"exist": exist}
 
+@app.get("/metrics/model_load")
+async def app_metrics_model_load():
+    global controller_instance
+    return {
+        "max_model_load": controller_instance.max_model_load,
+        "models": controller_instance.list_model_loads(),
+    }
+
 @app.get("/test_connection")
 async def app_test_connection():
     return {"message": "Controller is active."}
@@ -250,7 +510,19 @@ async def app_test_connection():
 
 def create_fastapi_app(args): # Renamed from create_controller to avoid confusion
     global controller_instance
-    controller_instance = Controller(args.dispatch_method) # dispatch_method is vestigial
+    state_backend = None
+    if args.state_file:
+        state_backend = create_state_backend(args.state_backend, args.state_file)
+    model_dispatch_methods = {}
+    for item in args.model_dispatch_method or []:
+        model_name, _, method = item.partition("=")
+        model_dispatch_methods[model_name] = method
+    controller_instance = Controller(
+        args.dispatch_method,
+        state_backend=state_backend,
+        max_model_load=args.max_model_load,
+        model_dispatch_methods=model_dispatch_methods,
+    )
     logger.info("FastChat YeongjoPT Controller is running.")
     return app # Return the global app instance with routes attached
 
@@ -260,10 +532,38 @@ if __name__ == "__main__":
     parser.add_argument("--host", type=str, default="localhost")
     parser.add_argument("--port", type=int, default=21001)
     parser.add_argument(
-        "--dispatch-method", # This argument is no longer used by Controller logic
+        "--dispatch-method",
         type=str,
-        default="shortest_queue", # Default value, but logic is removed
-        choices=["lottery", "shortest_queue"], # Kept for CLI compatibility for now
+        default="shortest_queue",
+        choices=["lottery", "shortest_queue"],
+        help="Default policy for picking a worker from a model's pool.",
+    )
+    parser.add_argument(
+        "--model-dispatch-method",
+        type=lambda s: s.split(","),
+        default=None,
+        help="Per-model dispatch policies, e.g. 'model-a=lottery,model-b=shortest_queue'.",
+    )
+    parser.add_argument(
+        "--state-file",
+        type=str,
+        default=None,
+        help="Persist the worker registry to this path and restore it on startup.",
+    )
+    parser.add_argument(
+        "--state-backend",
+        type=str,
+        default="file",
+        choices=list(STATE_BACKENDS.keys()),
+        help="Registry backend for --state-file. 'sqlite' can be shared by "
+        "several controller replicas on one machine.",
+    )
+    parser.add_argument(
+        "--max-model-load",
+        type=float,
+        default=None,
+        help="Reject /get_worker_address with 429 once a model's queued requests "
+        "reach this multiple of its workers' concurrency. Disabled by default.",
     )
     parser.add_argument(
         "--ssl",
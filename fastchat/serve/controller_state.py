@@ -0,0 +1,133 @@
+"""
+Storage backends for the controller worker registry.
+
+The controller keeps its routing table in memory and writes every change
+through to a backend. A non-shared backend is only a crash-recovery snapshot.
+A shared backend lets several controller replicas on one machine serve the
+same registry: every replica writes through and periodically reloads it.
+"""
+import abc
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict
+
+
+class StateBackend(abc.ABC):
+    """Base class of the worker registry storage."""
+
+    # Whether other controller processes read the same state.
+    shared = False
+
+    @abc.abstractmethod
+    def load(self) -> Dict[str, dict]:
+        """Return all stored workers as {worker_name: worker_info_dict}."""
+
+    @abc.abstractmethod
+    def put(self, worker_name: str, worker_info: dict):
+        """Insert or replace one worker."""
+
+    @abc.abstractmethod
+    def delete(self, worker_name: str):
+        """Remove one worker. Removing an unknown worker is a no-op."""
+
+
+class FileStateBackend(StateBackend):
+    """A JSON snapshot of the whole registry, replaced atomically on change."""
+
+    shared = False
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.workers = {}
+
+    def load(self):
+        with self.lock:
+            if not os.path.exists(self.path):
+                self.workers = {}
+            else:
+                with open(self.path, "r", encoding="utf-8") as fin:
+                    self.workers = json.load(fin).get("workers", {})
+            return dict(self.workers)
+
+    def put(self, worker_name, worker_info):
+        with self.lock:
+            self.workers[worker_name] = worker_info
+            self._write()
+
+    def delete(self, worker_name):
+        with self.lock:
+            if self.workers.pop(worker_name, None) is not None:
+                self._write()
+
+    def _write(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fout:
+            json.dump({"workers": self.workers}, fout)
+            fout.flush()
+            os.fsync(fout.fileno())
+        # os.replace is atomic, so readers never see a partial snapshot.
+        os.replace(tmp_path, self.path)
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    A registry table in a SQLite database.
+
+    Several controller replicas on the same machine can point at one database
+    file; WAL mode lets them read concurrently while one of them writes.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # One connection, shared by the request handlers and the heartbeat
+        # thread. The lock keeps them from using it at the same time.
+        self.conn = sqlite3.connect(
+            self.path, timeout=self.timeout, check_same_thread=False
+        )
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS workers ("
+                "worker_name TEXT PRIMARY KEY, info TEXT NOT NULL, updated REAL)"
+            )
+
+    def load(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT worker_name, info FROM workers").fetchall()
+        return {worker_name: json.loads(info) for worker_name, info in rows}
+
+    def put(self, worker_name, worker_info):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO workers VALUES (?, ?, ?)",
+                (worker_name, json.dumps(worker_info), time.time()),
+            )
+
+    def delete(self, worker_name):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM workers WHERE worker_name = ?", (worker_name,)
+            )
+
+
+STATE_BACKENDS = {
+    "file": FileStateBackend,
+    "sqlite": SQLiteStateBackend,
+}
+
+
+def create_state_backend(backend_type: str, path: str) -> StateBackend:
+    """Create a registry backend by name."""
+    if backend_type not in STATE_BACKENDS:
+        raise ValueError(f"Unknown controller state backend: {backend_type}")
+    return STATE_BACKENDS[backend_type](path)
@@ -3,30 +3,35 @@ The gradio demo server for chatting with a single model.
 """
 
 import argparse
-import datetime
-import json
+import asyncio
+import itertools
+import logging
 import os
-import random
 import time
 import uuid
 from typing import List, Dict, Optional
 
 import gradio as gr
+import httpx
 import requests
 
 from fastchat.constants import (
     WORKER_API_TIMEOUT,
-    ErrorCode,
     SERVER_ERROR_MSG,
     INPUT_CHAR_LEN_LIMIT,
+    CONVERSATION_TURN_LIMIT,
+    INACTIVE_MSG,
+    LOGDIR,
+    WORKER_ADDRESS_CACHE_TTL,
 )
+from fastchat.conversation import Conversation
 from fastchat.model.model_adapter import (
     get_conversation_template,
 )
+from fastchat.serve.routing_client import RoutingClient, RoutingPolicy
+from fastchat.serve.session_store import Session, SessionStore
 from fastchat.utils import (
     build_logger,
-    get_window_url_params_js,
-    load_image,
 )
 
 logger = build_logger("yeongjopt_web_server", "yeongjopt_web_server.log")
@@ -47,24 +52,79 @@ disable_text = gr.Textbox(
 )
 
 controller_url: Optional[str] = None
-
-global_fixed_model_name: str = "yeongjopt-default-model"
+# Min seconds between chatbot updates while a response streams
+ui_update_interval: float = 1 / 20
+# A shared connection pool for the controller and workers. It is created on
+# first use so that it belongs to Gradio's event loop.
+http_client: Optional[httpx.AsyncClient] = None
+routing_client: Optional[RoutingClient] = None
+# Dict[model -> (worker addresses, expiration time)]
+worker_address_cache: Dict[str, tuple] = {}
+# Rotates cached addresses so that chats spread over a model's workers
+worker_address_counter = itertools.count()
+# Dict[model -> context length reported by its workers]
+context_length_cache: Dict[str, int] = {}
+# The conversations of all sessions. Replaced in main_gradio_server.
+session_store = SessionStore()
 
 YEONGJOPT_SYSTEM_PROMPT: str = """당신은 '영조피티'입니다. 실존 인물 조민영의 성격을 반영해, 조롱과 냉소로 질문자에게 응답합니다.
 서울은 강남 3구만 서울이라 여기며, 청바지에 집착하고, 논리 없는 질문에는 무자비하게 비꼽니다."""
 
+class SessionExpired(Exception):
+    pass
+
 class State:
-    "Manages the conversation state for a single user session."    
+    """
+    Manages the conversation state for a single user session. Only the id is kept
+    in the Gradio session; the conversation lives in session_store.
+    """
     def __init__(self, model_name_to_use: str):
-        self.conv = get_conversation_template(model_name_to_use)
-        self.conv.set_system_message(YEONGJOPT_SYSTEM_PROMPT)
+        conv = get_conversation_template(model_name_to_use)
+        conv.set_system_message(YEONGJOPT_SYSTEM_PROMPT)
         self.conv_id = uuid.uuid4().hex
         self.skip_next = False
         self.model_name = model_name_to_use
         self.regen_support = True
-
-    def to_gradio_chatbot(self):
-        return self.conv.to_gradio_chatbot()
+        session_store.create(self.conv_id, conv)
+
+    def get_session(self) -> Optional[Session]:
+        return session_store.get(self.conv_id)
+
+    @property
+    def conv(self) -> Conversation:
+        session = self.get_session()
+        if session is None:
+            raise SessionExpired(self.conv_id)
+        return session.conv
+
+    def to_gradio_chatbot(self, session: Optional[Session] = None):
+        """
+        Render the history for the chatbot. Rows whose messages are unchanged are
+        reused, so while a response streams only the last row is rebuilt.
+        Callers that already hold the session pass it to skip the store lookup.
+        """
+        if session is None:
+            session = self.get_session()
+        if session is None:
+            return [[None, INACTIVE_MSG]]
+        conv = session.conv
+        messages = conv.messages[conv.offset :]
+        rows, sources = [], []
+        for i in range(0, len(messages), 2):
+            user_msg = messages[i][1]
+            bot_msg = messages[i + 1][1] if i + 1 < len(messages) else None
+            j = i // 2
+            if (
+                j < len(session.chatbot_sources)
+                and session.chatbot_sources[j][0] is user_msg
+                and session.chatbot_sources[j][1] is bot_msg
+            ):
+                rows.append(session.chatbot_rows[j])
+            else:
+                rows.append([conv.to_gradio_user_message(user_msg), bot_msg])
+            sources.append((user_msg, bot_msg))
+        session.chatbot_rows, session.chatbot_sources = rows, sources
+        return list(rows)
 
     def to_dict(self): # Renamed from dict to avoid conflict with built-in
         return {
@@ -74,9 +134,9 @@ class State:
         }
 
 class GradioContext:
-    "Holds context for the Gradio app, like the model list (single model for YeongjoPT)."    
-    def __init__(self, models: Optional[List[str]] = None):
-        self.models = models if models else [global_fixed_model_name]
+    "Holds context for the Gradio app, like the list of selectable models."
+    def __init__(self, models: List[str]):
+        self.models = models
 
 context_singleton: Optional[GradioContext] = None
 
@@ -92,50 +152,153 @@ h1, h3 { text-align: center; }
 footer { display: none !important; }
 """
 
-def set_global_vars_yeongjopt(controller_url_provided: str):
-    global controller_url
+def set_global_vars_yeongjopt(
+    controller_url_provided: str,
+    ui_update_fps: float = 20,
+    session_store_provided: Optional[SessionStore] = None,
+):
+    global controller_url, ui_update_interval, session_store
     controller_url = controller_url_provided
-
-def get_model_list_from_controller(controller_addr: str) -> List[str]:
-    global global_fixed_model_name
+    ui_update_interval = 1 / ui_update_fps if ui_update_fps > 0 else 0
+    if session_store_provided is not None:
+        session_store = session_store_provided
+
+def trim_history(conv: Conversation, max_turns: int):
+    """Drop the oldest turns, keeping the template's example turns, so at most max_turns remain."""
+    excess = (len(conv.messages) - conv.offset) // 2 - max_turns
+    if excess > 0:
+        del conv.messages[conv.offset : conv.offset + 2 * excess]
+
+def get_model_list_from_controller(
+    controller_addr: str, model_filter: Optional[List[str]] = None
+) -> List[str]:
+    """Fetch the served models. If model_filter is given, keep only those, in its order."""
     if not controller_addr:
         logger.error("Controller URL is not set. Cannot fetch model list.")
-        return [global_fixed_model_name] # Return default, expect failure later
+        return []
 
     try:
         logger.info(f"Fetching model list from controller: {controller_addr}")
         res = requests.post(controller_addr + "/list_models", timeout=WORKER_API_TIMEOUT)
         res.raise_for_status()
         models_ret = res.json().get("models", [])
-        if models_ret:
-            if len(models_ret) > 1:
-                logger.warning(f"Controller listed multiple models: {models_ret}. YeongjoPT will use the first: {models_ret[0]}")
-            global_fixed_model_name = models_ret[0]
-            logger.info(f"Successfully fetched model from controller: {global_fixed_model_name}")
-            return [global_fixed_model_name]
-        else:
-            logger.error(f"Controller at {controller_addr} listed no models. Using default: {global_fixed_model_name}. This may fail if worker uses a different name.")
-            return [global_fixed_model_name]
     except requests.exceptions.RequestException as e:
-        logger.error(f"Could not connect to controller at {controller_addr} to get model list: {e}. Using default: {global_fixed_model_name}")
-        return [global_fixed_model_name]
-    except Exception as e:
-        logger.error(f"Generic error fetching model list from {controller_addr}: {e}. Using default: {global_fixed_model_name}")
-        return [global_fixed_model_name]
+        logger.error(f"Could not connect to controller at {controller_addr} to get model list: {e}")
+        return []
+
+    if model_filter:
+        models_ret = [model for model in model_filter if model in models_ret]
+    logger.info(f"Models available: {models_ret}")
+    return models_ret
+
+def get_routing_client() -> RoutingClient:
+    global http_client, routing_client
+    if routing_client is None:
+        http_client = httpx.AsyncClient(
+            headers=headers,
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=100),
+            timeout=httpx.Timeout(WORKER_API_TIMEOUT, connect=10.0),
+        )
+        routing_client = RoutingClient(
+            http_client, default_policy=RoutingPolicy(timeout=WORKER_API_TIMEOUT)
+        )
+    return routing_client
+
+class ModelOverloaded(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Retry after {retry_after}s")
+        self.retry_after = retry_after
+
+async def get_worker_addresses(model_name: str) -> List[str]:
+    """
+    Get the workers of a model, the preferred one first. The list is reused for
+    WORKER_ADDRESS_CACHE_TTL seconds, rotated on every call.
+    """
+    cached = worker_address_cache.get(model_name)
+    if cached is not None and cached[1] > time.time():
+        addresses = cached[0]
+        i = next(worker_address_counter) % len(addresses)
+        return addresses[i:] + addresses[:i]
+
+    get_routing_client()
+    res = await http_client.post(
+        controller_url + "/get_worker_addresses",
+        json={"model": model_name, "num_workers": 16},
+        timeout=WORKER_API_TIMEOUT,
+    )
+    if res.status_code == 429:
+        raise ModelOverloaded(res.json().get("retry_after", 1))
+    res.raise_for_status()
+    addresses = res.json().get("addresses", [])
+    if addresses:
+        worker_address_cache[model_name] = (addresses, time.time() + WORKER_ADDRESS_CACHE_TTL)
+    return addresses
+
+async def fit_to_context(conv: Conversation, model_name: str, worker_addr: str, max_new_tokens: int) -> Conversation:
+    """
+    Return the conversation to render the prompt from: a copy without the oldest
+    turns that do not fit in the model's context. The conversation itself keeps its
+    full history for the chatbot and only caches the token counts.
+    """
+    try:
+        if model_name not in context_length_cache:
+            res = await http_client.post(worker_addr + "/model_details", json={"model": model_name}, timeout=WORKER_API_TIMEOUT)
+            res.raise_for_status()
+            context_length_cache[model_name] = res.json().get("context_length")
+        context_length = context_length_cache[model_name]
+        if not context_length:
+            return conv.copy()
+        # Leave room for the output and the special tokens added by the tokenizer
+        budget = context_length - max_new_tokens - 8
+        if conv.get_token_upper_bound() <= budget:
+            return conv.copy()
+
+        texts = conv.get_uncounted_texts()
+        res = await http_client.post(
+            worker_addr + "/count_token",
+            json={"model": model_name, "prompts": texts},
+            timeout=WORKER_API_TIMEOUT,
+        )
+        res.raise_for_status()
+        conv.token_counts.update(zip(texts, res.json()["counts"]))
+        # Keep only the counts of current texts, so the cache does not grow.
+        conv.token_counts = {text: conv.token_counts[text] for text in conv.get_budget_texts()}
+    except (httpx.HTTPError, KeyError, ValueError) as e:
+        logger.error(f"Could not count the tokens of {model_name}: {e}")
+        return conv.copy()
+    prompt_conv = conv.copy()
+    num_dropped = prompt_conv.fit_to_token_budget(budget)
+    if num_dropped:
+        logger.info(f"Left {num_dropped} old messages out of the prompt to fit the context of {model_name}")
+    return prompt_conv
 
 def load_demo(context: GradioContext, request: gr.Request):
-    logger.info(f"Loading demo for YeongjoPT. Model configured: {global_fixed_model_name}")
-    state = State(global_fixed_model_name)
-    # Chatbot, Textbox, Send, Regenerate, Clear
-    return state, state.to_gradio_chatbot(), enable_text, enable_btn, enable_btn, enable_btn
-
-def clear_history_fn(request: gr.Request): # Added _fn suffix
-    logger.info("Clear history clicked.")
-    state = State(global_fixed_model_name)
+    model_name = context.models[0]
+    logger.info(f"Loading demo for YeongjoPT. Default model: {model_name}")
+    state = State(model_name)
+    # State, Model selector, Chatbot, Textbox, Send, Regenerate, Clear
+    return (
+        state,
+        gr.Dropdown(choices=context.models, value=model_name),
+        state.to_gradio_chatbot(),
+        enable_text,
+        enable_btn,
+        enable_btn,
+        enable_btn,
+    )
+
+def clear_history_fn(model_name: str, old_state: Optional[State], request: gr.Request): # Added _fn suffix
+    logger.info(f"Clear history clicked. Model: {model_name}")
+    if old_state is not None:
+        session_store.delete(old_state.conv_id)
+    state = State(model_name)
     return state, state.to_gradio_chatbot(), enable_text, disable_btn # Disable send initially
 
 def regenerate_fn(state: State, request: gr.Request): # Added _fn suffix
     logger.info(f"Regenerate clicked. Conversation ID: {state.conv_id}")
+    if state.get_session() is None:
+        state.skip_next = True
+        return state, state.to_gradio_chatbot(), disable_text, disable_btn
     if state.conv.messages and state.conv.messages[-1][0] == state.conv.roles[1]: # If last is assistant
         state.conv.messages.pop() # Remove last assistant message
     # UI updates: Textbox remains enabled for potential immediate new message, send button disabled until bot_response cycle starts
@@ -146,21 +309,30 @@ def add_text_fn(state: State, text: str, request: gr.Request): # Added _fn suffi
     if not text or len(text.strip()) == 0:
         state.skip_next = True
         return state, state.to_gradio_chatbot(), disable_text, no_change_btn
-    
-    state.conv.append_message(state.conv.roles[0], text.strip())
-    state.conv.append_message(state.conv.roles[1], None) # Assistant's turn
+
+    session = state.get_session()
+    if session is None:
+        logger.info(f"Session expired. Conv ID: {state.conv_id}")
+        state.skip_next = True
+        return state, state.to_gradio_chatbot(), disable_text, disable_btn
+
+    conv = session.conv
+    trim_history(conv, CONVERSATION_TURN_LIMIT - 1)
+    conv.append_message(conv.roles[0], text.strip()[:INPUT_CHAR_LEN_LIMIT])
+    conv.append_message(conv.roles[1], None) # Assistant's turn
     state.skip_next = False
     return state, state.to_gradio_chatbot(), disable_text, disable_btn
 
-def model_worker_stream_iter_fn(
+async def model_worker_stream_iter_fn(
     current_state: State, 
-    worker_addr_local: str,
+    prompt_conv: Conversation,
+    worker_addrs: List[str],
     temperature_val: float,
     repetition_penalty_val: float, 
     top_p_val: float,
     max_new_tokens_val: int,
 ):
-    prompt_text = current_state.conv.get_prompt()
+    prompt_text = prompt_conv.get_prompt()
     gen_params = {
         "model": current_state.model_name,
         "prompt": prompt_text,
@@ -168,92 +340,122 @@ def model_worker_stream_iter_fn(
         "repetition_penalty": repetition_penalty_val,
         "top_p": top_p_val,
         "max_new_tokens": max_new_tokens_val,
-        "stop": current_state.conv.stop_str,
-        "stop_token_ids": current_state.conv.stop_token_ids,
+        "stop": prompt_conv.stop_str,
+        "stop_token_ids": prompt_conv.stop_token_ids,
         "echo": False,
+        # Ask the worker for incremental text instead of the whole output so far
+        "delta": True,
     }
     # logger.debug(f"Worker stream params: {gen_params}")
-    try:
-        response = requests.post(
-            worker_addr_local + "/worker_generate_stream",
-            json=gen_params, stream=True, timeout=WORKER_API_TIMEOUT, headers=headers)
-        response.raise_for_status()
-        for chunk in response.iter_lines(decode_unicode=False, delimiter=b"\0"):
-            if chunk:
-                yield json.loads(chunk.decode("utf-8"))
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Stream error from {worker_addr_local}: {e}")
-        yield {"text": f"{SERVER_ERROR_MSG}\n(Worker Connection Error: {e})", "error_code": ErrorCode.CONNECTION_ERROR}
-    except Exception as e:
-        logger.error(f"Unknown stream processing error: {e}")
-        yield {"text": f"{SERVER_ERROR_MSG}\n(Streaming Error: {e})", "error_code": ErrorCode.INTERNAL_ERROR}
+    # Workers that fail before the first chunk are retried on the next one.
+    async for data in get_routing_client().stream(
+        "/worker_generate_stream", worker_addrs, gen_params
+    ):
+        if data.get("error_code"):
+            # The pool may have changed, so ask the controller next time.
+            worker_address_cache.pop(current_state.model_name, None)
+        yield data
 
-def bot_response_fn(
+async def bot_response_fn(
     state_obj: State, temperature: float, top_p: float, max_new_tokens: int, request: gr.Request
 ):
     logger.info(f"Bot response requested. Conv ID: {state_obj.conv_id}. Model: {state_obj.model_name}")
     start_t = time.time()
 
+    # The store may load, spill or sweep sessions on disk, so keep it off the event
+    # loop. The session is looked up once and used directly from then on.
+    session = await asyncio.to_thread(state_obj.get_session)
+    if session is None:
+        logger.info(f"Session expired. Conv ID: {state_obj.conv_id}")
+        state_obj.skip_next = False
+        yield state_obj, [[None, INACTIVE_MSG]], disable_text, disable_btn
+        return
+    conv = session.conv
+
     if state_obj.skip_next:
         state_obj.skip_next = False
-        yield state_obj, state_obj.to_gradio_chatbot(), enable_text, enable_btn
+        yield state_obj, state_obj.to_gradio_chatbot(session), enable_text, enable_btn
         return
 
     if not controller_url:
         logger.critical("Controller URL not set globally!")
-        state_obj.conv.update_last_message(f"{SERVER_ERROR_MSG} (System Error: Controller not configured)")
-        yield state_obj, state_obj.to_gradio_chatbot(), enable_text, enable_btn
+        conv.update_last_message(f"{SERVER_ERROR_MSG} (System Error: Controller not configured)")
+        yield state_obj, state_obj.to_gradio_chatbot(session), enable_text, enable_btn
         return
 
-    worker_addr = ""
     try:
-        res = requests.post(controller_url + "/get_worker_address", json={"model": state_obj.model_name}, timeout=WORKER_API_TIMEOUT)
-        res.raise_for_status()
-        worker_addr = res.json().get("address", "")
-    except requests.exceptions.RequestException as e:
+        worker_addrs = await get_worker_addresses(state_obj.model_name)
+    except ModelOverloaded as e:
+        logger.warning(f"Model {state_obj.model_name} is overloaded. Retry after {e.retry_after}s.")
+        conv.update_last_message(f"{SERVER_ERROR_MSG} (Model overloaded. Retry after {e.retry_after}s)")
+        yield state_obj, state_obj.to_gradio_chatbot(session), enable_text, enable_btn
+        return
+    except (httpx.HTTPError, ValueError) as e:
         logger.error(f"Failed to get worker for {state_obj.model_name} from {controller_url}: {e}")
-        state_obj.conv.update_last_message(f"{SERVER_ERROR_MSG} (Controller/Worker Error)")
-        yield state_obj, state_obj.to_gradio_chatbot(), enable_text, enable_btn
+        conv.update_last_message(f"{SERVER_ERROR_MSG} (Controller/Worker Error)")
+        yield state_obj, state_obj.to_gradio_chatbot(session), enable_text, enable_btn
         return
 
-    if not worker_addr:
+    if not worker_addrs:
         logger.error(f"No worker found for {state_obj.model_name} via controller {controller_url}")
-        state_obj.conv.update_last_message(f"{SERVER_ERROR_MSG} (No worker for {state_obj.model_name})")
-        yield state_obj, state_obj.to_gradio_chatbot(), enable_text, enable_btn
+        conv.update_last_message(f"{SERVER_ERROR_MSG} (No worker for {state_obj.model_name})")
+        yield state_obj, state_obj.to_gradio_chatbot(session), enable_text, enable_btn
         return
+    worker_addr = worker_addrs[0]
+    # The prompt is rendered from a fitted copy, so the chatbot keeps the old turns.
+    prompt_conv = await fit_to_context(conv, state_obj.model_name, worker_addr, max_new_tokens)
 
     logger.info(f"Streaming from worker {worker_addr} for model {state_obj.model_name}")
-    state_obj.conv.update_last_message("▌") # Initial streaming placeholder
-    yield state_obj, state_obj.to_gradio_chatbot() # Update UI with placeholder
+    conv.update_last_message("▌") # Initial streaming placeholder
+    yield state_obj, state_obj.to_gradio_chatbot(session) # Update UI with placeholder
 
-    repetition_penalty = getattr(state_obj.conv, 'repetition_penalty', 1.0)
+    repetition_penalty = getattr(conv, 'repetition_penalty', 1.0)
     full_resp_text = ""
-    for data_chunk in model_worker_stream_iter_fn(
-        current_state=state_obj, worker_addr_local=worker_addr, temperature_val=temperature,
+    last_update = time.monotonic()
+    async for data_chunk in model_worker_stream_iter_fn(
+        current_state=state_obj, prompt_conv=prompt_conv, worker_addrs=worker_addrs, temperature_val=temperature,
         repetition_penalty_val=repetition_penalty, top_p_val=top_p, max_new_tokens_val=max_new_tokens,
     ):
         if data_chunk.get("error_code", 0) != 0:
             err_msg = data_chunk.get("text", SERVER_ERROR_MSG)
-            state_obj.conv.update_last_message(err_msg)
+            conv.update_last_message(err_msg)
             logger.error(f"Stream error code {data_chunk['error_code']}: {err_msg}")
-            yield state_obj, state_obj.to_gradio_chatbot(), enable_text, enable_btn
+            yield state_obj, state_obj.to_gradio_chatbot(session), enable_text, enable_btn
             return
         
         text_chunk = data_chunk.get("text", "")
         if not isinstance(text_chunk, str): text_chunk = str(text_chunk)
-        full_resp_text += text_chunk
-        state_obj.conv.update_last_message(full_resp_text + "▌")
-        yield state_obj, state_obj.to_gradio_chatbot()
+        if data_chunk.get("delta"):
+            full_resp_text += text_chunk
+        else:
+            # Workers without delta support send the whole output so far.
+            full_resp_text = text_chunk
+
+        # Coalesce chunks into at most one chatbot update per ui_update_interval.
+        now = time.monotonic()
+        if now - last_update >= ui_update_interval:
+            last_update = now
+            conv.update_last_message(full_resp_text + "▌")
+            yield state_obj, state_obj.to_gradio_chatbot(session)
     
-    state_obj.conv.update_last_message(full_resp_text) # Final update without placeholder
+    conv.update_last_message(full_resp_text) # Final update without placeholder
     logger.info(f"Stream complete. Conv ID: {state_obj.conv_id}. Duration: {time.time() - start_t:.2f}s")
-    yield state_obj, state_obj.to_gradio_chatbot(), enable_text, enable_btn
+    yield state_obj, state_obj.to_gradio_chatbot(session), enable_text, enable_btn
 
-def build_yeongjopt_ui_main(context_obj: GradioContext):
+def build_yeongjopt_ui_main(context_obj: GradioContext, stream_concurrency_limit: Optional[int] = None):
     with gr.Blocks(title="영조피티", theme=gr.themes.Default(), css=css_code, elem_id="yeongjopt_main_block") as demo_main:
         session_state = gr.State()
         gr.Markdown(title_markdown)
 
+        with gr.Row():
+            model_selector = gr.Dropdown(
+                choices=context_obj.models,
+                value=context_obj.models[0],
+                interactive=True,
+                show_label=False,
+                container=False,
+            )
+
         with gr.Row():
             with gr.Column(scale=20):
                 bot_avatar_path = "https://raw.githubusercontent.com/lm-sys/FastChat/main/assets/bot.png" 
@@ -276,40 +478,56 @@ def build_yeongjopt_ui_main(context_obj: GradioContext):
             max_tokens_slider = gr.Slider(minimum=32, maximum=2048, value=512, step=32, interactive=True, label="최대 생성 토큰")
 
         # Event Listeners
-        demo_main.load(lambda req: load_demo(context_obj, req), [context_obj], 
-                       [session_state, chat_interface, input_textbox, send_button, regenerate_button, clear_button])
+        def load_demo_fn(request: gr.Request):
+            return load_demo(context_obj, request)
+
+        demo_main.load(load_demo_fn, None,
+                       [session_state, model_selector, chat_interface, input_textbox, send_button, regenerate_button, clear_button])
+
+        model_selector.change(clear_history_fn, [model_selector, session_state], [session_state, chat_interface, input_textbox, send_button])
 
         input_textbox.submit(add_text_fn, [session_state, input_textbox], [session_state, chat_interface, input_textbox, send_button])\
                      .then(bot_response_fn, [session_state, temperature_slider, top_p_slider, max_tokens_slider], 
-                           [session_state, chat_interface, input_textbox, send_button])
+                           [session_state, chat_interface, input_textbox, send_button],
+                           concurrency_limit=stream_concurrency_limit)
 
         send_button.click(add_text_fn, [session_state, input_textbox], [session_state, chat_interface, input_textbox, send_button])\
                      .then(bot_response_fn, [session_state, temperature_slider, top_p_slider, max_tokens_slider], 
-                           [session_state, chat_interface, input_textbox, send_button])
+                           [session_state, chat_interface, input_textbox, send_button],
+                           concurrency_limit=stream_concurrency_limit)
 
         regenerate_button.click(regenerate_fn, [session_state], [session_state, chat_interface, input_textbox, send_button])\
                          .then(bot_response_fn, [session_state, temperature_slider, top_p_slider, max_tokens_slider], 
-                               [session_state, chat_interface, input_textbox, send_button])
+                               [session_state, chat_interface, input_textbox, send_button],
+                               concurrency_limit=stream_concurrency_limit)
 
-        clear_button.click(clear_history_fn, [], [session_state, chat_interface, input_textbox, send_button])
+        clear_button.click(clear_history_fn, [model_selector, session_state], [session_state, chat_interface, input_textbox, send_button])
     return demo_main
 
 def main_gradio_server(cli_args):
-    global controller_url, context_singleton, global_fixed_model_name
+    global controller_url, context_singleton
 
-    set_global_vars_yeongjopt(cli_args.controller_url)
+    sessions = SessionStore(
+        max_sessions=cli_args.max_sessions,
+        max_bytes=int(cli_args.session_max_mb * 2**20),
+        idle_time=cli_args.session_idle_time,
+        db_path=cli_args.session_db or None,
+    )
+    set_global_vars_yeongjopt(cli_args.controller_url, cli_args.ui_update_fps, sessions)
     
-    models_available = get_model_list_from_controller(cli_args.controller_url)
+    models_available = get_model_list_from_controller(cli_args.controller_url, cli_args.models)
 
-    if not models_available or global_fixed_model_name == "yeongjopt-default-model" or not global_fixed_model_name:
-        logger.critical(f"CRITICAL: YeongjoPT model name not confirmed from controller at {cli_args.controller_url}. Current name: '{global_fixed_model_name}'. Ensure ModelWorker is running and registered with controller.")
-        print(f"EXITING: YeongjoPT could not confirm model. Check controller & worker logs.")
+    if not models_available:
+        logger.critical(f"CRITICAL: No models available from controller at {cli_args.controller_url}. Ensure ModelWorker is running and registered with controller.")
+        print("EXITING: YeongjoPT could not find any model. Check controller & worker logs.")
         return
     
-    logger.info(f"YeongjoPT Web Server starting. Will use model: {global_fixed_model_name}")
+    logger.info(f"YeongjoPT Web Server starting. Models: {models_available}")
     context_singleton = GradioContext(models=models_available)
     
-    demo_instance = build_yeongjopt_ui_main(context_singleton)
+    # Streaming runs on the event loop, so concurrent chats are bounded by
+    # --stream-concurrency-limit and the workers' capacity, not by threads.
+    demo_instance = build_yeongjopt_ui_main(context_singleton, cli_args.stream_concurrency_limit)
     demo_instance.queue(
         api_open=False, 
         default_concurrency_limit=cli_args.default_concurrency_limit
@@ -326,7 +544,14 @@ if __name__ == "__main__":
     parser.add_argument("--port", type=int, default=7860, help="Server port")
     parser.add_argument("--controller-url", type=str, default="http://localhost:21001", help="FastChat Controller URL")
     parser.add_argument("--share", action="store_true", help="Enable Gradio public share link")
+    parser.add_argument("--models", type=lambda s: s.split(","), default=None, help="Comma separated chat models to offer, in order. Defaults to all models of the controller.")
     parser.add_argument("--default-concurrency-limit", type=int, default=20, help="Gradio queue concurrency limit")
+    parser.add_argument("--ui-update-fps", type=float, default=20, help="Max chatbot updates per second while a response streams. 0 updates on every chunk.")
+    parser.add_argument("--max-sessions", type=int, default=10000, help="Max conversations kept in memory. Older ones are spilled to --session-db.")
+    parser.add_argument("--session-max-mb", type=float, default=512, help="Approximate memory budget of the conversations kept in memory")
+    parser.add_argument("--session-idle-time", type=float, default=300, help="Seconds after which an idle conversation is spilled to --session-db")
+    parser.add_argument("--session-db", type=str, default=os.path.join(LOGDIR, "gradio_sessions.db"), help="SQLite file for spilled conversations. An empty string drops them instead.")
+    parser.add_argument("--stream-concurrency-limit", type=int, default=None, help="Max concurrent bot responses. Unlimited by default; the controller's admission control and the worker semaphores bound the load.")
     
     args = parser.parse_args()
 
@@ -89,7 +89,10 @@ def generate_stream(
     logits_processor = prepare_logits_processor(
         temperature, repetition_penalty, top_p, top_k
     )
-    input_ids = tokenizer(prompt).input_ids
+    # Callers that already tokenized the prompt can skip tokenization.
+    input_ids = params.get("prompt_token_ids")
+    if input_ids is None:
+        input_ids = tokenizer(prompt).input_ids
 
     if model.config.is_encoder_decoder:
         max_src_len = context_len
@@ -4,7 +4,6 @@ A model worker that executes the model.
 import argparse
 import base64
 import gc
-import json
 import os
 from typing import List, Optional
 import uuid
@@ -14,7 +13,7 @@ import torch.nn.functional as F
 from transformers import set_seed
 import uvicorn
 
-from fastchat.constants import ErrorCode, SERVER_ERROR_MSG, WORKER_HEART_BEAT_INTERVAL
+from fastchat.constants import ErrorCode, SERVER_ERROR_MSG
 from fastchat.model.model_adapter import (
     load_model,
     add_model_args,
@@ -25,7 +24,9 @@ from fastchat.modules.awq import AWQConfig
 from fastchat.modules.exllama import ExllamaConfig
 from fastchat.modules.xfastertransformer import XftConfig
 from fastchat.modules.gptq import GptqConfig
+from fastchat.serve import serialization
 from fastchat.serve.base_model_worker import BaseModelWorker, app
+from fastchat.serve.inference import generate_stream
 from fastchat.utils import (
     build_logger,
     get_context_length,
@@ -62,10 +63,13 @@ class ModelWorker(BaseModelWorker):
         embed_in_truncate: bool = False,
         seed: Optional[int] = None,
         debug: bool = False,
+        tokenizer_threads: int = 1,
+        tokenizer_batch_size: int = 32,
+        token_count_cache_mb: float = 16,
         **kwargs,
     ):
         if model_names:
-            effective_model_names = [model_names[0]]
+            effective_model_names = list(model_names)
         else:
             effective_model_names = [os.path.basename(model_path).replace("_", "-").replace(".", "-")]
         
@@ -111,12 +115,16 @@ class ModelWorker(BaseModelWorker):
                  logger.info(f"Set context_len to {self.context_len} from conversation template or default.")
 
         self.generate_stream_func = get_generate_stream_function(self.model, model_path)
+        # Only the default generate_stream reads params["prompt_token_ids"].
+        self.pretokenize = self.generate_stream_func is generate_stream
+        self.init_tokenizer_pool(tokenizer_threads, tokenizer_batch_size)
+        self.init_token_count_cache(int(token_count_cache_mb * 2**20))
         self.stream_interval = stream_interval
         self.embed_in_truncate = embed_in_truncate
         self.seed = seed
 
         if not no_register:
-            self.init_heart_beat(WORKER_HEART_BEAT_INTERVAL)
+            self.init_heart_beat()
 
     def generate_stream_gate(self, params):
         if self.device == "npu":
@@ -124,6 +132,11 @@ class ModelWorker(BaseModelWorker):
 
             torch_npu.npu.set_device("npu:0")
         self.call_ct += 1
+        # With "delta", each chunk carries only the text added since the last
+        # chunk instead of the whole output so far. Binary frames always do.
+        stream_format = params.get("stream_format", "json")
+        delta = params.get("delta", False) or stream_format == "msgpack"
+        sent_len = 0
 
         try:
             if self.seed is not None:
@@ -136,34 +149,44 @@ class ModelWorker(BaseModelWorker):
                 self.context_len,
                 self.stream_interval,
             ):
+                text = output["text"]
+                if delta:
+                    # Hold back a partially decoded character until it is complete.
+                    end = len(text)
+                    if output.get("finish_reason") is None:
+                        end = len(text.rstrip("\ufffd"))
+                    text, sent_len = text[sent_len:end], max(sent_len, end)
                 ret = {
-                    "text": output["text"],
+                    "text": text,
                     "error_code": 0,
                 }
+                if delta:
+                    ret["delta"] = True
                 if "usage" in output:
                     ret["usage"] = output["usage"]
                 if "finish_reason" in output:
                     ret["finish_reason"] = output["finish_reason"]
                 if "logprobs" in output:
                     ret["logprobs"] = output["logprobs"]
-                yield json.dumps(ret).encode() + b"\0"
+                yield serialization.encode_stream_chunk(ret, stream_format)
         except torch.cuda.OutOfMemoryError as e:
             ret = {
                 "text": f"{SERVER_ERROR_MSG}\n\n({e})",
                 "error_code": ErrorCode.CUDA_OUT_OF_MEMORY,
             }
-            yield json.dumps(ret).encode() + b"\0"
+            yield serialization.encode_stream_chunk(ret, stream_format)
         except (ValueError, RuntimeError) as e:
             ret = {
                 "text": f"{SERVER_ERROR_MSG}\n\n({e})",
                 "error_code": ErrorCode.INTERNAL_ERROR,
             }
-            yield json.dumps(ret).encode() + b"\0"
+            yield serialization.encode_stream_chunk(ret, stream_format)
 
     def generate_gate(self, params):
+        params = dict(params, delta=False, stream_format="json")
         for x in self.generate_stream_gate(params):
             pass
-        return json.loads(x[:-1].decode())
+        return serialization.loads(x[:-1])
 
     def __process_embed_chunk(self, input_ids, attention_mask, **model_type_dict):
         if model_type_dict.get("is_bert"):
@@ -351,6 +374,24 @@ def create_model_worker():
     parser.add_argument(
         "--debug", type=bool, default=False, help="Print debugging messages"
     )
+    parser.add_argument(
+        "--tokenizer-threads",
+        type=int,
+        default=1,
+        help="Threads that tokenize requests off the model threads. 0 tokenizes inline.",
+    )
+    parser.add_argument(
+        "--tokenizer-batch-size",
+        type=int,
+        default=32,
+        help="Max number of queued texts encoded in one tokenizer call.",
+    )
+    parser.add_argument(
+        "--token-count-cache-mb",
+        type=float,
+        default=16,
+        help="Memory for cached /count_token results. 0 disables the cache.",
+    )
     parser.add_argument(
         "--ssl",
         action="store_true",
@@ -389,17 +430,12 @@ def create_model_worker():
         data_type=args.xft_dtype,
     )
 
-    model_names_list = args.model_names if args.model_names else [os.path.basename(args.model_path)]
-    if len(model_names_list) > 1:
-        logger.warning(f"Multiple model names provided ({model_names_list}), but YeongjoPT worker will only use the first one: {model_names_list[0]}")
-    final_model_name_for_worker = [model_names_list[0]]
-
     worker = ModelWorker(
         args.controller_address,
         args.worker_address,
         worker_id,
         args.model_path,
-        final_model_name_for_worker,
+        args.model_names or [os.path.basename(args.model_path)],
         args.limit_worker_concurrency,
         args.no_register,
         args.device,
@@ -418,6 +454,9 @@ def create_model_worker():
         embed_in_truncate=args.embed_in_truncate,
         seed=args.seed,
         debug=args.debug,
+        tokenizer_threads=args.tokenizer_threads,
+        tokenizer_batch_size=args.tokenizer_batch_size,
+        token_count_cache_mb=args.token_count_cache_mb,
     )
     return args, worker
 
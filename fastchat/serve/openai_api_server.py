@@ -4,28 +4,55 @@ Provides endpoints compatible with OpenAI ChatCompletion API
 """
 import argparse
 import asyncio
+import dataclasses
 import json
+import math
+import re
 import time
-from typing import AsyncGenerator, Dict, List, Optional, Union
+from typing import Dict, List, Optional
 
+import httpx
 import uvicorn
-from fastapi import FastAPI, HTTPException, Request, Depends
+from fastapi import FastAPI, HTTPException, Request, Depends, File, Form, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import requests
+from pydantic import BaseModel, ValidationError
 
-from fastchat.constants import ErrorCode
+from fastchat.constants import ErrorCode, SERVER_ERROR_MSG
+from fastchat.conversation import Conversation, SeparatorStyle
 from fastchat.protocol.api_protocol import (
     APIChatCompletionRequest,
-    APIChatCompletionResponse,
+    BatchRequest,
+    ChatCompletionResponse,
     ChatCompletionResponseChoice,
+    ChatCompletionResponseStreamChoice,
     ChatCompletionStreamResponse,
-    ChatCompletionStreamResponseChoice,
     ChatMessage,
+    CompletionRequest,
+    CompletionResponse,
+    CompletionResponseChoice,
+    CompletionResponseStreamChoice,
+    CompletionStreamResponse,
     DeltaMessage,
+    EmbeddingsRequest,
+    EmbeddingsResponse,
+    ErrorResponse,
+    ModelCard,
+    ModelList,
     UsageInfo,
 )
+from fastchat.serve import serialization
+from fastchat.serve.batch_api import BatchManager
+from fastchat.serve.coalescing import SingleFlight
+from fastchat.serve.rate_limit import (
+    RATE_LIMIT_BACKENDS,
+    RateLimiter,
+    RateLimitExceeded,
+    parse_rate_limits,
+)
+from fastchat.serve.response_cache import ResponseCache, is_cacheable, make_cache_key
+from fastchat.serve.routing_client import RoutingClient, RoutingPolicy
 from fastchat.utils import build_logger
 
 logger = build_logger("openai_api_server", "openai_api_server.log")
@@ -43,105 +70,398 @@ app.add_middleware(
 
 # Global variables
 controller_address = None
-api_key = None
+# Accepted API keys, any key is accepted if empty
+api_keys: List[str] = []
+# A shared connection pool for the controller and all workers
+http_client: Optional[httpx.AsyncClient] = None
+routing_client: Optional[RoutingClient] = None
+# The framing requested from workers for streams, "json" or "msgpack"
+worker_stream_format = "json"
+# Dict[model -> registered_at reported by the controller]
+model_registered_at: Dict[str, Optional[float]] = {}
+# Dict[model -> (registered_at, Conversation)]. An entry is refetched once the
+# controller reports that the model's workers registered again.
+conv_template_cache: Dict[str, tuple] = {}
+# Dict[model -> (registered_at, context length)], refetched like conv_template_cache
+context_length_cache: Dict[str, tuple] = {}
+# Runs /v1/batches jobs, None unless --batch-dir is set
+batch_manager: Optional[BatchManager] = None
+# Exact-match cache of greedy chat completions, None unless --response-cache is set
+response_cache: Optional[ResponseCache] = None
+# Shares generations between identical concurrent greedy requests, None
+# unless --coalesce-requests is set
+single_flight: Optional[SingleFlight] = None
+# Per-key request and token limits, None unless --rate-limit is set
+rate_limiter: Optional[RateLimiter] = None
 
 # Security
 security = HTTPBearer(auto_error=False)
 
 async def verify_api_key(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    if api_key and (not credentials or credentials.credentials != api_key):
+    if api_keys and (not credentials or credentials.credentials not in api_keys):
         raise HTTPException(status_code=401, detail="Invalid API key")
     return True
 
-async def get_worker_address(model_name: str) -> str:
-    """Get worker address for the specified model"""
+async def check_rate_limit(
+    http_request: Request,
+    authorized: bool = Depends(verify_api_key),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> Optional[str]:
+    """Admit a request under the limits of its API key and return the key"""
+    if rate_limiter is None:
+        return None
+    # Limit by API key only when the key was checked against api_keys.
+    # Otherwise a client could pick a fresh key, and bucket, per request.
+    if api_keys and credentials:
+        client_key = credentials.credentials
+    else:
+        client_key = f"ip:{http_request.client.host}"
+    await call_rate_limiter(rate_limiter.check, client_key)
+    return client_key
+
+async def call_rate_limiter(func, *args):
+    """Call the rate limiter, in a thread if its backend can block"""
+    if rate_limiter.backend.blocking:
+        return await asyncio.to_thread(func, *args)
+    return func(*args)
+
+async def charge_usage(client_key: Optional[str], usage: Optional[Dict]):
+    """Count the tokens of a response against the key's quota"""
+    if rate_limiter is not None and client_key is not None:
+        await call_rate_limiter(rate_limiter.charge, client_key, usage)
+
+async def charge_deltas(deltas, final: Dict, client_key: Optional[str]):
+    """
+    Pass deltas through and charge the key's quota when the stream ends,
+    also when the client disconnects or the worker fails midway.
+    """
+    num_chunks = 0
     try:
-        response = requests.post(
-            f"{controller_address}/get_worker_address",
-            json={"model": model_name},
+        async for content, finish_reason in deltas:
+            if content:
+                num_chunks += 1
+            yield content, finish_reason
+    finally:
+        await deltas.aclose()
+        # The usage of the last worker chunk, or at least one token per chunk
+        usage = final.get("usage") or {
+            "completion_tokens": num_chunks,
+            "total_tokens": num_chunks,
+        }
+        await charge_usage(client_key, usage)
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    return JSONResponse(
+        ErrorResponse(message=exc.message, code=exc.code).model_dump(),
+        status_code=429,
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
+async def get_worker_addresses(model_name: str, num_workers: int = 1) -> List[str]:
+    """Get worker addresses for the specified model, the preferred one first"""
+    try:
+        response = await http_client.post(
+            f"{controller_address}/get_worker_addresses",
+            json={"model": model_name, "num_workers": num_workers},
             timeout=10
         )
+        if response.status_code == 429:
+            retry_after = response.json().get("retry_after", 1)
+            raise HTTPException(
+                status_code=429,
+                detail=f"Model {model_name} is overloaded. Please retry later.",
+                headers={"Retry-After": str(retry_after)},
+            )
         response.raise_for_status()
-        worker_addr = response.json().get("address", "")
-        if not worker_addr:
+        ret = response.json()
+        worker_addrs = ret.get("addresses", [])
+        if not worker_addrs:
             raise HTTPException(status_code=404, detail=f"No worker found for model {model_name}")
-        return worker_addr
-    except requests.RequestException as e:
+        model_registered_at[model_name] = ret.get("registered_at")
+        return worker_addrs
+    except httpx.HTTPError as e:
         logger.error(f"Error getting worker address: {e}")
         raise HTTPException(status_code=503, detail="Service temporarily unavailable")
 
-async def generate_stream(
-    worker_addr: str, 
-    params: Dict
-) -> AsyncGenerator[str, None]:
-    """Generate streaming response from worker"""
+async def get_worker_address(model_name: str) -> str:
+    """Get worker address for the specified model"""
+    return (await get_worker_addresses(model_name))[0]
+
+async def get_conv_template(model_name: str, worker_addr: str) -> Conversation:
+    """Get the conversation template of a model, fetched once per worker registration"""
+    registered_at = model_registered_at.get(model_name)
+    cached = conv_template_cache.get(model_name)
+    if cached is not None and cached[0] == registered_at:
+        return cached[1].copy()
+    
     try:
-        response = requests.post(
-            f"{worker_addr}/worker_generate_stream",
-            json=params,
-            stream=True,
-            timeout=120
+        response = await http_client.post(
+            f"{worker_addr}/worker_get_conv_template",
+            json={"model": model_name},
+            timeout=10
         )
         response.raise_for_status()
-        
-        for chunk in response.iter_lines(decode_unicode=False, delimiter=b"\0"):
-            if chunk:
-                data = json.loads(chunk.decode("utf-8"))
-                yield data
-    except requests.RequestException as e:
-        logger.error(f"Error in streaming generation: {e}")
-        yield {"text": "Error occurred during generation", "error_code": ErrorCode.INTERNAL_ERROR}
+        fields = response.json()["conv"]
+    except (httpx.HTTPError, KeyError) as e:
+        logger.error(f"Error getting conversation template: {e}")
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+    
+    conv = Conversation(
+        **{
+            field.name: fields[field.name]
+            for field in dataclasses.fields(Conversation)
+            if field.name in fields
+        }
+    )
+    conv.sep_style = SeparatorStyle(conv.sep_style)
+    conv.roles = tuple(conv.roles)
+    conv.messages = [list(message) for message in conv.messages]
+    conv_template_cache[model_name] = (registered_at, conv)
+    return conv.copy()
+
+async def get_context_length(model_name: str, worker_addr: str) -> Optional[int]:
+    """Get the context length of a model, fetched once per worker registration"""
+    registered_at = model_registered_at.get(model_name)
+    cached = context_length_cache.get(model_name)
+    if cached is not None and cached[0] == registered_at:
+        return cached[1]
+    
+    try:
+        response = await http_client.post(f"{worker_addr}/model_details", json={"model": model_name}, timeout=10)
+        response.raise_for_status()
+        context_length = response.json().get("context_length")
+    except httpx.HTTPError as e:
+        logger.error(f"Error getting context length: {e}")
+        return None
+    context_length_cache[model_name] = (registered_at, context_length)
+    return context_length
+
+async def count_tokens(model_name: str, worker_addr: str, texts: List[str]) -> List[int]:
+    """Count the tokens of texts with the model's tokenizer, in one request"""
+    response = await http_client.post(
+        f"{worker_addr}/count_token", json={"model": model_name, "prompts": texts}, timeout=10
+    )
+    response.raise_for_status()
+    return response.json()["counts"]
+
+async def fit_to_context(conv: Conversation, model_name: str, worker_addr: str, max_new_tokens: int):
+    """Drop the oldest turns of a conversation that do not fit in the model's context"""
+    context_length = await get_context_length(model_name, worker_addr)
+    if not context_length:
+        return
+    # Leave room for the output and the special tokens added by the tokenizer
+    budget = context_length - max_new_tokens - 8
+    if conv.get_token_upper_bound() <= budget:
+        return
+    
+    texts = conv.get_uncounted_texts()
+    try:
+        counts = await count_tokens(model_name, worker_addr, texts)
+    except (httpx.HTTPError, KeyError) as e:
+        logger.error(f"Error counting tokens: {e}")
+        return
+    conv.token_counts.update(zip(texts, counts))
+    num_dropped = conv.fit_to_token_budget(budget)
+    if num_dropped:
+        logger.info(f"Dropped {num_dropped} old messages to fit the context of {model_name}")
+
+def add_chat_messages(conv: Conversation, messages: List[Dict[str, str]]):
+    """Add chat messages to a conversation, followed by an empty assistant turn"""
+    for msg in messages:
+        role = msg.get("role", "user")
+        content = msg.get("content", "")
+        if role == "system":
+            conv.set_system_message(content)
+        elif role == "user":
+            conv.append_message(conv.roles[0], content)
+        elif role == "assistant":
+            conv.append_message(conv.roles[1], content)
+    conv.append_message(conv.roles[1], None)
+
+def merge_stop(*stops) -> Optional[List[str]]:
+    """Merge stop strings given as None, a string or a list"""
+    merged = []
+    for stop in stops:
+        for stop_str in [stop] if isinstance(stop, str) else stop or []:
+            if stop_str not in merged:
+                merged.append(stop_str)
+    return merged or None
 
 @app.get("/v1/models")
 async def list_models(authorized: bool = Depends(verify_api_key)):
     """List available models"""
     try:
-        response = requests.post(f"{controller_address}/list_models", timeout=10)
+        response = await http_client.post(f"{controller_address}/list_models", timeout=10)
         response.raise_for_status()
-        models = response.json()
-        
-        return {
-            "object": "list",
-            "data": [
-                {
-                    "id": model,
-                    "object": "model",
-                    "created": int(time.time()),
-                    "owned_by": "yeongjopt"
-                }
-                for model in models
-            ]
-        }
-    except requests.RequestException as e:
+        models = response.json().get("models", [])
+        return ModelList(
+            data=[ModelCard(id=model, root=model, owned_by="yeongjopt") for model in models]
+        )
+    except httpx.HTTPError as e:
         logger.error(f"Error listing models: {e}")
         raise HTTPException(status_code=503, detail="Service temporarily unavailable")
 
+def stream_chunk(
+    response_id: str, model: str, delta: DeltaMessage, finish_reason: Optional[str] = None
+) -> ChatCompletionStreamResponse:
+    """Build a single-choice chat completion chunk"""
+    return ChatCompletionStreamResponse(
+        id=response_id,
+        choices=[
+            ChatCompletionResponseStreamChoice(
+                index=0, delta=delta, finish_reason=finish_reason
+            )
+        ],
+        model=model,
+    )
+
+async def stream_text_deltas(
+    endpoint: str, worker_addrs: List[str], gen_params: Dict, final: Optional[Dict] = None
+):
+    """
+    Yield (new text, finish_reason) for each worker chunk until the stream ends or fails.
+    If given, final receives the usage reported with the latest chunk.
+    """
+    previous_text = ""
+    async for data in routing_client.stream(endpoint, worker_addrs, gen_params):
+        if data.get("error_code"):
+            return
+        
+        finish_reason = data.get("finish_reason")
+        if data.get("delta"):
+            content = data.get("text", "")
+        else:
+            # Workers without delta support send the whole output so far.
+            text = data.get("text", "")
+            if not finish_reason:
+                # Hold back a partially decoded character until it is complete.
+                text = text.rstrip("\ufffd")
+            content = text[len(previous_text):]
+            if content:
+                previous_text = text
+        if final is not None and data.get("usage"):
+            final["usage"] = data["usage"]
+        yield content, finish_reason
+        
+        if finish_reason:
+            return
+
+async def replay_deltas(result: Dict):
+    """Yield a cached output as (new text, finish_reason) pairs, one word at a time"""
+    for piece in re.findall(r"\s*\S+\s*|\s+", result["text"]):
+        yield piece, None
+    yield "", result.get("finish_reason") or "stop"
+
+async def cache_deltas(deltas, cache_key: str, final: Dict):
+    """Pass deltas through and cache the output if the stream finishes"""
+    parts = []
+    async for content, finish_reason in deltas:
+        parts.append(content)
+        if finish_reason:
+            await response_cache.put(
+                cache_key,
+                {
+                    "text": "".join(parts),
+                    "finish_reason": finish_reason,
+                    "usage": final.get("usage"),
+                },
+            )
+        yield content, finish_reason
+
+def open_deltas(
+    endpoint: str,
+    worker_addrs: List[str],
+    gen_params: Dict,
+    cache_key: Optional[str] = None,
+    flight_key: Optional[str] = None,
+):
+    """
+    Start a streamed generation, or join an identical one in flight if flight_key is set.
+    Returns its (new text, finish_reason) pairs and a dict that receives the final usage.
+    """
+    def start(final: Dict):
+        stream_params = dict(
+            gen_params, stream=True, delta=True, stream_format=worker_stream_format
+        )
+        deltas = stream_text_deltas(endpoint, worker_addrs, stream_params, final)
+        if cache_key is not None:
+            deltas = cache_deltas(deltas, cache_key, final)
+        return deltas
+    
+    if flight_key is not None:
+        return single_flight.subscribe(flight_key, start)
+    final = {}
+    return start(final), final
+
+async def collect_deltas(deltas, final: Dict) -> Dict:
+    """Join streamed deltas into a worker output"""
+    parts = []
+    finish_reason = None
+    async for content, finish_reason in deltas:
+        parts.append(content)
+    if not finish_reason:
+        return {"text": SERVER_ERROR_MSG, "error_code": ErrorCode.INTERNAL_ERROR}
+    return {
+        "text": "".join(parts),
+        "error_code": 0,
+        "finish_reason": finish_reason,
+        "usage": final.get("usage"),
+    }
+
+async def chat_stream_events(model: str, deltas):
+    """Render (new text, finish_reason) pairs as chat completion SSE events"""
+    response_id = f"chatcmpl-{int(time.time())}"
+    chunk = stream_chunk(response_id, model, DeltaMessage(role="assistant"))
+    yield serialization.sse_event(chunk.model_dump())
+    
+    # Token chunks differ only in their content, so serialize the rest once.
+    content_chunk = serialization.ChunkTemplate(
+        stream_chunk(
+            response_id,
+            model,
+            DeltaMessage(content=serialization.ChunkTemplate.SLOT),
+        ).model_dump()
+    )
+    
+    # Generate content
+    finish_reason = "stop"
+    try:
+        async for content, chunk_finish_reason in deltas:
+            if content:
+                yield content_chunk.render(content)
+            finish_reason = chunk_finish_reason or finish_reason
+    finally:
+        # Close the upstream now if the client went away, rather than at GC.
+        await deltas.aclose()
+    
+    # Final chunk
+    chunk = stream_chunk(response_id, model, DeltaMessage(), finish_reason)
+    yield serialization.sse_event(chunk.model_dump())
+    yield serialization.SSE_DONE
+
 @app.post("/v1/chat/completions")
 async def create_chat_completion(
     request: APIChatCompletionRequest,
-    authorized: bool = Depends(verify_api_key)
+    authorized: bool = Depends(verify_api_key),
+    client_key: Optional[str] = Depends(check_rate_limit),
 ):
     """Create chat completion (OpenAI compatible)"""
+    endpoint = "/v1/chat/completions"
     
-    # Get worker address
-    worker_addr = await get_worker_address(request.model)
+    # Get candidate workers for retries and hedging
+    policy = routing_client.get_policy(endpoint)
+    worker_addrs = await get_worker_addresses(request.model, policy.num_candidates())
     
-    # Convert messages to prompt
+    # Convert messages to prompt with the model's conversation template
+    conv = await get_conv_template(request.model, worker_addrs[0])
+    max_new_tokens = request.max_tokens or 512
     if isinstance(request.messages, str):
         prompt = request.messages
     else:
-        # Convert message format to prompt
-        prompt_parts = []
-        for msg in request.messages:
-            role = msg.get("role", "user")
-            content = msg.get("content", "")
-            if role == "system":
-                prompt_parts.append(f"System: {content}")
-            elif role == "user":
-                prompt_parts.append(f"User: {content}")
-            elif role == "assistant":
-                prompt_parts.append(f"Assistant: {content}")
-        prompt = "\n".join(prompt_parts) + "\nAssistant:"
+        add_chat_messages(conv, request.messages)
+        await fit_to_context(conv, request.model, worker_addrs[0], max_new_tokens)
+        prompt = conv.get_prompt()
     
     # Prepare generation parameters
     gen_params = {
@@ -149,115 +469,477 @@ async def create_chat_completion(
         "prompt": prompt,
         "temperature": request.temperature,
         "top_p": request.top_p,
-        "max_new_tokens": request.max_tokens or 512,
-        "stop": request.stop,
+        "max_new_tokens": max_new_tokens,
+        "stop": merge_stop(conv.stop_str, request.stop),
+        "stop_token_ids": conv.stop_token_ids,
         "stream": request.stream,
         "echo": False,
+        # Ask the worker for incremental text instead of the whole output so far
+        "delta": request.stream,
     }
+    if request.stream:
+        gen_params["stream_format"] = worker_stream_format
+    
+    # Greedy requests can be answered from the response cache or share a
+    # generation with an identical request in flight
+    cache_key = flight_key = cached = cache_headers = None
+    greedy = is_cacheable(gen_params)
+    # Results of earlier registrations, e.g. of other weights, are not reused.
+    request_key = make_cache_key(
+        gen_params, model_registered_at.get(request.model)
+    ) if greedy else None
+    if response_cache is not None and greedy:
+        cache_key = request_key
+        cached = await response_cache.get(cache_key)
+        cache_headers = {"x-cache": "miss" if cached is None else "hit"}
+    if cached is None and single_flight is not None and greedy:
+        flight_key = request_key
     
     if request.stream:
         # Streaming response
-        async def generate():
-            choice_data = ChatCompletionStreamResponseChoice(
-                index=0,
-                delta=DeltaMessage(role="assistant"),
-                finish_reason=None,
+        if cached is not None:
+            deltas = replay_deltas(cached)
+        else:
+            deltas, final = open_deltas(
+                endpoint, worker_addrs, gen_params, cache_key, flight_key
             )
-            
-            chunk = ChatCompletionStreamResponse(
-                id=f"chatcmpl-{int(time.time())}",
-                choices=[choice_data],
-                model=request.model,
+            deltas = charge_deltas(deltas, final, client_key)
+        return StreamingResponse(
+            chat_stream_events(request.model, deltas),
+            media_type="text/event-stream",
+            headers=cache_headers,
+        )
+    
+    else:
+        # Non-streaming response
+        if cached is not None:
+            result = cached
+        elif flight_key is not None:
+            # Stored in the cache by the shared stream when it finishes
+            result = await collect_deltas(
+                *open_deltas(endpoint, worker_addrs, gen_params, cache_key, flight_key)
             )
-            yield f"data: {chunk.json()}\n\n"
-            
-            # Generate content
-            async for data in generate_stream(worker_addr, gen_params):
-                if data.get("error_code"):
-                    finish_reason = "stop"
-                    break
-                
-                content = data.get("text", "")
-                choice_data = ChatCompletionStreamResponseChoice(
-                    index=0,
-                    delta=DeltaMessage(content=content),
-                    finish_reason=None,
-                )
-                
-                chunk = ChatCompletionStreamResponse(
-                    id=f"chatcmpl-{int(time.time())}",
-                    choices=[choice_data],
+        else:
+            result = await routing_client.generate(endpoint, worker_addrs, gen_params)
+            if cache_key is not None and not result.get("error_code"):
+                await response_cache.put(cache_key, result)
+        
+        if result.get("error_code"):
+            raise HTTPException(status_code=500, detail=result.get("text", "Generation failed"))
+        if cached is None:
+            await charge_usage(client_key, result.get("usage"))
+        
+        # Format as OpenAI response
+        usage = UsageInfo(
+            prompt_tokens=(result.get("usage") or {}).get("prompt_tokens", 0),
+            completion_tokens=(result.get("usage") or {}).get("completion_tokens", 0),
+            total_tokens=(result.get("usage") or {}).get("total_tokens", 0),
+        )
+        
+        choice = ChatCompletionResponseChoice(
+            index=0,
+            message=ChatMessage(role="assistant", content=result.get("text", "")),
+            finish_reason=result.get("finish_reason", "stop"),
+        )
+        
+        response = ChatCompletionResponse(
+            id=f"chatcmpl-{int(time.time())}",
+            choices=[choice],
+            model=request.model,
+            usage=usage,
+        )
+        if cache_headers is not None:
+            return JSONResponse(response.model_dump(), headers=cache_headers)
+        return response
+
+@app.post("/v1/completions")
+async def create_completion(
+    request: CompletionRequest,
+    authorized: bool = Depends(verify_api_key),
+    client_key: Optional[str] = Depends(check_rate_limit),
+):
+    """Create completion (OpenAI compatible). The prompts of a list run concurrently."""
+    endpoint = "/v1/completions"
+    
+    prompts = [request.prompt] if isinstance(request.prompt, str) else request.prompt
+    if not prompts or not all(isinstance(prompt, str) for prompt in prompts):
+        raise HTTPException(status_code=400, detail="prompt must be a string or a list of strings")
+    n = request.n if request.n is not None else 1
+    if n < 1:
+        raise HTTPException(status_code=400, detail="n must be at least 1")
+    # Each prompt is sampled n times; choice i*n+j is sample j of prompt i.
+    prompts = [prompt for prompt in prompts for _ in range(n)]
+    if request.stream and len(prompts) > 1:
+        raise HTTPException(status_code=400, detail="Streaming supports a single prompt with n=1")
+    
+    policy = routing_client.get_policy(endpoint)
+    worker_addrs = await get_worker_addresses(request.model, policy.num_candidates())
+    conv = await get_conv_template(request.model, worker_addrs[0])
+    
+    gen_params = {
+        "model": request.model,
+        "temperature": request.temperature,
+        "top_p": request.top_p,
+        "top_k": request.top_k,
+        "max_new_tokens": request.max_tokens if request.max_tokens is not None else 16,
+        "stop": merge_stop(conv.stop_str, request.stop),
+        "stop_token_ids": conv.stop_token_ids,
+        "echo": request.echo,
+        "logprobs": request.logprobs,
+    }
+    
+    if request.stream:
+        gen_params.update(
+            prompt=prompts[0],
+            stream=True,
+            delta=True,
+            stream_format=worker_stream_format,
+        )
+        
+        async def generate():
+            response_id = f"cmpl-{int(time.time())}"
+            text_chunk = serialization.ChunkTemplate(
+                CompletionStreamResponse(
+                    id=response_id,
                     model=request.model,
-                )
-                yield f"data: {chunk.json()}\n\n"
-                
-                if data.get("finish_reason"):
-                    break
-            
-            # Final chunk
-            choice_data = ChatCompletionStreamResponseChoice(
-                index=0,
-                delta=DeltaMessage(),
-                finish_reason="stop",
+                    choices=[
+                        CompletionResponseStreamChoice(
+                            index=0, text=serialization.ChunkTemplate.SLOT
+                        )
+                    ],
+                ).model_dump()
             )
+            finish_reason = "stop"
+            final = {}
+            deltas = stream_text_deltas(endpoint, worker_addrs, gen_params, final)
+            deltas = charge_deltas(deltas, final, client_key)
+            try:
+                async for content, chunk_finish_reason in deltas:
+                    if content:
+                        yield text_chunk.render(content)
+                    finish_reason = chunk_finish_reason or finish_reason
+            finally:
+                await deltas.aclose()
             
-            chunk = ChatCompletionStreamResponse(
-                id=f"chatcmpl-{int(time.time())}",
-                choices=[choice_data],
+            chunk = CompletionStreamResponse(
+                id=response_id,
                 model=request.model,
+                choices=[
+                    CompletionResponseStreamChoice(
+                        index=0, text="", finish_reason=finish_reason
+                    )
+                ],
             )
-            yield f"data: {chunk.json()}\n\n"
-            yield "data: [DONE]\n\n"
+            yield serialization.sse_event(chunk.model_dump())
+            yield serialization.SSE_DONE
         
-        return StreamingResponse(generate(), media_type="text/plain")
+        return StreamingResponse(generate(), media_type="text/event-stream")
     
-    else:
-        # Non-streaming response
-        try:
-            response = requests.post(
-                f"{worker_addr}/worker_generate",
-                json=gen_params,
-                timeout=120
+    # Run the prompts as concurrent requests, so that workers interleave
+    # them with other traffic, spreading their first attempts over the
+    # candidate workers. This costs one /worker_generate round trip per
+    # prompt and sample: generate_stream decodes a single sequence, so a
+    # batched worker endpoint would only loop over the prompts in one
+    # concurrency slot, and its requests could not be retried or hedged
+    # one by one.
+    results = await asyncio.gather(
+        *[
+            routing_client.generate(
+                endpoint,
+                worker_addrs[i % len(worker_addrs):] + worker_addrs[: i % len(worker_addrs)],
+                dict(gen_params, prompt=prompt),
             )
-            response.raise_for_status()
-            result = response.json()
-            
-            if result.get("error_code"):
-                raise HTTPException(status_code=500, detail=result.get("text", "Generation failed"))
-            
-            # Format as OpenAI response
-            usage = UsageInfo(
-                prompt_tokens=result.get("usage", {}).get("prompt_tokens", 0),
-                completion_tokens=result.get("usage", {}).get("completion_tokens", 0),
-                total_tokens=result.get("usage", {}).get("total_tokens", 0),
-            )
-            
-            choice = ChatCompletionResponseChoice(
-                index=0,
-                message=ChatMessage(role="assistant", content=result.get("text", "")),
+            for i, prompt in enumerate(prompts)
+        ]
+    )
+    
+    choices = []
+    usage = UsageInfo()
+    for i, result in enumerate(results):
+        if result.get("error_code"):
+            raise HTTPException(status_code=500, detail=result.get("text", "Generation failed"))
+        choices.append(
+            CompletionResponseChoice(
+                index=i,
+                text=result.get("text", ""),
+                logprobs=result.get("logprobs"),
                 finish_reason=result.get("finish_reason", "stop"),
             )
-            
-            return APIChatCompletionResponse(
-                id=f"chatcmpl-{int(time.time())}",
-                choices=[choice],
-                model=request.model,
-                usage=usage,
-            )
-            
-        except requests.RequestException as e:
-            logger.error(f"Error in generation: {e}")
-            raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+        )
+        result_usage = result.get("usage", {})
+        usage.prompt_tokens += result_usage.get("prompt_tokens", 0)
+        usage.completion_tokens += result_usage.get("completion_tokens", 0)
+        usage.total_tokens += result_usage.get("total_tokens", 0)
+    await charge_usage(client_key, usage.model_dump())
+    
+    return CompletionResponse(
+        id=f"cmpl-{int(time.time())}",
+        choices=choices,
+        model=request.model,
+        usage=usage,
+    )
+
+@app.post("/v1/embeddings")
+async def create_embeddings(
+    request: EmbeddingsRequest,
+    authorized: bool = Depends(verify_api_key),
+    client_key: Optional[str] = Depends(check_rate_limit),
+):
+    """Create embeddings (OpenAI compatible)"""
+    worker_addr = await get_worker_address(request.model)
+    inputs = [request.input] if isinstance(request.input, str) else request.input
+    params = {
+        "model": request.model,
+        "input": inputs,
+        "encoding_format": request.encoding_format,
+    }
+    try:
+        response = await http_client.post(
+            f"{worker_addr}/worker_get_embeddings",
+            json=params,
+            timeout=120
+        )
+        response.raise_for_status()
+        result = response.json()
+    except httpx.HTTPError as e:
+        logger.error(f"Error in embeddings: {e}")
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+
+    if result.get("error_code"):
+        raise HTTPException(status_code=500, detail=result.get("text", "Embedding failed"))
+
+    await charge_usage(client_key, {"prompt_tokens": result["token_num"]})
+    data = [
+        {"object": "embedding", "embedding": embedding, "index": i}
+        for i, embedding in enumerate(result["embedding"])
+    ]
+    return EmbeddingsResponse(
+        data=data,
+        model=request.model,
+        usage=UsageInfo(
+            prompt_tokens=result["token_num"],
+            total_tokens=result["token_num"],
+            completion_tokens=None,
+        ),
+    )
+
+# Files and batches
+
+BATCH_HANDLERS = {
+    "/v1/chat/completions": (APIChatCompletionRequest, create_chat_completion),
+    "/v1/completions": (CompletionRequest, create_completion),
+    "/v1/embeddings": (EmbeddingsRequest, create_embeddings),
+}
+
+async def run_batch_request(url: str, body: Dict):
+    """Run one batch line through the handler of its online endpoint"""
+    request_cls, handler = BATCH_HANDLERS[url]
+    try:
+        # Batches are already throttled by model load, not by key limits.
+        response = await handler(request_cls(**body), authorized=True, client_key=None)
+    except HTTPException as e:
+        return e.status_code, {"error": {"message": str(e.detail)}}
+    except ValidationError as e:
+        return 400, {"error": {"message": str(e)}}
+    if isinstance(response, JSONResponse):
+        return response.status_code, serialization.loads(response.body)
+    if isinstance(response, BaseModel):
+        response = response.model_dump()
+    return 200, response
+
+async def get_model_load(model_name: str) -> Optional[float]:
+    """The model's load reported by the controller, None if it is unknown"""
+    try:
+        response = await http_client.get(f"{controller_address}/metrics/model_load", timeout=5)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.error(f"Error getting model load: {e}")
+        return None
+    for entry in response.json()["models"]:
+        if entry["model"] == model_name:
+            return entry["load"]
+    return None
+
+def get_batch_manager() -> BatchManager:
+    if batch_manager is None:
+        raise HTTPException(
+            status_code=404,
+            detail="The batch API is disabled. Start the server with --batch-dir.",
+        )
+    return batch_manager
+
+@app.post("/v1/files")
+async def upload_file(
+    file: UploadFile = File(...),
+    purpose: str = Form(...),
+    authorized: bool = Depends(verify_api_key)
+):
+    """Upload a file (OpenAI compatible)"""
+    manager = get_batch_manager()
+    content = await file.read()
+    return await asyncio.to_thread(manager.create_file, file.filename, content, purpose)
+
+@app.get("/v1/files")
+async def list_files(authorized: bool = Depends(verify_api_key)):
+    """List uploaded and batch output files"""
+    return {"object": "list", "data": get_batch_manager().list_files()}
+
+@app.get("/v1/files/{file_id}")
+async def retrieve_file(file_id: str, authorized: bool = Depends(verify_api_key)):
+    """Get a file object"""
+    file = get_batch_manager().get_file(file_id)
+    if file is None:
+        raise HTTPException(status_code=404, detail=f"No such file: {file_id}")
+    return file
+
+@app.get("/v1/files/{file_id}/content")
+async def retrieve_file_content(file_id: str, authorized: bool = Depends(verify_api_key)):
+    """Download the content of a file"""
+    manager = get_batch_manager()
+    if manager.get_file(file_id) is None:
+        raise HTTPException(status_code=404, detail=f"No such file: {file_id}")
+    return FileResponse(manager.file_path(file_id), media_type="application/octet-stream")
+
+@app.delete("/v1/files/{file_id}")
+async def delete_file(file_id: str, authorized: bool = Depends(verify_api_key)):
+    """Delete a file"""
+    if not get_batch_manager().delete_file(file_id):
+        raise HTTPException(status_code=404, detail=f"No such file: {file_id}")
+    return {"id": file_id, "object": "file", "deleted": True}
+
+@app.post("/v1/batches")
+async def create_batch(request: BatchRequest, authorized: bool = Depends(verify_api_key)):
+    """Create a batch from an uploaded JSONL file (OpenAI compatible)"""
+    try:
+        return get_batch_manager().create_batch(
+            request.input_file_id,
+            request.endpoint,
+            request.completion_window,
+            request.metadata,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/v1/batches")
+async def list_batches(authorized: bool = Depends(verify_api_key)):
+    """List batches, newest first"""
+    return {"object": "list", "data": get_batch_manager().list_batches()}
+
+@app.get("/v1/batches/{batch_id}")
+async def retrieve_batch(batch_id: str, authorized: bool = Depends(verify_api_key)):
+    """Get a batch with its status and request counts"""
+    batch = get_batch_manager().get_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"No such batch: {batch_id}")
+    return batch
+
+@app.post("/v1/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str, authorized: bool = Depends(verify_api_key)):
+    """Cancel a batch. Requests already running are finished first."""
+    batch = get_batch_manager().cancel_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"No such batch: {batch_id}")
+    return batch
+
+@app.on_event("startup")
+async def resume_batches():
+    if batch_manager is not None:
+        batch_manager.resume()
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "timestamp": int(time.time())}
 
+@app.on_event("shutdown")
+async def close_http_client():
+    # Stop batches first so they do not record requests failing on a closed pool.
+    if batch_manager is not None:
+        await batch_manager.shutdown()
+    if http_client is not None:
+        await http_client.aclose()
+
+@app.get("/metrics/routing")
+async def routing_metrics():
+    """Retry and hedging counters of the worker routing client"""
+    return routing_client.get_metrics()
+
+@app.get("/metrics/cache")
+async def cache_metrics():
+    """Hit rate and size of the response cache"""
+    if response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **response_cache.get_metrics()}
+
+@app.get("/metrics/usage")
+async def usage_metrics(authorized: bool = Depends(verify_api_key)):
+    """Requests, rejections and tokens per API key"""
+    if rate_limiter is None:
+        return {"enabled": False}
+    return {"enabled": True, "keys": await call_rate_limiter(rate_limiter.get_usage)}
+
+@app.get("/metrics/coalescing")
+async def coalescing_metrics():
+    """Requests that started, joined or abandoned a shared generation"""
+    if single_flight is None:
+        return {"enabled": False}
+    return {"enabled": True, **single_flight.get_metrics()}
+
+def parse_routing_policies(routing_policy: Optional[str]) -> Dict[str, RoutingPolicy]:
+    """Parse a JSON object mapping endpoint paths to RoutingPolicy fields."""
+    if not routing_policy:
+        return {}
+    return {
+        endpoint: RoutingPolicy(**fields)
+        for endpoint, fields in json.loads(routing_policy).items()
+    }
+
 def create_app(args):
-    global controller_address, api_key
+    global controller_address, api_keys, http_client, routing_client, worker_stream_format
+    global batch_manager, response_cache, single_flight, rate_limiter
     controller_address = args.controller_address
-    api_key = args.api_key
+    api_keys = args.api_keys or []
+    worker_stream_format = args.worker_stream_format
+    # Worker streams are long-lived, so keep enough idle connections around
+    # that a burst of new streams does not pay for new TCP handshakes.
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=args.max_connections,
+            max_keepalive_connections=args.max_keepalive_connections,
+            keepalive_expiry=args.keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(120.0, connect=10.0),
+    )
+    policies = parse_routing_policies(args.routing_policy)
+    routing_client = RoutingClient(
+        http_client,
+        policies=policies,
+        default_policy=policies.pop("default", None),
+    )
+    if args.response_cache:
+        response_cache = ResponseCache(
+            max_entries=args.response_cache_size,
+            max_bytes=int(args.response_cache_max_mb * 2**20),
+            ttl=args.response_cache_ttl,
+            disk_path=args.response_cache_disk,
+        )
+    if args.rate_limit:
+        limits, default_limit = parse_rate_limits(args.rate_limit)
+        if args.rate_limit_backend == "sqlite":
+            backend = RATE_LIMIT_BACKENDS["sqlite"](args.rate_limit_db)
+        else:
+            backend = RATE_LIMIT_BACKENDS["memory"]()
+        rate_limiter = RateLimiter(limits, default_limit, backend)
+    if args.coalesce_requests:
+        single_flight = SingleFlight()
+    if args.batch_dir:
+        batch_manager = BatchManager(
+            args.batch_dir,
+            run_batch_request,
+            load_fn=get_model_load,
+            max_load=args.batch_max_load,
+            concurrency=args.batch_concurrency,
+        )
     return app
 
 if __name__ == "__main__":
@@ -265,8 +947,123 @@ if __name__ == "__main__":
     parser.add_argument("--host", type=str, default="0.0.0.0", help="Host to bind the server")
     parser.add_argument("--port", type=int, default=8000, help="Port to bind the server")
     parser.add_argument("--controller-address", type=str, required=True, help="Controller address")
-    parser.add_argument("--api-key", type=str, default=None, help="API key for authentication")
-    
+    parser.add_argument(
+        "--api-keys",
+        "--api-key",
+        type=lambda s: s.split(","),
+        default=None,
+        help="Optional comma separated API keys for authentication",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=1000,
+        help="Max concurrent connections to the controller and workers",
+    )
+    parser.add_argument(
+        "--max-keepalive-connections",
+        type=int,
+        default=200,
+        help="Max idle keep-alive connections kept in the pool",
+    )
+    parser.add_argument(
+        "--keepalive-expiry",
+        type=float,
+        default=30.0,
+        help="Seconds an idle pooled connection is kept open",
+    )
+    parser.add_argument(
+        "--worker-stream-format",
+        type=str,
+        default="json",
+        choices=["json", "msgpack"],
+        help="Framing requested from workers for streams. Workers without "
+        "msgpack support fall back to JSON.",
+    )
+    parser.add_argument(
+        "--routing-policy",
+        type=str,
+        default=None,
+        help='Per-endpoint retry and hedging policies as JSON, e.g. '
+        '\'{"/v1/chat/completions": {"hedge": true, "max_retries": 1}}\'. '
+        'The "default" key applies to all other endpoints.',
+    )
+    parser.add_argument(
+        "--response-cache",
+        action="store_true",
+        help="Answer repeated greedy (temperature=0) chat completions from a cache",
+    )
+    parser.add_argument(
+        "--response-cache-size",
+        type=int,
+        default=10000,
+        help="Max entries in the in-memory response cache",
+    )
+    parser.add_argument(
+        "--response-cache-max-mb",
+        type=float,
+        default=256,
+        help="Max total size of the in-memory response cache in MiB",
+    )
+    parser.add_argument(
+        "--response-cache-ttl",
+        type=float,
+        default=3600,
+        help="Seconds a cached response stays valid",
+    )
+    parser.add_argument(
+        "--response-cache-disk",
+        type=str,
+        default=None,
+        help="Optional SQLite file used as a second cache tier that survives restarts",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=str,
+        default=None,
+        help="Per-key limits as JSON, e.g. '{\"default\": {\"requests_per_second\": 2, "
+        "\"tokens_per_minute\": 20000}, \"sk-admin\": {}}'. The \"default\" key "
+        "applies to all other keys; clients without a key are limited by address.",
+    )
+    parser.add_argument(
+        "--rate-limit-backend",
+        type=str,
+        default="memory",
+        choices=list(RATE_LIMIT_BACKENDS),
+        help="Where buckets and usage live. 'sqlite' shares them between server "
+        "processes on one machine.",
+    )
+    parser.add_argument(
+        "--rate-limit-db",
+        type=str,
+        default="rate_limit.db",
+        help="SQLite file of the 'sqlite' rate limit backend",
+    )
+    parser.add_argument(
+        "--coalesce-requests",
+        action="store_true",
+        help="Let identical concurrent greedy chat completions share one generation",
+    )
+    parser.add_argument(
+        "--batch-dir",
+        type=str,
+        default=None,
+        help="Directory for /v1/files and /v1/batches. The batch API is disabled if unset.",
+    )
+    parser.add_argument(
+        "--batch-concurrency",
+        type=int,
+        default=4,
+        help="Max requests in flight per batch",
+    )
+    parser.add_argument(
+        "--batch-max-load",
+        type=float,
+        default=0.5,
+        help="Batch requests wait while the model's load reported by the "
+        "controller is at or above this value",
+    )
+
     args = parser.parse_args()
     
     app = create_app(args)
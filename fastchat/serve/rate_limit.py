@@ -0,0 +1,291 @@
+"""
+Per-key rate limits for the API server, enforced with token buckets.
+
+Each API key has up to two buckets:
+  requests:  refilled at requests_per_second, each request takes one unit.
+  tokens:    refilled at tokens_per_minute / 60, charged with the prompt and
+             completion tokens of each response once it is known. A request is
+             admitted while the bucket is positive, so a large response can
+             leave the key in debt until the bucket refills.
+
+The buckets and the per-key usage counters live in a backend. The memory
+backend serves one process; the SQLite backend lets several server
+processes on one machine share limits and counters. Calls to a blocking
+backend should be made off the event loop.
+"""
+import abc
+import contextlib
+import dataclasses
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+from fastchat.constants import ErrorCode
+
+USAGE_FIELDS = (
+    "requests",
+    "rate_limited",
+    "quota_exceeded",
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+)
+
+
+@dataclasses.dataclass
+class RateLimit:
+    # Sustained requests per second, None for no limit
+    requests_per_second: Optional[float] = None
+    # Max requests in a burst. Defaults to max(1, requests_per_second).
+    burst: Optional[float] = None
+    # Prompt plus completion tokens per minute, None for no limit
+    tokens_per_minute: Optional[float] = None
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, code: ErrorCode, message: str, retry_after: float):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.retry_after = retry_after
+
+
+class RateLimitBackend(abc.ABC):
+    """Storage of bucket levels and usage counters."""
+
+    # Whether calls can wait on I/O or on other processes
+    blocking = False
+
+    @abc.abstractmethod
+    def take(
+        self, bucket: str, rate: float, capacity: float, cost: float, min_level: float
+    ) -> float:
+        """
+        Refill a bucket and take cost from it if its level is at least min_level.
+        Returns 0 on success, otherwise the seconds until the level is reached.
+        """
+
+    @abc.abstractmethod
+    def add_usage(self, key: str, **counts):
+        """Add counts to the usage counters of a key."""
+
+    @abc.abstractmethod
+    def get_usage(self) -> Dict[str, Dict[str, int]]:
+        """Return the usage counters of all keys."""
+
+
+def refill(level, updated, rate, capacity, now):
+    if level is None:
+        return capacity
+    return min(capacity, level + (now - updated) * rate)
+
+
+class MemoryBackend(RateLimitBackend):
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Dict[bucket -> (level, updated)]
+        self.buckets = {}
+        self.usage = defaultdict(lambda: dict.fromkeys(USAGE_FIELDS, 0))
+
+    def take(self, bucket, rate, capacity, cost, min_level):
+        with self.lock:
+            now = time.time()
+            level, updated = self.buckets.get(bucket, (None, now))
+            level = refill(level, updated, rate, capacity, now)
+            if level < min_level:
+                self.buckets[bucket] = (level, now)
+                return (min_level - level) / rate
+            self.buckets[bucket] = (level - cost, now)
+            return 0.0
+
+    def add_usage(self, key, **counts):
+        with self.lock:
+            usage = self.usage[key]
+            for name, value in counts.items():
+                usage[name] += value
+
+    def get_usage(self):
+        with self.lock:
+            return {key: dict(usage) for key, usage in self.usage.items()}
+
+
+class SQLiteBackend(RateLimitBackend):
+    """Buckets and counters in a SQLite file shared by server processes."""
+
+    blocking = True
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # One connection for the life of the server, shared by the threads
+        # that run the calls. Autocommit mode, so that each call can open
+        # its own write transaction.
+        self.conn = sqlite3.connect(
+            path, timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "bucket TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            "api_key TEXT NOT NULL, field TEXT NOT NULL, value INTEGER NOT NULL, "
+            "PRIMARY KEY (api_key, field))"
+        )
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Hold the connection and a write lock on the database, so that a
+        read-modify-write is atomic across threads and processes.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def take(self, bucket, rate, capacity, cost, min_level):
+        with self.transaction() as conn:
+            now = time.time()
+            row = conn.execute(
+                "SELECT level, updated FROM buckets WHERE bucket = ?", (bucket,)
+            ).fetchone()
+            level, updated = row if row is not None else (None, now)
+            level = refill(level, updated, rate, capacity, now)
+            wait = 0.0
+            if level < min_level:
+                wait = (min_level - level) / rate
+            else:
+                level -= cost
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (bucket, level, now)
+            )
+        return wait
+
+    def add_usage(self, key, **counts):
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO usage VALUES (?, ?, ?) "
+                "ON CONFLICT (api_key, field) DO UPDATE SET value = value + excluded.value",
+                [(key, name, value) for name, value in counts.items()],
+            )
+
+    def get_usage(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT api_key, field, value FROM usage"
+            ).fetchall()
+        usage = defaultdict(lambda: dict.fromkeys(USAGE_FIELDS, 0))
+        for key, name, value in rows:
+            usage[key][name] = value
+        return dict(usage)
+
+
+RATE_LIMIT_BACKENDS = {
+    "memory": MemoryBackend,
+    "sqlite": SQLiteBackend,
+}
+
+
+def mask_key(key: str) -> str:
+    """
+    Shorten an API key so that it can be shown in metrics.
+    A short hash of the key keeps keys with the same ends apart.
+    """
+    if key.startswith("ip:"):
+        return key
+    digest = hashlib.sha256(key.encode()).hexdigest()[:8]
+    if len(key) <= 8:
+        return key[:2] + "***#" + digest
+    return key[:6] + "***" + key[-2:] + "#" + digest
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        limits: Dict[str, RateLimit],
+        default_limit: Optional[RateLimit] = None,
+        backend: Optional[RateLimitBackend] = None,
+    ):
+        self.limits = limits
+        self.default_limit = default_limit or RateLimit()
+        self.backend = backend or MemoryBackend()
+
+    def get_limit(self, key: str) -> RateLimit:
+        return self.limits.get(key, self.default_limit)
+
+    def check(self, key: str):
+        """Admit a request of a key or raise RateLimitExceeded."""
+        limit = self.get_limit(key)
+        # The token bucket is checked first and without cost, so that a
+        # request rejected by either limit is not charged to the other.
+        tpm = limit.tokens_per_minute
+        if tpm:
+            # Admit while the bucket is positive; the cost is charged later.
+            wait = self.backend.take(f"tokens:{key}", tpm / 60, tpm, 0, 1e-9)
+            if wait:
+                self.backend.add_usage(key, quota_exceeded=1)
+                raise RateLimitExceeded(
+                    ErrorCode.QUOTA_EXCEEDED,
+                    f"Token quota of {tpm:g} tokens per minute reached.",
+                    wait,
+                )
+        rps = limit.requests_per_second
+        if rps:
+            burst = limit.burst or max(1.0, rps)
+            wait = self.backend.take(f"requests:{key}", rps, burst, 1, 1)
+            if wait:
+                self.backend.add_usage(key, rate_limited=1)
+                raise RateLimitExceeded(
+                    ErrorCode.RATE_LIMIT,
+                    f"Rate limit of {rps:g} requests per second reached.",
+                    wait,
+                )
+        self.backend.add_usage(key, requests=1)
+
+    def charge(self, key: str, usage: Optional[dict]):
+        """Record the tokens of a finished response."""
+        if not usage:
+            return
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        total_tokens = usage.get("total_tokens") or prompt_tokens + completion_tokens
+        tpm = self.get_limit(key).tokens_per_minute
+        if tpm and total_tokens:
+            self.backend.take(
+                f"tokens:{key}", tpm / 60, tpm, total_tokens, float("-inf")
+            )
+        self.backend.add_usage(
+            key,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=total_tokens,
+        )
+
+    def get_usage(self) -> Dict[str, Dict[str, int]]:
+        return {mask_key(key): usage for key, usage in self.backend.get_usage().items()}
+
+
+def parse_rate_limits(
+    spec: Optional[str],
+) -> Tuple[Dict[str, RateLimit], Optional[RateLimit]]:
+    """
+    Parse a JSON object mapping API keys to RateLimit fields.
+    The "default" key applies to all other keys. Returns (limits, default).
+    """
+    if not spec:
+        return {}, None
+    limits = {key: RateLimit(**fields) for key, fields in json.loads(spec).items()}
+    return limits, limits.pop("default", None)
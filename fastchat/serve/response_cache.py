@@ -0,0 +1,198 @@
+"""
+An exact-match cache of greedy generations for the API server.
+
+With temperature 0 the output only depends on the model, the rendered prompt
+and the sampling parameters, so a repeated request can be answered from a
+previous result. The key also holds the time the model's workers last
+registered, so results of replaced weights are not served. Results are kept
+in an in-memory LRU bounded by the number of entries, their total size and a
+TTL. An optional SQLite file adds a second tier that is consulted on memory
+misses and survives restarts. Its queries run in threads, off the event loop.
+
+A cached result is the worker output {"text", "finish_reason", "usage"},
+so it can be replayed as a JSON response or as a stream.
+"""
+import asyncio
+from collections import OrderedDict
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from fastchat.serve import serialization
+
+# Generation parameters that can change the output of a greedy request
+KEY_PARAMS = (
+    "model",
+    "prompt",
+    "prompt_token_ids",
+    "temperature",
+    "top_p",
+    "top_k",
+    "max_new_tokens",
+    "stop",
+    "stop_token_ids",
+    "echo",
+    "logprobs",
+)
+# The worker decodes greedily below this temperature
+GREEDY_TEMPERATURE = 1e-5
+
+
+def is_cacheable(gen_params: dict) -> bool:
+    """Whether a request is deterministic and so safe to answer from the cache."""
+    temperature = gen_params.get("temperature")
+    return temperature is not None and temperature < GREEDY_TEMPERATURE
+
+
+def make_cache_key(gen_params: dict, registered_at: Optional[float] = None) -> str:
+    """
+    Key a request by its generation parameters and the registration time of
+    the model's workers, which changes when they are restarted or reloaded.
+    """
+    return hashlib.sha256(
+        serialization.dumps(
+            [registered_at] + [gen_params.get(name) for name in KEY_PARAMS]
+        )
+    ).hexdigest()
+
+
+class DiskTier:
+    """Cached results in a SQLite table, shared by restarts of the server."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Queries run in a thread pool, one at a time.
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, data BLOB NOT NULL)"
+        )
+        self.prune()
+
+    def get(self, key: str):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT expires_at, data FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[0] < time.time():
+            return None
+        return row
+
+    def put(self, key: str, expires_at: float, data: bytes):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                (key, expires_at, data),
+            )
+
+    def prune(self):
+        """Delete expired rows."""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM responses WHERE expires_at < ?", (time.time(),)
+            )
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM responses")
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        max_bytes: int = 256 * 2**20,
+        ttl: float = 3600.0,
+        disk_path: Optional[str] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk = DiskTier(disk_path) if disk_path else None
+        # OrderedDict[key -> (expires_at, serialized result)], oldest use first
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.num_puts = 0
+        self.metrics = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+
+    async def get(self, key: str) -> Optional[dict]:
+        """Return the cached result for a key, or None."""
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] < time.time():
+            self._remove(key)
+            entry = None
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.metrics["memory_hits"] += 1
+            return serialization.loads(entry[1])
+
+        if self.disk is not None:
+            row = await asyncio.to_thread(self.disk.get, key)
+            if row is not None:
+                self._insert(key, row[0], row[1])
+                self.metrics["disk_hits"] += 1
+                return serialization.loads(row[1])
+
+        self.metrics["misses"] += 1
+        return None
+
+    async def put(self, key: str, result: dict):
+        """Cache a successful worker output."""
+        data = serialization.dumps(
+            {
+                "text": result.get("text", ""),
+                "finish_reason": result.get("finish_reason"),
+                "usage": result.get("usage"),
+            }
+        )
+        expires_at = time.time() + self.ttl
+        self._insert(key, expires_at, data)
+        self.metrics["stores"] += 1
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.put, key, expires_at, data)
+            self.num_puts += 1
+            if self.num_puts % 1000 == 0:
+                await asyncio.to_thread(self.disk.prune)
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+        if self.disk is not None:
+            self.disk.clear()
+
+    def _insert(self, key: str, expires_at: float, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        self._remove(key)
+        self.entries[key] = (expires_at, data)
+        self.total_bytes += len(data)
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.metrics["evictions"] += 1
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= len(entry[1])
+
+    def get_metrics(self) -> dict:
+        hits = self.metrics["memory_hits"] + self.metrics["disk_hits"]
+        lookups = hits + self.metrics["misses"]
+        return {
+            **self.metrics,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+        }
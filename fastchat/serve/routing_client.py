@@ -0,0 +1,270 @@
+"""
+A client that streams generations from model workers with retries and hedging.
+
+Streaming calls are retried on the next worker if a worker fails before the
+first chunk arrives. Non-streaming calls can additionally be hedged: if the
+first worker has not produced its first token within a deadline derived from
+the observed p95 time-to-first-token, the same request is sent to a second
+worker and whichever answers first wins; the other request is cancelled.
+"""
+import asyncio
+from collections import defaultdict, deque
+import dataclasses
+import time
+from typing import AsyncGenerator, Dict, List, Optional
+
+import httpx
+
+from fastchat.constants import ErrorCode, SERVER_ERROR_MSG
+from fastchat.serve import serialization
+from fastchat.utils import build_logger
+
+logger = build_logger("routing_client", "routing_client.log")
+
+
+@dataclasses.dataclass
+class RoutingPolicy:
+    # How many other workers to try when a worker fails before its first chunk
+    max_retries: int = 1
+    # Whether to hedge non-streaming calls on a second worker
+    hedge: bool = False
+    # The quantile of the time-to-first-token used as the hedging deadline
+    hedge_quantile: float = 0.95
+    # Bounds of the hedging deadline in seconds. The minimum is also used
+    # until enough latency samples are collected.
+    hedge_min_delay: float = 1.0
+    hedge_max_delay: float = 10.0
+    # Timeout of a worker request in seconds
+    timeout: float = 120.0
+
+    def num_candidates(self):
+        return 1 + max(self.max_retries, 1 if self.hedge else 0)
+
+
+class LatencyTracker:
+    """A sliding window of latency samples with quantile queries."""
+
+    def __init__(self, window: int = 1000, min_samples: int = 20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def add(self, latency: float):
+        self.samples.append(latency)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+async def iter_worker_chunks(response: httpx.Response) -> AsyncGenerator[dict, None]:
+    """Parse the chunks of /worker_generate_stream in the format the worker chose."""
+    buffer = b""
+    content_type = response.headers.get("content-type", "")
+    if content_type.startswith(serialization.MSGPACK_MEDIA_TYPE):
+        async for data in response.aiter_bytes():
+            chunks, buffer = serialization.decode_frames(buffer + data)
+            for chunk in chunks:
+                yield chunk
+        if buffer:
+            raise ValueError("The worker stream ended inside a frame.")
+        return
+
+    async for data in response.aiter_bytes():
+        buffer += data
+        *chunks, buffer = buffer.split(b"\0")
+        for chunk in chunks:
+            if chunk:
+                yield serialization.loads(chunk)
+    if buffer:
+        yield serialization.loads(buffer)
+
+
+class RoutingClient:
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        policies: Optional[Dict[str, RoutingPolicy]] = None,
+        default_policy: Optional[RoutingPolicy] = None,
+    ):
+        self.client = client
+        self.policies = policies or {}
+        self.default_policy = default_policy or RoutingPolicy()
+        # Time-to-first-token per model
+        self.ttft = defaultdict(LatencyTracker)
+        # Counters per endpoint
+        self.metrics = defaultdict(
+            lambda: {
+                "requests": 0,
+                "retries": 0,
+                "hedges": 0,
+                "hedge_wins": 0,
+                "failures": 0,
+            }
+        )
+
+    def get_policy(self, endpoint: str) -> RoutingPolicy:
+        return self.policies.get(endpoint, self.default_policy)
+
+    def get_metrics(self):
+        return {
+            "endpoints": dict(self.metrics),
+            "ttft_p95": {
+                model: tracker.quantile(0.95) for model, tracker in self.ttft.items()
+            },
+        }
+
+    async def _open_stream(self, worker_addr: str, params: Dict, timeout: float):
+        """Send a request and wait for its first chunk."""
+        request = self.client.build_request(
+            "POST",
+            worker_addr + "/worker_generate_stream",
+            json=params,
+            timeout=timeout,
+        )
+        start = time.time()
+        response = await self.client.send(request, stream=True)
+        try:
+            response.raise_for_status()
+            chunks = iter_worker_chunks(response)
+            try:
+                first_chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                raise ValueError("The worker closed the stream without output.")
+        except BaseException:
+            await response.aclose()
+            raise
+        self.ttft[params.get("model")].add(time.time() - start)
+        return response, chunks, first_chunk
+
+    async def stream(
+        self, endpoint: str, worker_addrs: List[str], params: Dict
+    ) -> AsyncGenerator[dict, None]:
+        """
+        Stream chunks from the first worker that answers. Failures before the
+        first chunk are retried on the next worker; later failures end the
+        stream with an error chunk.
+        """
+        policy = self.get_policy(endpoint)
+        metrics = self.metrics[endpoint]
+        metrics["requests"] += 1
+        worker_addrs = worker_addrs[: policy.max_retries + 1]
+
+        opened = None
+        for i, worker_addr in enumerate(worker_addrs):
+            if i > 0:
+                metrics["retries"] += 1
+            try:
+                opened = await self._open_stream(worker_addr, params, policy.timeout)
+                break
+            except (httpx.HTTPError, ValueError) as e:
+                logger.error(f"Worker {worker_addr} failed before the first chunk: {e}")
+
+        if opened is None:
+            metrics["failures"] += 1
+            yield {"text": SERVER_ERROR_MSG, "error_code": ErrorCode.INTERNAL_ERROR}
+            return
+
+        response, chunks, first_chunk = opened
+        try:
+            yield first_chunk
+            async for chunk in chunks:
+                yield chunk
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Error in streaming generation: {e}")
+            metrics["failures"] += 1
+            yield {"text": SERVER_ERROR_MSG, "error_code": ErrorCode.INTERNAL_ERROR}
+        finally:
+            await response.aclose()
+
+    async def _race(self, worker_addrs: List[str], params: Dict, policy, metrics):
+        """Open the primary stream, hedging on the next worker after the deadline."""
+        model = params.get("model")
+        deadline = self.ttft[model].quantile(policy.hedge_quantile)
+        deadline = min(
+            max(deadline or policy.hedge_min_delay, policy.hedge_min_delay),
+            policy.hedge_max_delay,
+        )
+
+        pending_addrs = list(worker_addrs)
+        # Dict[task -> (worker address, whether the task is a hedge)]
+        tasks = {}
+
+        def launch(hedged=False):
+            worker_addr = pending_addrs.pop(0)
+            task = asyncio.create_task(
+                self._open_stream(worker_addr, params, policy.timeout)
+            )
+            tasks[task] = (worker_addr, hedged)
+
+        launch()
+        winner = None
+        try:
+            while tasks and winner is None:
+                hedge_now = policy.hedge and len(tasks) == 1 and pending_addrs
+                done, _ = await asyncio.wait(
+                    tasks.keys(),
+                    timeout=deadline if hedge_now else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    metrics["hedges"] += 1
+                    logger.info(f"Hedging {model} on {pending_addrs[0]}")
+                    launch(hedged=True)
+                    continue
+                for task in done:
+                    worker_addr, hedged = tasks.pop(task)
+                    if task.exception() is None:
+                        if winner is None:
+                            winner = task
+                            if hedged:
+                                metrics["hedge_wins"] += 1
+                        else:
+                            await task.result()[0].aclose()
+                    else:
+                        logger.error(
+                            f"Worker {worker_addr} failed before the first chunk: "
+                            f"{task.exception()}"
+                        )
+                if winner is None and not tasks and pending_addrs:
+                    metrics["retries"] += 1
+                    launch()
+        except BaseException:
+            if winner is not None:
+                await winner.result()[0].aclose()
+            raise
+        finally:
+            # Cancel the losers and wait for them, closing the streams that
+            # opened before the cancellation took effect.
+            for task in tasks:
+                task.cancel()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for result in results:
+                if not isinstance(result, BaseException):
+                    await result[0].aclose()
+        return winner.result() if winner is not None else None
+
+    async def generate(self, endpoint: str, worker_addrs: List[str], params: Dict):
+        """Run a generation to completion and return its final chunk."""
+        policy = self.get_policy(endpoint)
+        metrics = self.metrics[endpoint]
+        metrics["requests"] += 1
+        worker_addrs = worker_addrs[: policy.num_candidates()]
+
+        opened = await self._race(worker_addrs, params, policy, metrics)
+        if opened is None:
+            metrics["failures"] += 1
+            return {"text": SERVER_ERROR_MSG, "error_code": ErrorCode.INTERNAL_ERROR}
+
+        response, chunks, ret = opened
+        try:
+            async for chunk in chunks:
+                ret = chunk
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Error in generation: {e}")
+            metrics["failures"] += 1
+            ret = {"text": SERVER_ERROR_MSG, "error_code": ErrorCode.INTERNAL_ERROR}
+        finally:
+            await response.aclose()
+        return ret
@@ -0,0 +1,149 @@
+"""
+JSON serialization for the streaming hot path.
+
+Every streamed token is serialized by the worker, parsed by its consumer and
+serialized again as an SSE chunk, so these calls run once per token per
+stream. orjson is used when it is installed, with the standard library as
+the fallback. The backend can be forced with FASTCHAT_JSON_BACKEND=json.
+
+Call the functions through the module (serialization.dumps) so that
+set_json_backend takes effect everywhere.
+
+Worker streams can optionally use length-prefixed msgpack frames, see
+encode_stream_chunk.
+"""
+import json
+import os
+from typing import Any, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _orjson_dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def _orjson_loads(data: Union[bytes, str]) -> Any:
+    return orjson.loads(data)
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _json_loads(data: Union[bytes, str]) -> Any:
+    return json.loads(data)
+
+
+JSON_BACKENDS = {"json": (_json_dumps, _json_loads)}
+if orjson is not None:
+    JSON_BACKENDS["orjson"] = (_orjson_dumps, _orjson_loads)
+
+json_backend = None
+dumps = None
+loads = None
+
+
+def set_json_backend(name: str):
+    """Select the serializer used by dumps and loads."""
+    global json_backend, dumps, loads
+    if name not in JSON_BACKENDS:
+        raise ValueError(
+            f"Unknown or unavailable JSON backend: {name}. "
+            f"Available: {list(JSON_BACKENDS)}"
+        )
+    json_backend = name
+    dumps, loads = JSON_BACKENDS[name]
+
+
+set_json_backend(
+    os.getenv("FASTCHAT_JSON_BACKEND", "orjson" if orjson is not None else "json")
+)
+
+
+class ChunkTemplate:
+    """
+    A pre-serialized SSE event with a single string slot.
+
+    The per-stream fields (id, created, model, ...) are serialized once;
+    rendering a chunk only serializes the slot value and concatenates bytes.
+    """
+
+    SLOT = "\0slot\0"
+
+    def __init__(self, obj: Any):
+        """obj is the event payload with ChunkTemplate.SLOT in place of the value."""
+        data = b"data: " + dumps(obj) + b"\n\n"
+        self.prefix, self.suffix = data.split(dumps(self.SLOT))
+
+    def render(self, value: str) -> bytes:
+        return self.prefix + dumps(value) + self.suffix
+
+
+def sse_event(obj: Any) -> bytes:
+    """Serialize one SSE data event."""
+    return b"data: " + dumps(obj) + b"\n\n"
+
+
+SSE_DONE = b"data: [DONE]\n\n"
+
+
+# Binary framing of worker streams.
+#
+# By default /worker_generate_stream sends NUL-delimited JSON objects that
+# repeat the whole output, usage and finish_reason in every chunk. A client
+# can ask for {"stream_format": "msgpack"} instead: the worker then sends
+# length-prefixed msgpack frames that carry only the new text, and usage,
+# finish_reason and logprobs in the last frame. The worker answers with
+# MSGPACK_MEDIA_TYPE only if it supports the format, so clients must check
+# the response content type before parsing.
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+FRAME_HEADER_SIZE = 4
+
+
+def negotiate_stream_format(params: dict) -> str:
+    """Return the stream format a worker should use for a request."""
+    if params.get("stream_format") == "msgpack" and msgpack is not None:
+        return "msgpack"
+    return "json"
+
+
+def encode_stream_chunk(ret: dict, stream_format: str = "json") -> bytes:
+    """Encode one worker output in the negotiated stream format."""
+    if stream_format != "msgpack":
+        return dumps(ret) + b"\0"
+    if ret.get("finish_reason") is None and not ret.get("error_code"):
+        frame = {"text": ret["text"]}
+    else:
+        frame = {k: v for k, v in ret.items() if k != "delta"}
+    payload = msgpack.packb(frame)
+    return len(payload).to_bytes(FRAME_HEADER_SIZE, "big") + payload
+
+
+def decode_frames(buffer: bytes):
+    """
+    Split complete msgpack frames off a buffer.
+    Returns (chunks, rest) where rest is the incomplete tail.
+    """
+    chunks = []
+    pos = 0
+    while len(buffer) - pos >= FRAME_HEADER_SIZE:
+        size = int.from_bytes(buffer[pos : pos + FRAME_HEADER_SIZE], "big")
+        end = pos + FRAME_HEADER_SIZE + size
+        if end > len(buffer):
+            break
+        chunk = msgpack.unpackb(buffer[pos + FRAME_HEADER_SIZE : end])
+        chunk.setdefault("error_code", 0)
+        chunk["delta"] = True
+        chunks.append(chunk)
+        pos = end
+    return chunks, buffer[pos:]
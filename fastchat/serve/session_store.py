@@ -0,0 +1,219 @@
+"""
+A server-side store of the conversations of the Gradio web server.
+
+The Gradio session state only holds a conversation id; the conversation itself
+lives here. Active sessions are kept in memory in LRU order, bounded by the
+number of sessions and their approximate size. Sessions that are evicted or
+idle for a while are spilled to a SQLite file and loaded back when their tab
+sends the next message. Sessions that are not used for SESSION_EXPIRATION_TIME
+seconds are dropped from both tiers.
+"""
+from collections import OrderedDict
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Optional
+
+from fastchat.constants import SESSION_EXPIRATION_TIME
+from fastchat.conversation import Conversation, get_conv_template
+from fastchat.serve import serialization
+from fastchat.utils import build_logger
+
+logger = build_logger("session_store", "session_store.log")
+
+
+def get_conv_size(conv: Conversation) -> int:
+    """Approximate the memory used by the messages of a conversation in bytes."""
+    size = sys.getsizeof(conv.system_message)
+    for _, message in conv.messages:
+        if isinstance(message, str):
+            size += sys.getsizeof(message)
+    return size
+
+
+class Session:
+    def __init__(self, conv: Conversation):
+        self.conv = conv
+        # Rendered chatbot rows and the (user, assistant) messages they show
+        self.chatbot_rows = []
+        self.chatbot_sources = []
+        self.last_access = time.time()
+        # Size when last measured, updated on every access
+        self.size = get_conv_size(conv)
+
+
+class SessionStore:
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        max_bytes: int = 512 * 2**20,
+        ttl: float = SESSION_EXPIRATION_TIME,
+        idle_time: float = 300.0,
+        db_path: Optional[str] = None,
+        sweep_interval: float = 10.0,
+    ):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.idle_time = idle_time
+        self.sweep_interval = sweep_interval
+        # Gradio runs sync handlers in threads and the async ones reach the store
+        # through asyncio.to_thread, so disk I/O here never blocks the event loop.
+        self.lock = threading.Lock()
+        # OrderedDict[conv_id -> Session], least recently used first
+        self.sessions = OrderedDict()
+        self.total_bytes = 0
+        self.last_sweep = time.time()
+        self.metrics = {"created": 0, "spilled": 0, "reloaded": 0, "expired": 0}
+
+        self.conn = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "conv_id TEXT PRIMARY KEY, last_access REAL NOT NULL, data BLOB NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)"
+            )
+
+    def create(self, conv_id: str, conv: Conversation):
+        with self.lock:
+            self._insert(conv_id, Session(conv))
+            self.metrics["created"] += 1
+            self._maybe_sweep()
+
+    def get(self, conv_id: str) -> Optional[Session]:
+        """Return a session, loading it from disk if it was spilled. None if it expired."""
+        with self.lock:
+            now = time.time()
+            session = self.sessions.get(conv_id)
+            if session is not None and session.last_access + self.ttl < now:
+                self._remove(conv_id)
+                self.metrics["expired"] += 1
+                session = None
+            elif session is not None:
+                self.sessions.move_to_end(conv_id)
+                # The conversation may have grown since it was last measured.
+                size = get_conv_size(session.conv)
+                self.total_bytes += size - session.size
+                session.size = size
+                session.last_access = now
+            elif self.conn is not None:
+                session = self._load(conv_id, now)
+            self._maybe_sweep()
+            return session
+
+    def delete(self, conv_id: str):
+        with self.lock:
+            self._remove(conv_id)
+            if self.conn is not None:
+                with self.conn:
+                    self.conn.execute(
+                        "DELETE FROM sessions WHERE conv_id = ?", (conv_id,)
+                    )
+
+    def _insert(self, conv_id: str, session: Session):
+        self._remove(conv_id)
+        self.sessions[conv_id] = session
+        self.total_bytes += session.size
+        while len(self.sessions) > 1 and (
+            len(self.sessions) > self.max_sessions or self.total_bytes > self.max_bytes
+        ):
+            self._spill(next(iter(self.sessions)))
+
+    def _remove(self, conv_id: str) -> Optional[Session]:
+        session = self.sessions.pop(conv_id, None)
+        if session is not None:
+            self.total_bytes -= session.size
+        return session
+
+    def _spill(self, conv_id: str):
+        """Move a session from memory to disk, or drop it if there is no disk tier."""
+        session = self._remove(conv_id)
+        if self.conn is None:
+            logger.info(
+                f"Dropped session {conv_id}. Configure a session db to keep it."
+            )
+            return
+        conv = session.conv
+        data = serialization.dumps(
+            {
+                "template_name": conv.name,
+                "system_message": conv.system_message,
+                "messages": conv.messages,
+                "offset": conv.offset,
+            }
+        )
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                (conv_id, session.last_access, data),
+            )
+        self.metrics["spilled"] += 1
+
+    def _load(self, conv_id: str, now: float) -> Optional[Session]:
+        row = self.conn.execute(
+            "SELECT last_access, data FROM sessions WHERE conv_id = ?", (conv_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        # The memory copy is the live one from now on.
+        with self.conn:
+            self.conn.execute("DELETE FROM sessions WHERE conv_id = ?", (conv_id,))
+        if row[0] + self.ttl < now:
+            self.metrics["expired"] += 1
+            return None
+
+        data = serialization.loads(row[1])
+        conv = get_conv_template(data["template_name"])
+        conv.set_system_message(data["system_message"])
+        conv.messages = data["messages"]
+        conv.offset = data["offset"]
+        session = Session(conv)
+        self._insert(conv_id, session)
+        self.metrics["reloaded"] += 1
+        return session
+
+    def _maybe_sweep(self):
+        """Spill idle sessions and delete expired ones, at most every sweep_interval."""
+        now = time.time()
+        if now - self.last_sweep < self.sweep_interval:
+            return
+        self.last_sweep = now
+
+        # Sessions are in access order, so the idle ones come first.
+        while self.sessions:
+            conv_id, session = next(iter(self.sessions.items()))
+            if session.last_access + self.idle_time >= now:
+                break
+            if session.last_access + self.ttl < now:
+                self._remove(conv_id)
+                self.metrics["expired"] += 1
+            else:
+                self._spill(conv_id)
+
+        if self.conn is not None:
+            with self.conn:
+                cursor = self.conn.execute(
+                    "DELETE FROM sessions WHERE last_access < ?", (now - self.ttl,)
+                )
+            self.metrics["expired"] += cursor.rowcount
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            num_spilled = 0
+            if self.conn is not None:
+                num_spilled = self.conn.execute(
+                    "SELECT COUNT(*) FROM sessions"
+                ).fetchone()[0]
+            return {
+                **self.metrics,
+                "in_memory": len(self.sessions),
+                "bytes": self.total_bytes,
+                "on_disk": num_spilled,
+            }
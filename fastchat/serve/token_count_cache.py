@@ -0,0 +1,64 @@
+"""
+A cache of token counts for the /count_token endpoint of the model worker.
+
+Clients that fit conversations into the context window count the same system
+prompts and history messages on every request. Counts are kept in an LRU
+keyed by a 128-bit hash of the text, so a repeated text costs a hash instead
+of a tokenizer call and the cache does not hold the texts themselves.
+"""
+from collections import OrderedDict
+import hashlib
+import threading
+from typing import List, Optional
+
+# Approximate memory of one entry: the hash, the count and the dict node
+ENTRY_BYTES = 190
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(
+        text.encode("utf-8", "surrogatepass"), digest_size=16
+    ).digest()
+
+
+class TokenCountCache:
+    def __init__(self, max_bytes: int = 16 * 2**20):
+        self.max_entries = max(1, max_bytes // ENTRY_BYTES)
+        # count_token runs on several threads.
+        self.lock = threading.Lock()
+        # OrderedDict[text hash -> token count], least recently used first
+        self.counts = OrderedDict()
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[int]]:
+        """The cached count of each key, or None."""
+        with self.lock:
+            counts = []
+            for key in keys:
+                count = self.counts.get(key)
+                if count is None:
+                    self.metrics["misses"] += 1
+                else:
+                    self.counts.move_to_end(key)
+                    self.metrics["hits"] += 1
+                counts.append(count)
+            return counts
+
+    def put_many(self, keys: List[bytes], counts: List[int]):
+        with self.lock:
+            for key, count in zip(keys, counts):
+                self.counts[key] = count
+                self.counts.move_to_end(key)
+            while len(self.counts) > self.max_entries:
+                self.counts.popitem(last=False)
+                self.metrics["evictions"] += 1
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            lookups = self.metrics["hits"] + self.metrics["misses"]
+            return {
+                **self.metrics,
+                "hit_rate": self.metrics["hits"] / lookups if lookups else 0.0,
+                "entries": len(self.counts),
+                "bytes": len(self.counts) * ENTRY_BYTES,
+            }
@@ -0,0 +1,96 @@
+"""
+A pool of threads that tokenizes text for a model worker.
+
+Requests put their texts on a queue. A pool thread takes queued requests
+until it has max_batch_size texts and encodes them with one tokenizer call.
+Fast tokenizers release the GIL while they encode a batch, so tokenization
+no longer runs inline on the threads that drive the model.
+"""
+import asyncio
+from concurrent.futures import Future
+import queue
+import threading
+from typing import List
+
+
+class TokenizerPool:
+    def __init__(self, tokenizer, num_threads: int = 1, max_batch_size: int = 32):
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        # (texts, future) pairs waiting for a pool thread
+        self.queue = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.metrics = {"requests": 0, "texts": 0, "batches": 0, "errors": 0}
+        self.threads = [
+            threading.Thread(target=self._run, name=f"tokenizer-{i}", daemon=True)
+            for i in range(num_threads)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        """Queue texts for encoding. The future resolves to their token ids."""
+        future = Future()
+        self.queue.put((list(texts), future))
+        return future
+
+    def encode(self, texts: List[str]) -> List[List[int]]:
+        return self.submit(texts).result()
+
+    async def encode_async(self, texts: List[str]) -> List[List[int]]:
+        return await asyncio.wrap_future(self.submit(texts))
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            num_texts = len(batch[0][0])
+            while num_texts < self.max_batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+                num_texts += len(item[0])
+            # Skip the requests whose caller has given up.
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if batch:
+                self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        texts = [text for item_texts, _ in batch for text in item_texts]
+        try:
+            input_ids = self._encode(texts)
+        except Exception:
+            # Encode the requests one by one, so that only a bad one fails.
+            for item_texts, future in batch:
+                try:
+                    future.set_result(self._encode(item_texts))
+                except Exception as e:
+                    future.set_exception(e)
+                    with self.lock:
+                        self.metrics["errors"] += 1
+        else:
+            pos = 0
+            for item_texts, future in batch:
+                future.set_result(input_ids[pos : pos + len(item_texts)])
+                pos += len(item_texts)
+
+        with self.lock:
+            self.metrics["requests"] += len(batch)
+            self.metrics["texts"] += len(texts)
+            self.metrics["batches"] += 1
+
+    def _encode(self, texts: List[str]) -> List[List[int]]:
+        if not texts:
+            return []
+        return self.tokenizer(texts).input_ids
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            batches = self.metrics["batches"]
+            return {
+                **self.metrics,
+                "avg_batch_size": self.metrics["texts"] / batches if batches else 0.0,
+                "queued": self.queue.qsize(),
+                "threads": len(self.threads),
+            }
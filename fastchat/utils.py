@@ -4,6 +4,7 @@ Common utilities.
 from asyncio import AbstractEventLoop
 from io import BytesIO
 import base64
+import importlib
 import json
 import logging
 import logging.handlers
@@ -117,6 +118,27 @@ class StreamToLogger(object):
         self.linebuf = ""
 
 
+class LazyModule:
+    """A module that is imported on first attribute access.
+
+    Lets modules that are also used by the web and API servers refer to torch
+    and transformers without loading them until a model is actually loaded.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
 def disable_torch_init():
     """
     Disable the redundant torch default initialization to accelerate model creation.